@@ -0,0 +1,87 @@
+import argparse
+import os
+import tempfile
+import time
+
+import github_scraper
+from github_scraper import GROWTH_WINDOWS, RepoStore
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def _scan_top(store, languages):
+    """Per-language top N the way it ran before the language index: a full scan each (+ keeps SQLite off the index)."""
+    return [store.conn.execute(
+        "SELECT repo_name, stars FROM repositories WHERE +language = ? ORDER BY stars DESC LIMIT ?",
+        (language, store.top_n)).fetchall() for language in languages]
+
+
+def _indexed_top(store, languages):
+    return [store.conn.execute(
+        "SELECT repo_name, stars FROM repositories WHERE language = ? ORDER BY stars DESC LIMIT ?",
+        (language, store.top_n)).fetchall() for language in languages]
+
+
+def _scan_growth(store, day):
+    """Stars as of today and each window ago by numbering every snapshot row (no per-repo seeks)."""
+    as_of = {}
+    for back in (0,) + GROWTH_WINDOWS:
+        as_of[back] = dict(store.conn.execute("""
+            SELECT repo_id, stars FROM (
+                SELECT repo_id, stars, ROW_NUMBER() OVER (PARTITION BY repo_id ORDER BY day DESC) AS n
+                FROM star_snapshots WHERE day <= ?
+            ) WHERE n = 1
+        """, (day - back,)))
+    return as_of
+
+
+def bench_history(db_name, repos, days):
+    """Top-N per language, growth rates and day lookups: ad-hoc scans vs indexes vs precomputed tables."""
+    rows, fill = _timed(lambda: github_scraper.make_history(db_name, repos, days))
+    store = RepoStore(db_name)
+    languages = [row[0] for row in store.conn.execute("SELECT DISTINCT language FROM repositories")]
+    day = store.conn.execute("SELECT MAX(day) FROM star_snapshots").fetchone()[0]
+
+    scan_top = _timed(lambda: _scan_top(store, languages))[1]
+    indexed_top = _timed(lambda: _indexed_top(store, languages))[1]
+    view_top = _timed(lambda: store.top_by_language())[1]
+
+    scan_growth = _timed(lambda: _scan_growth(store, day))[1]
+    rebuild = _timed(lambda: store.rebuild_views(day))[1]
+    view_growth = _timed(lambda: store.fastest_growing(30, 20))[1]
+    mismatches = store.check_views()
+
+    scan_day = _timed(lambda: store.conn.execute(
+        "SELECT COUNT(*) FROM star_snapshots WHERE +day = ?", (day,)).fetchone())[1]
+    indexed_day = _timed(lambda: store.conn.execute(
+        "SELECT COUNT(*) FROM star_snapshots WHERE day = ?", (day,)).fetchone())[1]
+    history = _timed(lambda: store.star_history("repo-00042"))[1]
+    store.conn.close()
+
+    print(f"{'generate':<16} {fill:>10.2f} s ({rows:,} snapshot rows, {os.path.getsize(db_name) / 2**20:.0f} MiB)")
+    print(f"{'top-N/language':<16} {scan_top * 1000:>10.1f} ms full scans {indexed_top * 1000:>8.1f} ms "
+          f"language index {view_top * 1000:>8.2f} ms precomputed")
+    print(f"{'growth rates':<16} {scan_growth * 1000:>10.1f} ms full scan {rebuild * 1000:>9.1f} ms rebuild "
+          f"{view_growth * 1000:>12.2f} ms precomputed ({len(mismatches)} mismatches)")
+    print(f"{'one day':<16} {scan_day * 1000:>10.1f} ms full scan {indexed_day * 1000:>9.2f} ms day index")
+    print(f"{'one repo':<16} {history * 1000:>10.2f} ms star_history")
+    return scan_top, view_top, scan_growth, rebuild, view_growth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the star-history tables in github_repos.db")
+    parser.add_argument("--repos", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print(f"--- star history: {args.repos} repositories x {args.days} days ---")
+        bench_history(os.path.join(tmpdir, "history.db"), args.repos, args.days)
+
+
+if __name__ == "__main__":
+    main()
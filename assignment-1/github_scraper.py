@@ -0,0 +1,518 @@
+import argparse
+import datetime
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import requests
+from lxml import etree
+
+# データベースファイル名（既存のファイルは削除せず、差分だけを書き込みます）
+DB_NAME = "github_repos.db"
+ORG = "google"
+# スクレイピング対象のURL。page=N でページを指定します
+BASE_URL = "https://github.com/{org}?tab=repositories&q=&type=all&language=&sort=stargazers"
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+RATE = 1.0          # 全ワーカー合わせて1秒に1ページ（元の time.sleep(1) と同じ平均間隔）
+BURST = 1
+MAX_WORKERS = 4
+TIMEOUT = 10
+MAX_PAGES = 1000    # 総ページ数が読めなかったときに順に進む上限
+
+TOP_N = 10                      # 言語ごとに事前計算しておく順位の数
+GROWTH_WINDOWS = (7, 30, 365)   # 増加数を事前計算しておく期間（日）
+_EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+_PARSER = etree.HTMLParser()
+_BOX_ROW = '//li[contains(concat(" ", normalize-space(@class), " "), " Box-row ")]'
+
+
+# assignment-final/weather_scraper.py の TokenBucket と同じものです（課題フォルダはそれぞれ単体で動かすため）
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up."""
+
+    def __init__(self, rate=RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            # 待つ間はロックを放し、他のワーカーも残り時間を計算できるようにします
+            time.sleep(wait)
+
+
+def parse_count(text):
+    """'16,234' -> 16234, '1.2k' -> 1200; None if the text is not a count."""
+    text = text.strip().replace(",", "").lower()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([km]?)", text)
+    if not match:
+        return None
+    value = float(match.group(1)) * {"": 1, "k": 1_000, "m": 1_000_000}[match.group(2)]
+    return int(round(value))
+
+
+def parse_repo_page(html, org=ORG):
+    """
+    Parses one page of an organization's repository list.
+
+    Returns (repos, total_pages): repos are (repo_name, language, stars) tuples
+    (language "N/A" when GitHub shows none, stars None when the count cannot be read),
+    total_pages is None without a pagination bar.
+    """
+    root = etree.fromstring(html, _PARSER)
+    if root is None:
+        return [], None
+
+    repos = []
+    prefix = f"/{org}/"
+    for item in root.xpath(_BOX_ROW):
+        # リポジトリ名のリンク（href="/org/name"）。ピン留め欄やフッターのリンクは Box-row の外にあります
+        links = [a for a in item.iterfind(".//a[@href]")
+                 if a.get("href").startswith(prefix) and "/" not in a.get("href")[len(prefix):]]
+        if not links:
+            continue
+        repo_name = "".join(links[0].itertext()).strip()
+
+        lang_tag = item.find('.//span[@itemprop="programmingLanguage"]')
+        language = "".join(lang_tag.itertext()).strip() if lang_tag is not None else "N/A"
+
+        # スター数は stargazers へのリンクの文字だけから読みます（親要素にはフォーク数なども含まれます）
+        stars = None
+        for a in item.iterfind(".//a[@href]"):
+            if a.get("href") == f"{prefix}{repo_name}/stargazers":
+                stars = parse_count("".join(a.itertext()))
+                break
+        # 読めないスター数を 0 にすると、履歴では本当に減ったように見えてしまいます
+        repos.append((repo_name, language, stars))
+
+    total_pages = None
+    current = root.find('.//em[@data-total-pages]')
+    if current is not None:
+        total_pages = int(current.get("data-total-pages"))
+    return repos, total_pages
+
+
+def to_day(date):
+    """A datetime.date or 'YYYY-MM-DD' -> days since 1970-01-01 (the integer stored in star_snapshots)."""
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    return date.toordinal() - _EPOCH
+
+
+def from_day(day):
+    """Days since 1970-01-01 -> 'YYYY-MM-DD'."""
+    return datetime.date.fromordinal(day + _EPOCH).isoformat()
+
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS repositories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    repo_name TEXT UNIQUE NOT NULL,
+    language TEXT,
+    stars INTEGER
+);
+-- 言語ごとのスター順位は、この索引を範囲で読むだけで求まります
+CREATE INDEX IF NOT EXISTS idx_repositories_language ON repositories (language, stars DESC);
+
+CREATE TABLE IF NOT EXISTS scrape_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    org TEXT NOT NULL,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    pages INTEGER,
+    repos INTEGER,
+    changed INTEGER
+);
+
+-- スター数の履歴（事実表）。スター数が変わった日だけ1行で、列はすべて整数です
+-- day は 1970-01-01 からの日数
+CREATE TABLE IF NOT EXISTS star_snapshots (
+    repo_id INTEGER NOT NULL REFERENCES repositories(id),
+    day INTEGER NOT NULL,
+    stars INTEGER NOT NULL,
+    PRIMARY KEY (repo_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_star_snapshots_day ON star_snapshots (day);
+
+-- 追記専用: 削除はできず、書き換えられるのは各リポジトリの最新日の値だけです（同じ日に再実行した場合）
+CREATE TRIGGER IF NOT EXISTS star_snapshots_no_delete BEFORE DELETE ON star_snapshots
+BEGIN
+    SELECT RAISE(ABORT, 'star_snapshots is append-only');
+END;
+-- 以前の版は全リポジトリで最新の日と比べていたので、作り直します
+DROP TRIGGER IF EXISTS star_snapshots_no_rewrite;
+CREATE TRIGGER star_snapshots_no_rewrite BEFORE UPDATE ON star_snapshots
+WHEN NEW.repo_id != OLD.repo_id OR NEW.day != OLD.day
+    OR OLD.day < (SELECT MAX(day) FROM star_snapshots WHERE repo_id = OLD.repo_id)
+BEGIN
+    SELECT RAISE(ABORT, 'only the latest day of star_snapshots can be corrected');
+END;
+
+-- 事前計算した集計表。実行が終わるたびに rebuild_views で作り直します
+CREATE TABLE IF NOT EXISTS language_top (
+    language TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    repo_id INTEGER NOT NULL,
+    stars INTEGER,
+    PRIMARY KEY (language, rank)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS repo_growth (
+    repo_id INTEGER PRIMARY KEY,
+    day INTEGER NOT NULL,
+    stars INTEGER NOT NULL,
+    {", ".join(f"stars_{n}d INTEGER" for n in GROWTH_WINDOWS)}
+);
+
+CREATE VIEW IF NOT EXISTS top_repos_by_language AS
+SELECT t.language, t.rank, r.repo_name, t.stars
+FROM language_top t JOIN repositories r ON r.id = t.repo_id;
+
+CREATE VIEW IF NOT EXISTS repo_growth_rates AS
+SELECT r.repo_name, r.language, g.day, g.stars,
+    {", ".join(f"g.stars - g.stars_{n}d AS gain_{n}d" for n in GROWTH_WINDOWS)},
+    {", ".join(f"(g.stars - g.stars_{n}d) * 1.0 / NULLIF(g.stars_{n}d, 0) AS growth_{n}d" for n in GROWTH_WINDOWS)}
+FROM repo_growth g JOIN repositories r ON r.id = g.repo_id;
+"""
+
+LANGUAGE_TOP_RECOMPUTE = """
+SELECT language, rank, repo_id, stars FROM (
+    SELECT language, id AS repo_id, stars,
+        ROW_NUMBER() OVER (PARTITION BY language ORDER BY stars DESC, repo_name) AS rank
+    FROM repositories
+) WHERE rank <= :top_n
+"""
+
+# ある日の時点のスター数 = その日以前で最後の行。主キー (repo_id, day) を1回たどるだけです
+_STARS_AS_OF = "(SELECT s.stars FROM star_snapshots s WHERE s.repo_id = r.id AND s.day <= {} ORDER BY s.day DESC LIMIT 1)"
+GROWTH_RECOMPUTE = f"""
+SELECT * FROM (
+    SELECT r.id AS repo_id, :day AS day, {_STARS_AS_OF.format(":day")} AS stars,
+        {", ".join(f"{_STARS_AS_OF.format(f':day - {n}')} AS stars_{n}d" for n in GROWTH_WINDOWS)}
+    FROM repositories r
+) WHERE stars IS NOT NULL
+"""
+
+
+class RepoStore:
+    """
+    repositories keeps the latest state of each repository (the dimension) and
+    star_snapshots gets a row only on days a repository is new or its star count
+    changed. language_top and repo_growth are rebuilt after each run.
+    """
+
+    def __init__(self, db_name=DB_NAME, top_n=TOP_N):
+        self.conn = sqlite3.connect(db_name)
+        self.top_n = top_n
+        self._create_tables()
+        self.current = None     # repo_name -> (language, stars)。最初の保存時に1回だけ読み込みます
+
+    def _create_tables(self):
+        self.conn.executescript(SCHEMA)
+        # 以前の実行単位の履歴表 star_history(repo_id, run_id, stars) があれば日単位に移します
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'star_history'").fetchone():
+            with self.conn:
+                self.conn.execute("""
+                    INSERT INTO star_snapshots (repo_id, day, stars)
+                    SELECT h.repo_id, CAST(julianday(date(r.started_at)) - 2440587.5 AS INTEGER), h.stars
+                    FROM star_history h JOIN scrape_runs r ON r.id = h.run_id
+                    ORDER BY h.run_id
+                    ON CONFLICT (repo_id, day) DO UPDATE SET stars = excluded.stars
+                """)
+                self.conn.execute("DROP TABLE star_history")
+            self.rebuild_views()
+        self.conn.commit()
+
+    def start_run(self, org):
+        cursor = self.conn.execute("INSERT INTO scrape_runs (org) VALUES (?)", (org,))
+        self.conn.commit()
+        return cursor.lastrowid
+
+    def finish_run(self, run_id, pages, repos, changed, day=None):
+        self.conn.execute(
+            "UPDATE scrape_runs SET finished_at = CURRENT_TIMESTAMP, pages = ?, repos = ?, changed = ? WHERE id = ?",
+            (pages, repos, changed, run_id))
+        self.conn.commit()
+        self.rebuild_views(day)
+
+    def save_page(self, repos, day=None):
+        """
+        Upserts only the new or changed repositories of one page (executemany, one
+        transaction) and appends their stars to star_snapshots for `day` (today by
+        default). Returns how many changed.
+        """
+        day = to_day(datetime.date.today()) if day is None else day
+        if self.current is None:
+            self.current = {name: (language, stars) for name, language, stars in
+                            self.conn.execute("SELECT repo_name, language, stars FROM repositories")}
+        # スター数が読めなかったリポジトリは、保存済みの値のままにします（新しいものは NULL）
+        repos = [(name, language, self.current[name][1] if stars is None and name in self.current else stars)
+                 for name, language, stars in repos]
+        changed = [(name, language, stars) for name, language, stars in repos
+                   if self.current.get(name) != (language, stars)]
+        if not changed:
+            return 0
+
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO repositories (repo_name, language, stars) VALUES (?, ?, ?)
+                ON CONFLICT (repo_name) DO UPDATE SET language = excluded.language, stars = excluded.stars
+            """, changed)
+            # 言語だけが変わった場合は履歴に残しません（スター数の履歴です）。
+            # 過去の日付で実行した場合、すでにある古い行は書き換えずに残します
+            starred = [(day, name) for name, _, stars in changed
+                       if stars is not None and (name not in self.current or self.current[name][1] != stars)]
+            self.conn.executemany("""
+                INSERT INTO star_snapshots (repo_id, day, stars)
+                SELECT id, ?, stars FROM repositories WHERE repo_name = ?
+                ON CONFLICT (repo_id, day) DO UPDATE SET stars = excluded.stars
+                WHERE day = (SELECT MAX(s.day) FROM star_snapshots s WHERE s.repo_id = star_snapshots.repo_id)
+            """, starred)
+        for name, language, stars in changed:
+            self.current[name] = (language, stars)
+        return len(changed)
+
+    def rebuild_views(self, day=None):
+        """Recomputes language_top and repo_growth as of `day` (the latest snapshot day by default)."""
+        if day is None:
+            day = self.conn.execute("SELECT MAX(day) FROM star_snapshots").fetchone()[0]
+        with self.conn:
+            self.conn.execute("DELETE FROM language_top")
+            self.conn.execute("INSERT INTO language_top " + LANGUAGE_TOP_RECOMPUTE, {"top_n": self.top_n})
+            self.conn.execute("DELETE FROM repo_growth")
+            if day is not None:
+                self.conn.execute("INSERT INTO repo_growth " + GROWTH_RECOMPUTE, {"day": day})
+
+    def check_views(self):
+        """Compares language_top and repo_growth with a full recompute; returns the keys that differ."""
+        mismatches = []
+        stored = {row[:2]: row[2:] for row in self.conn.execute("SELECT * FROM language_top")}
+        fresh = {row[:2]: row[2:] for row in self.conn.execute(LANGUAGE_TOP_RECOMPUTE, {"top_n": self.top_n})}
+        mismatches += sorted(key for key in stored.keys() | fresh.keys() if stored.get(key) != fresh.get(key))
+
+        stored = {row[0]: row[1:] for row in self.conn.execute("SELECT * FROM repo_growth")}
+        day = next(iter(stored.values()))[0] if stored else \
+            self.conn.execute("SELECT MAX(day) FROM star_snapshots").fetchone()[0]
+        fresh = {row[0]: row[1:] for row in self.conn.execute(GROWTH_RECOMPUTE, {"day": day})}
+        mismatches += sorted(key for key in stored.keys() | fresh.keys() if stored.get(key) != fresh.get(key))
+        return mismatches
+
+    def star_history(self, repo_name):
+        """('YYYY-MM-DD', stars) for each day `repo_name`'s star count changed."""
+        rows = self.conn.execute("""
+            SELECT s.day, s.stars
+            FROM star_snapshots s JOIN repositories r ON r.id = s.repo_id
+            WHERE r.repo_name = ?
+            ORDER BY s.day
+        """, (repo_name,)).fetchall()
+        return [(from_day(day), stars) for day, stars in rows]
+
+    def top_by_language(self, language=None):
+        """(language, rank, repo_name, stars) from the precomputed top-N, for one or all languages."""
+        query = "SELECT language, rank, repo_name, stars FROM top_repos_by_language"
+        if language is not None:
+            return self.conn.execute(query + " WHERE language = ? ORDER BY rank", (language,)).fetchall()
+        return self.conn.execute(query + " ORDER BY language, rank").fetchall()
+
+    def fastest_growing(self, window=30, limit=10, language=None):
+        """
+        (repo_name, language, stars, gain, growth) for the largest star gains over `window`
+        days. Raises ValueError unless `window` is one of GROWTH_WINDOWS.
+        """
+        if window not in GROWTH_WINDOWS:
+            raise ValueError(f"window must be one of {GROWTH_WINDOWS}, got {window!r}")
+        query = f"SELECT repo_name, language, stars, gain_{window}d, growth_{window}d FROM repo_growth_rates"
+        params = []
+        if language is not None:
+            query += " WHERE language = ?"
+            params.append(language)
+        query += f" ORDER BY gain_{window}d DESC, repo_name LIMIT ?"
+        return self.conn.execute(query, params + [limit]).fetchall()
+
+
+class GitHubScraper:
+    """
+    Fetches repository list pages through a shared TokenBucket.
+
+    `fetch_page(org, page)` returns the page's HTML; the default downloads it from
+    BASE_URL. Pass a different one to read saved fixtures instead.
+    """
+
+    def __init__(self, limiter=None, fetch_page=None):
+        self.limiter = limiter or TokenBucket()
+        self.fetch_page = fetch_page or self._download
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+
+    def _download(self, org, page):
+        url = BASE_URL.format(org=org)
+        if page > 1:
+            url += f"&page={page}"
+        response = self.session.get(url, timeout=TIMEOUT)
+        response.raise_for_status()
+        return response.text
+
+    def fetch_repos(self, org, page):
+        """Returns (repos, total_pages) for one page, or None if it could not be fetched or parsed."""
+        print(f"--- 🌐 ページ {page} をスクレイピング中 ---")
+        try:
+            self.limiter.acquire() # サーバ負荷配慮（全ワーカー共通の上限）
+            return parse_repo_page(self.fetch_page(org, page), org)
+        except Exception as e:
+            # ここでのエラーは全体を止めないように表示だけする
+            print(f"警告: ページ {page} の取得中に問題が発生しました ({e})")
+            return None
+
+
+def refresh(store, scraper, org=ORG, max_workers=MAX_WORKERS, max_pages=MAX_PAGES, day=None):
+    """
+    Scrapes every page of `org` and writes only what changed since the last run,
+    recording star changes under `day` (today by default, see to_day).
+
+    Page 1 gives the total page count; pages 2..N are then fetched by a worker pool
+    while rows are written on this thread only. Without a page count it walks pages in
+    order until one is short or repeats repositories already seen.
+    Returns {"pages", "repos", "changed", "failed"}.
+    """
+    day = to_day(datetime.date.today()) if day is None else day
+    run_id = store.start_run(org)
+    seen = set()
+    pages = changed = failed = 0
+
+    def save(repos):
+        nonlocal pages, changed, failed
+        # 並び順が取得中に変わると同じリポジトリが2ページに出ることがあるので、先に見た方を使います
+        fresh = [repo for repo in repos if repo[0] not in seen]
+        seen.update(name for name, _, _ in fresh)
+        try:
+            changed += store.save_page(fresh, day)
+        except sqlite3.IntegrityError as e:
+            # 追記専用のトリガーに止められたページは書き込まず、失敗として数えます
+            print(f"Error saving page: {e}")
+            failed += 1
+            return fresh
+        pages += 1
+        return fresh
+
+    first = scraper.fetch_repos(org, 1)
+    if first is None:
+        failed = 1
+    else:
+        repos, total_pages = first
+        save(repos)
+        if total_pages:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {pool.submit(scraper.fetch_repos, org, page): page
+                           for page in range(2, min(total_pages, max_pages) + 1)}
+                for future in as_completed(futures):
+                    result = future.result()
+                    if result is None:
+                        failed += 1
+                    else:
+                        save(result[0])
+        else:
+            page = 1
+            while len(repos) >= 10 and page < max_pages:
+                page += 1
+                result = scraper.fetch_repos(org, page)
+                if result is None:
+                    failed += 1
+                    break
+                repos = result[0]
+                if not save(repos):
+                    break
+
+    store.finish_run(run_id, pages, len(seen), changed, day)
+    return {"pages": pages, "repos": len(seen), "changed": changed, "failed": failed}
+
+
+def make_history(db_name, repos=5000, days=3 * 365, end=None, seed=0):
+    """
+    Fills repositories and star_snapshots with synthetic daily star counts for `days`
+    days up to `end` (today by default), then rebuilds the views. Returns the snapshot row count.
+    """
+    rng = np.random.default_rng(seed)
+    languages = np.array(["C", "C++", "Go", "Java", "JavaScript", "Kotlin", "N/A", "Python", "Rust", "Shell", "TypeScript"])
+    language = languages[rng.integers(0, len(languages), repos)]
+    # 少数の人気リポジトリが毎日伸び、大半はたまにしか増えない分布です
+    start = rng.lognormal(6, 1.5, repos).astype(np.int64)
+    rate = rng.lognormal(-1.5, 1.5, repos)
+    gains = rng.poisson(rate, (days, repos))
+    gains[0] = 0
+    stars = start + np.cumsum(gains, axis=0)
+
+    # 初日と、スター数が増えた日だけを (repo_id, day) の順に書き込みます
+    changed = gains > 0
+    changed[0] = True
+    repo_index, day_index = np.nonzero(changed.T)
+    first_day = to_day(end or datetime.date.today()) - days + 1
+
+    store = RepoStore(db_name)
+    with store.conn:
+        store.conn.executemany(
+            "INSERT INTO repositories (id, repo_name, language, stars) VALUES (?, ?, ?, ?)",
+            zip(range(1, repos + 1), (f"repo-{i:05d}" for i in range(repos)), language.tolist(), stars[-1].tolist()))
+        store.conn.executemany(
+            "INSERT INTO star_snapshots (repo_id, day, stars) VALUES (?, ?, ?)",
+            zip((repo_index + 1).tolist(), (day_index + first_day).tolist(), stars[day_index, repo_index].tolist()))
+    store.rebuild_views()
+    store.conn.close()
+    return len(repo_index)
+
+
+def display_data(store, limit=None):
+    """保存されたデータをSELECT文で表示します。"""
+    query = "SELECT repo_name, language, stars FROM repositories ORDER BY stars DESC"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    rows = store.conn.execute(query).fetchall()
+    if not rows:
+        print("データがありません。")
+        return
+
+    print(f"{'No.':<4} | {'リポジトリ名':<40} | {'主要な言語':<20} | {'スターの数':>10}")
+    print("-" * 80)
+    for i, (repo_name, language, stars) in enumerate(rows):
+        print(f"{i+1:<4} | {repo_name:<40} | {language or 'N/A':<20} | "
+              f"{format(stars, ',') if stars is not None else 'N/A':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrapes an organization's GitHub repositories into SQLite")
+    parser.add_argument("--org", default=ORG)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="max pages per second")
+    parser.add_argument("--max-pages", type=int, default=MAX_PAGES)
+    parser.add_argument("--show", type=int, default=20, help="rows to display afterwards (0 for all)")
+    args = parser.parse_args()
+
+    store = RepoStore(args.db)
+    scraper = GitHubScraper(TokenBucket(rate=args.rate))
+    result = refresh(store, scraper, args.org, args.workers, args.max_pages)
+    print(f"\n{result['pages']} ページ / {result['repos']} 件のリポジトリ、"
+          f"変更 {result['changed']} 件、失敗 {result['failed']} ページ")
+    display_data(store, args.show or None)
+    store.conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from github_scraper import GitHubScraper, RepoStore, TokenBucket, from_day, parse_repo_page, refresh, to_day
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(HERE, "fixtures")
+DB_NAME = os.path.join(HERE, "github_repos.db")
+DAY = to_day("2026-01-05")
+
+
+def read_fixture(org, page):
+    with open(os.path.join(FIXTURE_DIR, f"{org}_repos_page{page}.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+class FixturePages:
+    """fetch_page stand-in that counts calls, can fail chosen pages and rewrite page text."""
+
+    def __init__(self, fail=(), replace=()):
+        self.fail = set(fail)
+        self.replace = list(replace)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, org, page):
+        with self.lock:
+            self.calls += 1
+        if page in self.fail:
+            raise ConnectionError("simulated network failure")
+        html = read_fixture(org, page)
+        for old, new in self.replace:
+            html = html.replace(old, new)
+        return html
+
+
+def history_count(store):
+    return store.conn.execute("SELECT COUNT(*) FROM star_snapshots").fetchone()[0]
+
+
+def test_parse():
+    print("Testing fixture parsing...")
+    repos = []
+    for page in (1, 2, 3):
+        rows, total_pages = parse_repo_page(read_fixture("google", page), "google")
+        repos += rows
+        if total_pages != 3:
+            print(f"FAIL: Expected 3 pages, page {page} says {total_pages}")
+            return False
+    names = [name for name, _, _ in repos]
+    # ピン留め欄のリンクやフッターの /google/.github は数えません
+    if len(repos) != 24 or len(set(names)) != 24 or ".github" in names:
+        print(f"FAIL: Expected 24 distinct repositories, got {names}")
+        return False
+
+    repos = {name: (language, stars) for name, language, stars in repos}
+    expected = {"gvisor": ("Go", 15987), "compile-testing": ("Java", 1200),
+                "safe-mmio": ("N/A", 12), "percore": ("Rust", 0)}
+    for name, value in expected.items():
+        if repos[name] != value:
+            print(f"FAIL: {name} parsed as {repos[name]}, expected {value}")
+            return False
+    if sum(stars == 0 for _, stars in repos.values()) != 1:
+        print("FAIL: Only percore has 0 stars")
+        return False
+    print(f"SUCCESS: Parsed {len(repos)} repositories over 3 pages")
+    return True
+
+
+def test_token_bucket():
+    print("Testing shared token bucket...")
+    bucket = TokenBucket(rate=20, capacity=1)
+
+    def worker():
+        for _ in range(5):
+            bucket.acquire()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    begin = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - begin
+
+    # 20回 / 20 per sec で、最初の1回を除き約0.95秒かかるはずです
+    if elapsed < 0.9:
+        print(f"FAIL: 20 acquisitions took only {elapsed:.2f}s")
+        return False
+    print(f"SUCCESS: 20 acquisitions across 4 workers took {elapsed:.2f}s")
+    return True
+
+
+def test_refresh(db_path):
+    print("Testing incremental refresh...")
+    fast = TokenBucket(rate=1000, capacity=10)
+    store = RepoStore(db_path)
+
+    # 1回目: 3ページ目だけ失敗させます
+    result = refresh(store, GitHubScraper(fast, FixturePages(fail={3})), "google", day=DAY)
+    if result != {"pages": 2, "repos": 20, "changed": 20, "failed": 1} or history_count(store) != 20:
+        print(f"FAIL: First run gave {result}, {history_count(store)} history rows")
+        return False
+
+    # 2回目（同じ日）: 変更なし。新しく取れた3ページ目の4件だけが書き込まれるはずです
+    result = refresh(store, GitHubScraper(fast, FixturePages()), "google", day=DAY)
+    if result["changed"] != 4 or result["repos"] != 24 or history_count(store) != 24:
+        print(f"FAIL: Second run gave {result}, {history_count(store)} history rows")
+        return False
+
+    # 3回目（翌日）: 2件のスター数だけが変わったページ
+    pages = FixturePages(replace=[("15,987", "16,002"), ("1.2k", "1.3k")])
+    result = refresh(store, GitHubScraper(fast, pages), "google", day=DAY + 1)
+    if result["changed"] != 2 or history_count(store) != 26:
+        print(f"FAIL: Third run gave {result}, {history_count(store)} history rows")
+        return False
+    history = store.star_history("gvisor")
+    if history != [("2026-01-05", 15987), ("2026-01-06", 16002)]:
+        print(f"FAIL: gvisor history is {history}")
+        return False
+
+    # 4回目: 何も変わらなければ何も書き込みません
+    result = refresh(store, GitHubScraper(fast, pages), "google", day=DAY + 1)
+    runs = store.conn.execute("SELECT COUNT(*) FROM scrape_runs WHERE finished_at IS NOT NULL").fetchone()[0]
+    if result["changed"] != 0 or history_count(store) != 26 or runs != 4:
+        print(f"FAIL: Unchanged run gave {result}, {history_count(store)} history rows, {runs} runs")
+        return False
+
+    # 5回目: スター数が読めないページ。0 として記録せず、保存済みの値を残します
+    pages = FixturePages(replace=[("15,987", "n/a"), ("1.2k", "1.3k")])
+    result = refresh(store, GitHubScraper(fast, pages), "google", day=DAY + 2)
+    stars = store.conn.execute("SELECT stars FROM repositories WHERE repo_name = 'gvisor'").fetchone()[0]
+    if result["changed"] != 0 or history_count(store) != 26 or stars != 16002:
+        print(f"FAIL: Unreadable count gave {result}, {history_count(store)} history rows, gvisor {stars}")
+        return False
+    try:
+        store.fastest_growing(5)
+    except ValueError:
+        pass
+    else:
+        print("FAIL: fastest_growing accepted a 5 day window")
+        return False
+    print(f"SUCCESS: 5 runs, {history_count(store)} history rows")
+    return True
+
+
+def test_history(db_path):
+    print("Testing star history views...")
+    fast = TokenBucket(rate=1000, capacity=10)
+    store = RepoStore(db_path, top_n=3)
+    refresh(store, GitHubScraper(fast, FixturePages()), "google", day=DAY)
+    refresh(store, GitHubScraper(fast, FixturePages(replace=[("15,987", "16,100")])), "google", day=DAY + 7)
+    refresh(store, GitHubScraper(fast, FixturePages(replace=[("15,987", "16,400"), ("3,690", "3,700")])),
+            "google", day=DAY + 30)
+
+    # 追記専用: 過去の行は消せず、書き換えもできません
+    for statement in ("DELETE FROM star_snapshots", f"UPDATE star_snapshots SET stars = 0 WHERE day = {DAY}"):
+        try:
+            store.conn.execute(statement)
+        except sqlite3.DatabaseError:
+            store.conn.rollback()
+        else:
+            print(f"FAIL: '{statement}' was allowed")
+            return False
+
+    top = [name for _, _, name, _ in store.top_by_language("C++")]
+    if top != ["flatbuffers", "or-tools", "perfetto"]:
+        print(f"FAIL: Top C++ repositories are {top}")
+        return False
+    growth = {row[0]: row[1:] for row in store.conn.execute(
+        "SELECT repo_name, gain_7d, gain_30d, gain_365d FROM repo_growth_rates")}
+    if growth["gvisor"] != (300, 413, None) or growth["angle"] != (10, 10, None) or growth["percore"] != (0, 0, None):
+        print(f"FAIL: Growth is {growth['gvisor']}, {growth['angle']}, {growth['percore']}")
+        return False
+    fastest = store.fastest_growing(30, limit=2)
+    if [row[0] for row in fastest] != ["gvisor", "angle"] or store.check_views():
+        print(f"FAIL: Fastest growing {fastest}, view mismatches {store.check_views()}")
+        return False
+
+    # 言語と日付の検索は索引を使うはずです
+    plans = [str(store.conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()) for query, params in [
+        ("SELECT repo_name FROM repositories WHERE language = ? ORDER BY stars DESC LIMIT 10", ("Go",)),
+        ("SELECT repo_id, stars FROM star_snapshots WHERE day BETWEEN ? AND ?", (DAY, DAY + 7)),
+    ]]
+    if "idx_repositories_language" not in plans[0] or "idx_star_snapshots_day" not in plans[1]:
+        print(f"FAIL: Query plans {plans}")
+        return False
+
+    # 最新日の判定はリポジトリごとです（percore の最新日は DAY のままなので直せます）
+    store.conn.execute("UPDATE star_snapshots SET stars = 1 WHERE day = ? AND repo_id = "
+                       "(SELECT id FROM repositories WHERE repo_name = 'percore')", (DAY,))
+    store.conn.rollback()
+    # 過去の日付での再実行はエラーにならず、その日の既存の行も書き換えません
+    result = refresh(store, GitHubScraper(fast, FixturePages(replace=[("15,987", "16,200")])), "google", day=DAY + 7)
+    history = store.star_history("gvisor")
+    if result["failed"] or history[1] != ("2026-01-12", 16100) or history[-1] != ("2026-02-04", 16400):
+        print(f"FAIL: Backdated run gave {result}, gvisor history {history}")
+        return False
+    print(f"SUCCESS: Snapshots are append-only, views match a recompute as of {from_day(DAY + 30)}")
+    return True
+
+
+def test_existing_db(db_path):
+    print("Testing that the existing database is kept...")
+    shutil.copy(DB_NAME, db_path)
+    conn = sqlite3.connect(db_path)
+    before = dict(conn.execute("SELECT repo_name, id FROM repositories"))
+    conn.close()
+
+    store = RepoStore(db_path)
+    refresh(store, GitHubScraper(TokenBucket(rate=1000, capacity=10), FixturePages()), "google", day=DAY)
+    after = dict(store.conn.execute("SELECT repo_name, id FROM repositories"))
+    # 以前の行は削除されず、id も変わらないはずです
+    if any(after.get(name) != repo_id for name, repo_id in before.items()):
+        print("FAIL: Existing rows were removed or renumbered")
+        return False
+    print(f"SUCCESS: Kept {len(before)} existing rows, {len(after)} repositories now")
+    return True
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ok = (test_parse() and test_token_bucket()
+              and test_refresh(os.path.join(tmpdir, "repos.db"))
+              and test_history(os.path.join(tmpdir, "history.db"))
+              and test_existing_db(os.path.join(tmpdir, "existing.db")))
+
+    if ok:
+        print("\nALL TESTS PASSED")
+    else:
+        print("\nTESTS FAILED")
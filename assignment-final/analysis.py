@@ -0,0 +1,120 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+RAIN = "降水あり"
+DRY = "降水なし"
+DAILY_COLUMNS = ("city", "date", "max_temp", "min_temp", "precip", "temp_diff")
+
+
+def load_daily(db_name="weather_hypothesis.db", cities=None, start=None, end=None, columns=None):
+    """
+    Loads daily_weather once into typed columns: DatetimeIndex `date`, categorical
+    `city`, float64 values (NULL -> NaN). Filters are bound as SQL parameters.
+    With `columns` only those are read (city and date are always used for the order).
+
+    `db_name` may also be a directory written by `columnar.py daily_weather`; it is
+    then read memory-mapped with the filters pushed down to the Parquet/Arrow files.
+    """
+    columns = list(columns or DAILY_COLUMNS)
+    unknown = set(columns) - set(DAILY_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown daily_weather columns: {sorted(unknown)}")
+    if os.path.isdir(db_name):
+        from columnar import read_daily
+        return read_daily(db_name, columns=columns, cities=cities, start=start, end=end)
+
+    query = f"SELECT {', '.join(dict.fromkeys(['city', 'date', *columns]))} FROM daily_weather"
+    conditions, params = [], []
+    if cities:
+        conditions.append(f"city IN ({','.join('?' for _ in cities)})")
+        params.extend(cities)
+    if start:
+        conditions.append("date >= ?")
+        params.append(start)
+    if end:
+        conditions.append("date <= ?")
+        params.append(end)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY city, date"
+
+    conn = sqlite3.connect(db_name)
+    try:
+        df = pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+    df = typed(df)
+    return df[[name for name in columns if name != "date"]]
+
+
+def typed(df):
+    """Converts a daily_weather frame to the dtypes the functions below expect."""
+    dtypes = {"city": "category", "max_temp": "float64", "min_temp": "float64",
+              "precip": "float64", "temp_diff": "float64"}
+    df = df.astype({name: dtype for name, dtype in dtypes.items() if name in df})
+    df["date"] = pd.to_datetime(df["date"])
+    return df.set_index("date")
+
+
+def rankings(df, n=10):
+    """
+    Returns (top, bottom): each city's n largest and n smallest temp_diff days.
+    One sort for all cities instead of two sorts per city.
+    """
+    ranked = df.dropna(subset=["temp_diff"]).sort_values(["city", "temp_diff"], ascending=[True, False])
+    grouped = ranked.groupby("city", observed=True)
+    top = grouped.head(n)
+    bottom = grouped.tail(n).iloc[::-1].sort_values("city", kind="stable")
+    return top, bottom
+
+
+def condition_stats(df):
+    """
+    Diurnal-range statistics per city and precipitation condition
+    (days, avg_diff, std_diff), in one grouped pass.
+    """
+    valid = df.dropna(subset=["temp_diff"])
+    # 「--」（該当現象なし）の NULL は降水なしとして扱います
+    condition = pd.Series(
+        pd.Categorical(np.where(valid["precip"].fillna(0).to_numpy() > 0, RAIN, DRY), categories=[RAIN, DRY]),
+        index=valid.index, name="condition")
+    stats = (valid.groupby([valid["city"], condition], observed=True)["temp_diff"]
+             .agg(days="count", avg_diff="mean", std_diff="std")
+             .reset_index())
+    return stats
+
+
+def welch_t(stats):
+    """
+    Welch's t statistic (dry minus rain) per city from condition_stats output.
+    t is NaN for a city with fewer than 2 days in either condition.
+    """
+    values = ["days", "avg_diff", "std_diff"]
+    wide = stats.pivot(index="city", columns="condition", values=values)
+    # 雨の日（または晴れの日）が1日もない都市は列がないので、NaN の列を足しておきます
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([values, [DRY, RAIN]]))
+    n1, n2 = wide[("days", DRY)], wide[("days", RAIN)]
+    m1, m2 = wide[("avg_diff", DRY)], wide[("avg_diff", RAIN)]
+    v1, v2 = wide[("std_diff", DRY)] ** 2, wide[("std_diff", RAIN)] ** 2
+    se = np.sqrt(v1 / n1 + v2 / n2)
+    t = ((m1 - m2) / se).where((n1 >= 2) & (n2 >= 2))
+    return pd.DataFrame({"diff": m1 - m2, "t": t}).reset_index()
+
+
+def rolling_stats(df, window=7):
+    """Per-city rolling mean/std of temp_diff over `window` days, in one grouped pass."""
+    rolled = (df.groupby("city", observed=True)["temp_diff"]
+              .rolling(f"{window}D", min_periods=1)
+              .agg(["mean", "std"]))
+    return rolled.rename(columns={"mean": "rolling_mean", "std": "rolling_std"})
+
+
+def wide_temp_diff(df, cities=None):
+    """date x city table of temp_diff for plotting (one pivot instead of a filter per city)."""
+    wide = df.pivot_table(index=df.index, columns="city", values="temp_diff", observed=True)
+    if cities:
+        wide = wide[[c for c in cities if c in wide.columns]]
+    return wide
@@ -0,0 +1,394 @@
+import argparse
+import glob
+import io
+import json
+import os
+import re
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import bus_analysis
+import bus_stream
+import columnar
+import fake_gtfs
+from daily_parser import parse_daily_page
+from weather_scraper import WeatherAnalysis
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def _legacy_clean_val(val):
+    """The old per-cell cleaner: regex per value, missing markers become 0.0."""
+    if pd.isna(val): return 0.0
+    s_val = str(val).strip()
+    if s_val in ['--', '///', '']: return 0.0
+
+    res = re.sub(r'[^\d\.\-]', '', s_val)
+    try:
+        return float(res)
+    except ValueError:
+        return 0.0
+
+
+def _legacy_parse_month(html, city_name, year, month):
+    """The old fetch_month parsing: pd.read_html, substring column search, df.iloc per row."""
+    df = pd.read_html(io.StringIO(html))[0]
+    cols = [str(c) for c in df.columns]
+
+    idx_max = idx_min = idx_pre = -1
+    for i, col_name in enumerate(cols):
+        if '最高' in col_name and '気温' in col_name:
+            idx_max = i
+        if '最低' in col_name and '気温' in col_name:
+            idx_min = i
+        if '降水量' in col_name and '合計' in col_name:
+            idx_pre = i
+    if idx_max == -1: idx_max = next((i for i, c in enumerate(cols) if '最高' in c), 7)
+    if idx_min == -1: idx_min = next((i for i, c in enumerate(cols) if '最低' in c), 8)
+    if idx_pre == -1: idx_pre = 3
+
+    results = []
+    for i in range(len(df)):
+        row = df.iloc[i]
+        day_str = str(row.iloc[0])
+        if day_str.isdigit():
+            date_str = f"{year}-{month:02d}-{int(day_str):02d}"
+            precip = _legacy_clean_val(row.iloc[idx_pre])
+            max_t = _legacy_clean_val(row.iloc[idx_max])
+            min_t = _legacy_clean_val(row.iloc[idx_min])
+            results.append((city_name, date_str, max_t, min_t, precip, round(max_t - min_t, 1)))
+    return results
+
+
+def _load_fixtures():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "daily_s1_*.html"))):
+        # daily_s1_{block_no}_{YYYYMM}.html
+        stamp = os.path.basename(path).rsplit("_", 1)[1][:6]
+        with open(path, encoding="utf-8") as f:
+            pages.append((f.read(), int(stamp[:4]), int(stamp[4:])))
+    return pages
+
+
+def bench_parse(rounds):
+    """Pages per second: pd.read_html path vs the lxml daily_s1 parser, on the saved fixtures."""
+    pages = _load_fixtures()
+    results = []
+    for label, parse in (("read_html", _legacy_parse_month), ("lxml", parse_daily_page)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for html, year, month in pages:
+                parse(html, "city", year, month)
+        elapsed = time.perf_counter() - start
+        results.append((label, rounds * len(pages) / elapsed))
+
+    for label, rate in results:
+        print(f"{label:<16} {rate:>10,.0f} pages/s ({len(pages)} fixture pages x {rounds})")
+    return results
+
+
+def make_daily_weather(db_name, stations=100, years=30, seed=0):
+    """Fills daily_weather with `stations` x `years` of synthetic days; returns the city names."""
+    rnd = np.random.default_rng(seed)
+    dates = pd.date_range("1995-01-01", periods=365 * years, freq="D")
+    day_of_year = dates.dayofyear.to_numpy()
+    cities = [f"地点{i:03d}" for i in range(stations)]
+
+    db = WeatherAnalysis(db_name)
+    for i, city in enumerate(cities):
+        # 季節変化 + 地点ごとの差 + ノイズ。雨の日は日較差が小さくなるようにします
+        base = 15 + 10 * np.sin((day_of_year - 110) / 365 * 2 * np.pi) - i * 0.1
+        rain = rnd.random(len(dates)) < 0.3
+        diff = np.round(np.where(rain, rnd.normal(5, 2, len(dates)), rnd.normal(9, 2.5, len(dates))).clip(0.1), 1)
+        max_t = np.round(base + diff / 2, 1)
+        min_t = np.round(max_t - diff, 1)
+        precip = np.where(rain, np.round(rnd.gamma(1.5, 6, len(dates)), 1), np.nan)
+        rows = zip([city] * len(dates), dates.strftime("%Y-%m-%d"), max_t.tolist(), min_t.tolist(),
+                   [None if np.isnan(p) else p for p in precip], diff.tolist())
+        db.save_data(list(rows))
+    db.conn.close()
+    return cities
+
+
+def _legacy_rankings(db_name, cities):
+    """The notebook's show_rankings: one interpolated query and two sorts per city."""
+    conn = sqlite3.connect(db_name)
+    result = []
+    for city in cities:
+        df_city = pd.read_sql_query(f"SELECT date, temp_diff, precip FROM daily_weather WHERE city = '{city}'", conn)
+        result.append((df_city.sort_values(by="temp_diff", ascending=False).head(10),
+                       df_city.sort_values(by="temp_diff", ascending=True).head(10)))
+    conn.close()
+    return result
+
+
+def _legacy_plot_frames(db_name, cities):
+    """The notebook's plot_weather_analysis: load everything, then filter once per city."""
+    conn = sqlite3.connect(db_name)
+    df = pd.read_sql_query("SELECT date, city, temp_diff FROM daily_weather ORDER BY date ASC", conn)
+    conn.close()
+    df["date"] = pd.to_datetime(df["date"])
+    return [df[df["city"] == city] for city in cities]
+
+
+def _legacy_condition_stats(db_name):
+    """The notebook's hypothesis query, recomputed in SQL."""
+    conn = sqlite3.connect(db_name)
+    df = pd.read_sql_query("""
+    SELECT city,
+           CASE WHEN COALESCE(precip, 0) = 0 THEN '降水なし' ELSE '降水あり' END AS condition,
+           AVG(temp_diff) AS avg_diff, COUNT(*) AS days
+    FROM daily_weather
+    WHERE temp_diff IS NOT NULL
+    GROUP BY city, condition
+    """, conn)
+    conn.close()
+    return df
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def bench_analysis(db_name, cities):
+    """Rankings, rain/dry stats and plot frames: per-city loops vs one load and grouped passes."""
+    legacy = {
+        "rankings": _timed(lambda: _legacy_rankings(db_name, cities))[1],
+        "condition": _timed(lambda: _legacy_condition_stats(db_name))[1],
+        "plot frames": _timed(lambda: _legacy_plot_frames(db_name, cities))[1],
+    }
+    df, load = _timed(lambda: analysis.load_daily(db_name))
+    vectorized = {
+        "rankings": _timed(lambda: analysis.rankings(df))[1],
+        "condition": _timed(lambda: analysis.welch_t(analysis.condition_stats(df)))[1],
+        "plot frames": _timed(lambda: analysis.wide_temp_diff(df))[1],
+    }
+    rolling = _timed(lambda: analysis.rolling_stats(df))[1]
+
+    print(f"{'load once':<16} {load:>10.2f} s ({len(df):,} rows)")
+    for name in legacy:
+        print(f"{name:<16} {legacy[name]:>10.2f} s before {vectorized[name]:>8.2f} s after")
+    print(f"{'total':<16} {sum(legacy.values()):>10.2f} s before "
+          f"{load + sum(vectorized.values()):>8.2f} s after (including the load)")
+    print(f"{'rolling 7D':<16} {rolling:>10.2f} s")
+    return legacy, load, vectorized
+
+
+def bench_hypothesis(db_name, calls=20):
+    """The rain/dry hypothesis: full recompute over daily_weather vs the incremental stats table."""
+    db = WeatherAnalysis(db_name)
+    full = _timed(lambda: [_legacy_condition_stats(db_name) for _ in range(calls)])[1] / calls
+    summary = _timed(lambda: [db.condition_summary() for _ in range(calls)])[1] / calls
+    groups = db.conn.execute("SELECT COUNT(*) FROM daily_weather_stats").fetchone()[0]
+    mismatches, check = _timed(db.check_stats)
+    _, rebuild = _timed(db.rebuild_stats)
+
+    # 集計表を保つトリガーの書き込みコスト（1地点30年分を追加）
+    rows = [(f"追加{k}", day, 20.0, 10.0, None if k % 3 else 1.0, 10.0)
+            for k in range(2) for day in pd.date_range("1995-01-01", periods=365 * 30).strftime("%Y-%m-%d")]
+    with_triggers = _timed(lambda: db.save_data(rows[:len(rows) // 2]))[1]
+    db.conn.executescript("""
+    DROP TRIGGER daily_weather_stats_insert;
+    DROP TRIGGER daily_weather_stats_delete;
+    DROP TRIGGER daily_weather_stats_update;
+    """)
+    without_triggers = _timed(lambda: db.save_data(rows[len(rows) // 2:]))[1]
+    db.conn.close()
+
+    print(f"{'full recompute':<16} {full * 1000:>10.1f} ms/query")
+    print(f"{'stats table':<16} {summary * 1000:>10.1f} ms/query ({groups:,} city/month/condition groups)")
+    print(f"{'check':<16} {check:>10.2f} s ({len(mismatches)} mismatches)")
+    print(f"{'rebuild':<16} {rebuild:>10.2f} s")
+    print(f"{'insert':<16} {with_triggers * 1000:>10.0f} ms with triggers "
+          f"{without_triggers * 1000:>6.0f} ms without ({len(rows) // 2:,} rows)")
+    return full, summary, mismatches
+
+
+# 列と行を絞った読み込み: 5地点・直近5年・temp_diff だけ（city は並べ替えのために読まれます）
+PROJECTED = {"columns": ["date", "temp_diff"], "start": "2020-01-01"}
+
+
+def _load_worker(mode, path, cities):
+    """Runs in a child process so the peak RSS only reflects one load path."""
+    cities = cities.split(",")
+    start = time.perf_counter()
+    if mode.endswith("-projected"):
+        # SQLite でも列指向のデータセットでも、実際に使う analysis.load_daily を通します
+        df = analysis.load_daily(path, cities=cities, start=PROJECTED["start"], columns=PROJECTED["columns"])
+    elif mode == "sqlite":
+        df = analysis.load_daily(path)
+    else:
+        df = columnar.read_daily(path)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "rss_kb": _peak_rss_kb(), "rows": len(df)}))
+
+
+def _peak_rss_kb():
+    # ru_maxrss は fork 元（大きな表を作った親）の値を引き継ぐため、
+    # exec で初期化される /proc の VmHWM を優先します
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_columnar(db_name, cities, tmpdir):
+    """Load time and peak RSS: SQLite vs memory-mapped Parquet/Arrow, full and projected."""
+    paths = {"sqlite": db_name}
+    for format in columnar.FORMATS:
+        paths[format] = os.path.join(tmpdir, format)
+        _, elapsed = _timed(lambda: columnar.export_table(db_name, "daily_weather", paths[format], format))
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, files in os.walk(paths[format]) for name in files)
+        print(f"{'export ' + format:<22} {elapsed:>8.2f} s {size / 2**20:>8.1f} MiB on disk")
+    print(f"{'sqlite file':<22} {'':>10} {os.path.getsize(db_name) / 2**20:>8.1f} MiB on disk")
+
+    results = []
+    for mode in ("sqlite", "parquet", "arrow", "sqlite-projected", "parquet-projected", "arrow-projected"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--load-worker", mode, paths[mode.split("-")[0]], ",".join(cities[:5])],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        results.append((mode, json.loads(out)))
+
+    for mode, r in results:
+        print(f"{mode:<22} {r['seconds']:>8.2f} s {r['rss_kb'] / 1024:>8.0f} MiB max RSS ({r['rows']:,} rows)")
+    return results
+
+
+def _legacy_delay_stats(db_name, routes):
+    """One query per route, then a filter and np.percentile per hour."""
+    conn = sqlite3.connect(db_name)
+    result = {}
+    for route in routes:
+        df = pd.read_sql_query("SELECT planned_time, delay_seconds FROM bus_delays WHERE route_id = ?",
+                               conn, params=[route])
+        hours = df["planned_time"].str[:2].astype(int)
+        for hour in sorted(hours.unique()):
+            delays = df.loc[hours == hour, "delay_seconds"]
+            result[(route, hour)] = np.percentile(delays, [50, 90, 99])
+    conn.close()
+    return result
+
+
+def bench_bus(db_name, routes, tmpdir):
+    """Per-route/hour delay percentiles: per-route queries vs one load and grouped passes."""
+    without_index = _timed(lambda: _legacy_delay_stats(db_name, routes[:10]))[1] * len(routes) / 10
+    _, index = _timed(lambda: bus_analysis.ensure_indexes(db_name))
+    with_index = _timed(lambda: _legacy_delay_stats(db_name, routes))[1]
+
+    df, load = _timed(lambda: bus_analysis.load_bus_delays(db_name))
+    exact, stats = _timed(lambda: bus_analysis.delay_stats(df))
+    _, propagation = _timed(lambda: bus_analysis.propagation(df))
+    sketch, streamed = _timed(lambda: bus_analysis.sketch_db(db_name).summary())
+    # スケッチは順位で分位点を選ぶので、補間しない方法（inverted_cdf）の厳密値と比べます
+    ranked = df.groupby(["route_id", "hour"], observed=True)["delay_seconds"].apply(
+        lambda d: pd.Series(np.percentile(d, [50, 90, 99], method="inverted_cdf"), index=["p50", "p90", "p99"]))
+    error = (sketch[["p50", "p90", "p99"]] - ranked.unstack()).abs().max()
+
+    print(f"{'per-route SQL':<16} {without_index:>10.2f} s without indexes (estimated from 10 routes)")
+    print(f"{'':<16} {with_index:>10.2f} s with indexes (created in {index:.2f} s)")
+    print(f"{'load sqlite':<16} {load:>10.2f} s ({len(df):,} events)")
+    if columnar.pa is not None:
+        path = os.path.join(tmpdir, "bus_arrow")
+        columnar.export_table(db_name, "bus_delays", path, "arrow")
+        dataset_load = _timed(lambda: bus_analysis.load_bus_delays(path))[1]
+        print(f"{'load arrow':<16} {dataset_load:>10.2f} s (columnar.py dataset)")
+    print(f"{'delay stats':<16} {stats:>10.2f} s ({len(exact):,} route/hour groups, on the loaded frame)")
+    print(f"{'propagation':<16} {propagation:>10.2f} s")
+    print(f"{'sketch (stream)':<16} {streamed:>10.2f} s, max difference from exact "
+          + ", ".join(f"{name} {value:.1f} s" for name, value in error.items()))
+    return without_index, with_index, load, stats, streamed
+
+
+def bench_stream(tmpdir, routes, days):
+    """Streaming ingest in events/s (per-event commits vs batched flushes, file vs feed) and rollup reads."""
+    path = os.path.join(tmpdir, "events.csv")
+    count = bus_stream.write_replay(path, routes, days)
+
+    # 1件ずつ書き込む場合（最初の2000件から見積もります）
+    db = bus_stream.DelayIngest(os.path.join(tmpdir, "per_event.db"), flush_events=1)
+    events = [event for batch, _ in bus_stream.replay_file(path, batch_events=2000) for event in batch][:2000]
+    per_event = _timed(lambda: [db.add([event]) for event in events])[1]
+    db.close()
+
+    db_name = os.path.join(tmpdir, "stream.db")
+    db = bus_stream.DelayIngest(db_name)
+    _, batched = _timed(lambda: bus_stream.ingest(db, bus_stream.replay_file(path), path))
+    mismatches = db.check_rollups()
+
+    server = fake_gtfs.serve(fake_gtfs.make_feed(routes, days))
+    feed_db = bus_stream.DelayIngest(os.path.join(tmpdir, "feed.db"))
+    _, feed = _timed(lambda: bus_stream.ingest(feed_db, bus_stream.poll_feed(fake_gtfs.feed_url(server)), "feed"))
+    feed_db.close()
+    server.shutdown()
+
+    # ダッシュボードの表示: 集計表から読む場合と、生の行から毎回集計する場合
+    rollup = _timed(lambda: db.hourly_summary())[1]
+    scan = _timed(lambda: db.conn.execute(
+        "SELECT route_id, CAST(substr(planned_time, 1, 2) AS INTEGER) AS hour, COUNT(*), AVG(delay_seconds), "
+        "MAX(delay_seconds) FROM bus_delays GROUP BY route_id, hour").fetchall())[1]
+    db.close()
+
+    print(f"{'per-event commit':<16} {len(events) / per_event:>10,.0f} events/s")
+    print(f"{'batched replay':<16} {count / batched:>10,.0f} events/s ({count:,} events, "
+          f"{len(mismatches)} rollup mismatches)")
+    print(f"{'batched feed':<16} {count / feed:>10,.0f} events/s (HTTP, {bus_stream.BATCH_EVENTS} per poll)")
+    print(f"{'rollup summary':<16} {rollup * 1000:>10.1f} ms")
+    print(f"{'raw-row scan':<16} {scan * 1000:>10.1f} ms")
+    return len(events) / per_event, count / batched, count / feed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the final assignment's data pipeline")
+    parser.add_argument("--rounds", type=int, default=50, help="passes over the fixture pages")
+    parser.add_argument("--stations", type=int, default=100)
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--routes", type=int, default=50, help="synthetic bus routes")
+    parser.add_argument("--days", type=int, default=365, help="days of timetable per route")
+    parser.add_argument("--stream-days", type=int, default=30, help="days of events replayed by the stream bench")
+    parser.add_argument("--load-worker", nargs=3, metavar=("MODE", "PATH", "CITIES"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load_worker:
+        _load_worker(*args.load_worker)
+        return
+
+    print("--- daily_s1 parse ---")
+    bench_parse(args.rounds)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_name = os.path.join(tmpdir, "daily.db")
+        cities, fill = _timed(lambda: make_daily_weather(db_name, args.stations, args.years))
+        print(f"--- daily_weather: {args.stations} stations x {args.years} years generated in {fill:.1f} s ---")
+        print("--- analysis ---")
+        bench_analysis(db_name, cities)
+        print("--- columnar ---")
+        bench_columnar(db_name, cities, tmpdir)
+        print("--- hypothesis ---")
+        bench_hypothesis(db_name)
+
+        bus_db = os.path.join(tmpdir, "bus.db")
+        routes, fill = _timed(lambda: bus_analysis.make_bus_delays(bus_db, args.routes, args.days))
+        print(f"--- bus_delays: {args.routes} routes x {args.days} days generated in {fill:.1f} s ---")
+        bench_bus(bus_db, routes, tmpdir)
+        print("--- bus stream ---")
+        bench_stream(tmpdir, args.routes, args.stream_days)
+
+
+if __name__ == "__main__":
+    main()
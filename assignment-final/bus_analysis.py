@@ -0,0 +1,442 @@
+import argparse
+import datetime
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+DB_NAME = "bus_analysis.db"
+
+# 定時の範囲: 1分までの早発と5分までの遅れは定時として数えます
+ON_TIME_EARLY = -60
+ON_TIME_LATE = 300
+QUANTILES = (0.5, 0.9, 0.99)
+
+# DelaySketch の階級: 10秒刻みで -30分 〜 +2時間（範囲外は端の階級に入ります）
+BIN_SECONDS = 10
+MIN_DELAY = -1800
+MAX_DELAY = 7200
+
+# 運行日の時刻は日本時間です
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+CHUNK_ROWS = 200_000        # sketch_db で一度に読み込む行数
+COLUMNS = ["route_id", "date", "planned_time", "actual_time", "delay_seconds"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bus_delays (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    route_id TEXT,
+    planned_time TEXT,
+    actual_time TEXT,
+    delay_seconds INTEGER,
+    date TEXT
+);
+"""
+
+# 路線・日付での絞り込みと、時刻表順（route_id, date, planned_time）の並べ替えに使います
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_bus_delays_route_date ON bus_delays(route_id, date, planned_time);
+CREATE INDEX IF NOT EXISTS idx_bus_delays_date ON bus_delays(date);
+"""
+
+
+def ensure_indexes(db_name=DB_NAME):
+    """Creates the bus_delays indexes if they are missing."""
+    conn = sqlite3.connect(db_name)
+    try:
+        conn.executescript(INDEXES)
+    finally:
+        conn.close()
+
+
+def to_seconds(values):
+    """
+    'HH:MM:SS' (or 'H:MM:SS') strings -> float64 seconds since midnight (hours may pass 24),
+    NaN for NULL or anything else.
+    """
+    values = np.asarray(values, dtype=object)
+    valid = pd.notna(values)
+    text = values[valid].astype(str)
+    lengths = np.char.str_len(text)
+
+    # ちょうど8文字の値だけを文字コードの配列として読み、文字列の分割を行ごとに行わないようにします
+    # （切り詰めると "06:00:001" が通ってしまうので、長さの違う値は下の遅い方法に回します）
+    fixed = np.zeros(len(values), dtype=bool)
+    fixed[valid] = lengths == 8
+    if fixed.all():
+        chars = text.astype("U8").view(np.uint32).reshape(-1, 8).astype(np.int64)
+    else:
+        chars = np.zeros((len(values), 8), dtype=np.int64)
+        chars[fixed] = text[lengths == 8].astype("U8").view(np.uint32).reshape(-1, 8)
+    digits = chars - ord("0")
+    seconds = ((digits[:, 0] * 10 + digits[:, 1]) * 3600
+               + (digits[:, 3] * 10 + digits[:, 4]) * 60
+               + digits[:, 6] * 10 + digits[:, 7]).astype(float)
+    number = np.delete(digits, [2, 5], axis=1)
+    ok = (fixed & (chars[:, [2, 5]] == ord(":")).all(axis=1)
+          & ((number >= 0) & (number <= 9)).all(axis=1))
+    seconds[~ok] = np.nan
+
+    # "6:00:00" のような固定幅でない値だけ、遅い方法で読み直します（H:MM:SS の形以外は NaN）
+    retry = valid & ~ok
+    if retry.any():
+        parts = pd.Series(values[retry], dtype=object).astype(str).str.extract(
+            r"^([0-9]{1,2}):([0-9]{2}):([0-9]{2})$").astype(float).to_numpy()
+        seconds[retry] = parts[:, 0] * 3600 + parts[:, 1] * 60 + parts[:, 2]
+    return seconds
+
+
+def decode_unique(values, parse):
+    """Applies `parse` to each distinct value once; route ids, dates and timetable times repeat a lot."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object), sort=True)
+    # NULL の行（code -1）は、末尾に足した None を変換した値を指します
+    parsed = np.asarray(parse(np.append(np.asarray(uniques, dtype=object), None)))
+    return parsed[codes]
+
+
+def typed(df):
+    """
+    Converts a bus_delays frame (or a dict of column arrays) to typed columns: categorical
+    route_id, datetime date, planned/actual as seconds since midnight, int32 delay_seconds
+    and int8 planned hour. Rows without a route, date, delay or readable planned_time are
+    dropped (the same rows bus_stream leaves out of its rollups).
+    """
+    # 文字列の列は DataFrame にする前に変換します（pandas の str 列への変換を避けるため）
+    columns = {name: df[name] for name in df}
+    route = columns.get("route_id")
+    if route is not None and not isinstance(route.dtype, pd.CategoricalDtype):
+        codes, uniques = pd.factorize(np.asarray(route, dtype=object), sort=True)
+        columns["route_id"] = pd.Categorical.from_codes(codes, uniques.astype(str))
+    if "date" in columns and not pd.api.types.is_datetime64_any_dtype(columns["date"]):
+        columns["date"] = decode_unique(columns["date"], lambda u: pd.to_datetime(u).to_numpy())
+    for name in ("planned_time", "actual_time"):
+        if name in columns and not pd.api.types.is_numeric_dtype(columns[name]):
+            columns[name] = decode_unique(columns[name], to_seconds)
+    columns["delay_seconds"] = pd.to_numeric(columns["delay_seconds"])
+    df = pd.DataFrame(columns)
+
+    if "planned_time" in df and "actual_time" in df:
+        # 遅れが記録されていない行は、時刻の差から求めます
+        df["delay_seconds"] = df["delay_seconds"].fillna(df["actual_time"] - df["planned_time"])
+    df = df.dropna(subset=[name for name in ("route_id", "date", "delay_seconds") if name in df])
+    df["delay_seconds"] = df["delay_seconds"].astype("int32")
+    if "planned_time" in df:
+        # 時刻表の時刻が NULL や読めない値の行は、どの時間帯にも入れられないので除きます
+        df = df.dropna(subset=["planned_time"])
+        df["hour"] = (df["planned_time"] // 3600).astype("int8")
+    return df.reset_index(drop=True)
+
+
+def load_bus_delays(db_name=DB_NAME, routes=None, start=None, end=None):
+    """
+    Loads bus_delays in timetable order (route_id, date, planned_time) as typed columns.
+    `db_name` may also be a directory written by `columnar.py bus_delays`.
+    """
+    if os.path.isdir(db_name):
+        from columnar import read_bus_delays
+        df = read_bus_delays(db_name, columns=COLUMNS, routes=routes, start=start, end=end)
+        return typed(df[COLUMNS]).sort_values(["route_id", "date", "planned_time"], kind="stable", ignore_index=True)
+
+    where, params = _where(routes, start, end)
+    query = f"SELECT {', '.join(COLUMNS)} FROM bus_delays{where} ORDER BY route_id, date, planned_time"
+
+    conn = sqlite3.connect(db_name)
+    try:
+        cursor = conn.execute(query, params)
+        return typed(_columns(cursor, cursor.fetchall()))
+    finally:
+        conn.close()
+
+
+def _where(routes=None, start=None, end=None):
+    """' WHERE ...' for the route/date filters (or ''), and its parameters."""
+    conditions, params = [], []
+    if routes:
+        conditions.append(f"route_id IN ({','.join('?' for _ in routes)})")
+        params.extend(routes)
+    if start:
+        conditions.append("date >= ?")
+        params.append(start)
+    if end:
+        conditions.append("date <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def _columns(cursor, rows):
+    """Fetched rows as {name: object array}, ready for typed()."""
+    # read_sql_query は文字列の列を1行ずつ変換して遅いため、行を2次元配列にしてから
+    # 列ごとに typed() で変換します
+    names = [d[0] for d in cursor.description]
+    rows = np.array(rows, dtype=object).reshape(-1, len(names))
+    return {name: np.ascontiguousarray(rows[:, i]) for i, name in enumerate(names)}
+
+
+def delay_stats(df, by=("route_id", "hour")):
+    """
+    events, mean_delay, p50/p90/p99 and on_time_ratio per group, exact, in grouped passes.
+    """
+    by = list(by)
+    delay = df["delay_seconds"]
+    on_time = delay.between(ON_TIME_EARLY, ON_TIME_LATE)
+    grouped = delay.groupby([df[c] for c in by], observed=True)
+
+    stats = grouped.agg(events="count", mean_delay="mean")
+    quantiles = grouped.quantile(list(QUANTILES)).unstack()
+    quantiles.columns = [f"p{round(q * 100)}" for q in QUANTILES]
+    stats = stats.join(quantiles)
+    stats["on_time_ratio"] = on_time.groupby([df[c] for c in by], observed=True).mean()
+    return stats
+
+
+def propagation(df):
+    """
+    How a route's delay carries over from one departure to the next in its daily timetable.
+
+    Per route: `carry` is the correlation between consecutive trips' delays,
+    `late_after_late` / `late_after_on_time` are P(late | previous trip late / not late),
+    and `recovery` is the mean change in delay right after a late trip (negative = catching up).
+    `df` must be in timetable order, as load_bus_delays returns it.
+    """
+    delay = df["delay_seconds"].to_numpy(dtype=float)
+    route = df["route_id"].cat.codes.to_numpy()
+    date = df["date"].to_numpy()
+
+    # 同じ路線・同じ日の1本前の便だけを「前の便」とします
+    same = np.zeros(len(df), dtype=bool)
+    same[1:] = (route[1:] == route[:-1]) & (date[1:] == date[:-1])
+    prev = np.empty_like(delay)
+    prev[0] = np.nan
+    prev[1:] = delay[:-1]
+    prev[~same] = np.nan
+
+    pairs = pd.DataFrame({"route_id": df["route_id"].to_numpy(), "x": prev, "y": delay}).dropna(subset=["x"])
+    pairs["late"] = pairs["y"] > ON_TIME_LATE
+    pairs["prev_late"] = pairs["x"] > ON_TIME_LATE
+    pairs["xy"] = pairs["x"] * pairs["y"]
+    pairs["xx"] = pairs["x"] ** 2
+    pairs["yy"] = pairs["y"] ** 2
+    pairs["late_after_late"] = pairs["late"].astype(float).where(pairs["prev_late"])
+    pairs["late_after_on_time"] = pairs["late"].astype(float).where(~pairs["prev_late"])
+    pairs["recovery"] = (pairs["y"] - pairs["x"]).where(pairs["prev_late"])
+
+    # 相関は合計から求め、路線ごとに1回の集計で済ませます
+    g = pairs.groupby("route_id", observed=True)
+    sums = g[["x", "y", "xy", "xx", "yy"]].mean()
+    cov = sums["xy"] - sums["x"] * sums["y"]
+    std = np.sqrt((sums["xx"] - sums["x"] ** 2) * (sums["yy"] - sums["y"] ** 2))
+    result = g.agg(pairs=("y", "count"), late_ratio=("late", "mean"),
+                   late_after_late=("late_after_late", "mean"),
+                   late_after_on_time=("late_after_on_time", "mean"),
+                   recovery=("recovery", "mean"))
+    result.insert(1, "carry", (cov / std.where(std > 0)).astype(float))
+    return result
+
+
+def group_codes(groups):
+    """
+    Row -> group number for a list of equal-length key arrays, and the key tuples in group
+    order. Factorizes each array once and combines the codes, which is much cheaper than a
+    MultiIndex for the small batches a stream delivers.
+    """
+    combined = np.zeros(len(groups[0]), dtype=np.int64)
+    levels = []
+    for values in groups:
+        # NULL のキーも1つの値として数えます（既定の -1 のままだと別の値を指してしまいます）
+        codes, uniques = pd.factorize(np.asarray(values), use_na_sentinel=False)
+        combined = combined * len(uniques) + codes
+        levels.append((codes, uniques))
+    first, codes = np.unique(combined, return_index=True, return_inverse=True)[1:]
+    keys = list(zip(*[uniques[level_codes[first]].tolist() for level_codes, uniques in levels]))
+    return codes, keys
+
+
+class DelaySketch:
+    """
+    Mergeable fixed-width histograms of delay_seconds per group, for percentiles over data
+    read in chunks or arriving as a stream. Quantiles are nearest-rank (no interpolation) and
+    within BIN_SECONDS / 2 of the exact value for delays inside [MIN_DELAY, MAX_DELAY);
+    delays outside fall in the edge bins.
+    """
+
+    def __init__(self, width=BIN_SECONDS, lo=MIN_DELAY, hi=MAX_DELAY):
+        self.width = width
+        self.lo = lo
+        self.bins = (hi - lo) // width
+        self.keys = {}      # グループのキー -> 行番号
+        self.counts = np.zeros((0, self.bins), dtype=np.int64)
+        self.sums = np.zeros(0)
+        self.on_time = np.zeros(0, dtype=np.int64)
+
+    def _rows(self, keys):
+        rows = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            rows[i] = self.keys.setdefault(key, len(self.keys))
+        grow = len(self.keys) - len(self.counts)
+        if grow:
+            self.counts = np.vstack([self.counts, np.zeros((grow, self.bins), dtype=np.int64)])
+            self.sums = np.concatenate([self.sums, np.zeros(grow)])
+            self.on_time = np.concatenate([self.on_time, np.zeros(grow, dtype=np.int64)])
+        return rows
+
+    def add(self, groups, delays):
+        """
+        Adds a batch: `groups` is a list of equal-length key arrays (e.g. [route_id, hour]),
+        `delays` the matching delay_seconds.
+        """
+        delays = np.asarray(delays, dtype=np.int64)
+        if len(delays) == 0:
+            return
+        codes, keys = group_codes(groups)
+        rows = self._rows(keys)[codes]
+        bins = np.clip((delays - self.lo) // self.width, 0, self.bins - 1)
+
+        # 行番号と階級を1つの番号にまとめ、bincount 1回で全グループを数えます
+        n = len(self.keys)
+        self.counts += np.bincount(rows * self.bins + bins, minlength=n * self.bins).reshape(n, self.bins)
+        self.sums += np.bincount(rows, weights=delays, minlength=n)
+        on_time = (delays >= ON_TIME_EARLY) & (delays <= ON_TIME_LATE)
+        self.on_time += np.bincount(rows[on_time], minlength=n)
+
+    def merge(self, other):
+        """Adds another sketch with the same bins into this one (e.g. one per worker or chunk)."""
+        if (other.width, other.lo, other.bins) != (self.width, self.lo, self.bins):
+            raise ValueError("sketches have different bins")
+        rows = self._rows(list(other.keys))
+        self.counts[rows] += other.counts
+        self.sums[rows] += other.sums
+        self.on_time[rows] += other.on_time
+        return self
+
+    def quantiles(self, qs=QUANTILES):
+        """Bin-midpoint quantiles per group, as an (n_groups, len(qs)) array in key order."""
+        cumulative = np.cumsum(self.counts, axis=1)
+        total = cumulative[:, -1:]
+        # 累積度数が q * 件数に届く最初の階級を、全グループまとめて探します
+        targets = np.ceil(np.asarray(qs)[None, :] * total).clip(1)
+        found = np.stack([(cumulative >= targets[:, [i]]).argmax(axis=1) for i in range(len(qs))], axis=1)
+        return self.lo + (found + 0.5) * self.width
+
+    def summary(self, names=("route_id", "hour")):
+        """The same columns as delay_stats, one row per group."""
+        events = self.counts.sum(axis=1)
+        index = pd.MultiIndex.from_tuples(list(self.keys), names=list(names))
+        stats = pd.DataFrame({"events": events, "mean_delay": self.sums / events}, index=index)
+        for q, column in zip(QUANTILES, self.quantiles().T):
+            stats[f"p{round(q * 100)}"] = column
+        stats["on_time_ratio"] = self.on_time / events
+        return stats.sort_index()
+
+
+def sketch_db(db_name=DB_NAME, chunk_rows=CHUNK_ROWS, routes=None, start=None, end=None):
+    """
+    Streams bus_delays in chunks into a DelaySketch keyed by (route_id, hour); memory stays flat.
+    Each chunk goes through typed(), so the sketch counts the same events as load_bus_delays.
+    """
+    sketch = DelaySketch()
+    where, params = _where(routes, start, end)
+    # 日付は使わないので読まず、typed が除く日付のない行だけを SQL で除きます
+    where = f"{where} AND date IS NOT NULL" if where else " WHERE date IS NOT NULL"
+    columns = [name for name in COLUMNS if name != "date"]
+    conn = sqlite3.connect(db_name)
+    try:
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM bus_delays{where}", params)
+        while rows := cursor.fetchmany(chunk_rows):
+            df = typed(_columns(cursor, rows))
+            sketch.add([df["route_id"].to_numpy(), df["hour"].to_numpy()], df["delay_seconds"].to_numpy())
+    finally:
+        conn.close()
+    return sketch
+
+
+def service_midnight(date):
+    """Epoch seconds of 00:00 JST on a 'YYYY-MM-DD' or 'YYYYMMDD' service date."""
+    day = datetime.datetime.strptime(date.replace("-", ""), "%Y%m%d").replace(tzinfo=JST)
+    return int(day.timestamp())
+
+
+def to_clock(seconds):
+    """Seconds since midnight -> 'HH:MM:SS' strings (vectorized through a lookup table)."""
+    seconds = np.asarray(seconds, dtype=np.int64)
+    if len(seconds) == 0:
+        return np.array([], dtype=str)
+    lo, hi = int(seconds.min()), int(seconds.max())
+    labels = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(lo, hi + 1)])
+    return labels[seconds - lo]
+
+
+def synthetic_events(routes=50, days=365, headway=15, seed=0):
+    """
+    `routes` x `days` synthetic timetables (06:00-22:45 every `headway` minutes) as
+    (route_id, date, planned seconds, actual seconds) arrays in timetable order.
+    Each trip carries over part of the previous trip's delay, and rush hours add more.
+    """
+    rnd = np.random.default_rng(seed)
+    planned = np.arange(6 * 3600, 23 * 3600, headway * 60)
+    hours = planned // 3600
+    dates = pd.date_range("2025-01-01", periods=days, freq="D").strftime("%Y-%m-%d")
+    names = [f"Route-{i:03d}" for i in range(routes)]
+
+    # 路線ごとの癖 + 前の便からの持ち越し（7割）+ ラッシュ時に大きくなる新しい遅れ
+    bias = rnd.normal(30, 20, (routes, 1))
+    delays = np.empty((routes, days, len(planned)))
+    carried = np.zeros((routes, days))
+    for t, hour in enumerate(hours):
+        scale = 150 if hour in (7, 8, 17, 18) else 45
+        carried = 0.7 * carried + rnd.exponential(scale, (routes, days)) - 0.6 * scale
+        delays[:, :, t] = carried + bias
+    delays = np.round(delays).clip(-120).astype(np.int64)
+
+    route_col = np.repeat(names, days * len(planned))
+    date_col = np.tile(np.repeat(np.asarray(dates), len(planned)), routes)
+    planned_col = np.tile(planned, routes * days)
+    return route_col, date_col, planned_col, planned_col + delays.ravel()
+
+
+def make_bus_delays(db_name, routes=50, days=365, headway=15, seed=0):
+    """Fills bus_delays with synthetic_events(); returns the route names."""
+    route_col, date_col, planned, actual = synthetic_events(routes, days, headway, seed)
+    conn = sqlite3.connect(db_name)
+    try:
+        conn.executescript(SCHEMA)
+        with conn:
+            conn.executemany(
+                "INSERT INTO bus_delays (route_id, planned_time, actual_time, delay_seconds, date) VALUES (?, ?, ?, ?, ?)",
+                zip(route_col.tolist(), to_clock(planned).tolist(), to_clock(actual).tolist(),
+                    (actual - planned).tolist(), date_col.tolist()))
+    finally:
+        conn.close()
+    return pd.unique(route_col).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delay percentiles, on-time ratios and propagation for bus_delays")
+    parser.add_argument("--db", default=DB_NAME, help="SQLite file or a columnar.py bus_delays dataset directory")
+    parser.add_argument("--routes", nargs="*", help="only these route_ids")
+    parser.add_argument("--start", help="first date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date (YYYY-MM-DD)")
+    parser.add_argument("--stream", action="store_true",
+                        help="approximate percentiles with DelaySketch, reading in chunks")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.db):
+        ensure_indexes(args.db)
+    pd.set_option("display.width", 160)
+    pd.set_option("display.max_columns", None)
+    if args.stream:
+        if os.path.isdir(args.db):
+            parser.error("--stream reads a SQLite file, not a dataset directory")
+        print(sketch_db(args.db, routes=args.routes, start=args.start, end=args.end).summary().round(3))
+        return
+
+    df = load_bus_delays(args.db, args.routes, args.start, args.end)
+    print(f"--- 路線・時間帯ごとの遅れ（{len(df):,} 件） ---")
+    print(delay_stats(df).round(3))
+    print("\n--- 遅れの伝播（1本前の便から） ---")
+    print(propagation(df).round(3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import argparse
+import csv
+import itertools
+import math
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+import bus_analysis
+from bus_analysis import DB_NAME, ON_TIME_EARLY, ON_TIME_LATE, DelaySketch, service_midnight, to_clock, to_seconds
+
+BATCH_EVENTS = 1000         # 入力を読む単位（ファイルの行数・フィードの1回の取得件数）
+FLUSH_EVENTS = 5000         # これだけ溜まったら SQLite に書き込みます
+FLUSH_SECONDS = 1.0         # 溜まっていなくても、この間隔で書き込みます
+POLL_SECONDS = 5.0          # follow でフィードに新しい更新がないときの待ち時間
+TIMEOUT = 10
+
+# 路線・日付・時間帯ごとの集計表。足し合わせられる値だけを持つので、書き込みは差分の加算で済みます
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bus_delay_rollups (
+    route_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    events INTEGER NOT NULL,
+    sum_delay INTEGER NOT NULL,
+    sumsq_delay INTEGER NOT NULL,
+    on_time INTEGER NOT NULL,
+    late INTEGER NOT NULL,
+    max_delay INTEGER NOT NULL,
+    PRIMARY KEY (route_id, date, hour)
+) WITHOUT ROWID;
+
+-- 入力ごとの読み終えた位置。集計と同じトランザクションで書くので、再開しても二重に数えません
+CREATE TABLE IF NOT EXISTS stream_positions (
+    source TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO bus_delay_rollups (route_id, date, hour, events, sum_delay, sumsq_delay, on_time, late, max_delay)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (route_id, date, hour) DO UPDATE SET
+    events = events + excluded.events,
+    sum_delay = sum_delay + excluded.sum_delay,
+    sumsq_delay = sumsq_delay + excluded.sumsq_delay,
+    on_time = on_time + excluded.on_time,
+    late = late + excluded.late,
+    max_delay = MAX(max_delay, excluded.max_delay)
+"""
+
+# bus_delays の全行から集計表と同じ値を求めます（rebuild と check 用）
+ROLLUP_RECOMPUTE = f"""
+SELECT route_id, date, CAST(substr(planned_time, 1, 2) AS INTEGER) AS hour,
+       COUNT(*), SUM(delay_seconds), SUM(delay_seconds * delay_seconds),
+       SUM(delay_seconds BETWEEN {ON_TIME_EARLY} AND {ON_TIME_LATE}),
+       SUM(delay_seconds > {ON_TIME_LATE}), MAX(delay_seconds)
+FROM bus_delays
+WHERE delay_seconds IS NOT NULL
+  AND route_id IS NOT NULL AND date IS NOT NULL AND planned_time IS NOT NULL
+GROUP BY route_id, date, hour
+"""
+
+SUMMARY_COLUMNS = ["route_id", "hour", "events", "mean_delay", "std_delay", "on_time_ratio", "late_ratio", "max_delay"]
+
+
+class DelayIngest:
+    """
+    Streaming writer for bus_delays. Each batch of (route_id, date, planned_time, actual_time)
+    events gets its delay_seconds computed on arrival, updates the in-memory per-route/hour
+    sketch, and is queued; flush() writes the raw rows, the rollup deltas and the source
+    position in one transaction.
+    """
+
+    def __init__(self, db_name=DB_NAME, flush_events=FLUSH_EVENTS, flush_seconds=FLUSH_SECONDS):
+        self.conn = sqlite3.connect(db_name)
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self.live = DelaySketch()       # (route_id, hour) ごとの遅れの分布（再起動までの分）
+        self.rows = []
+        self.deltas = {}                # (route_id, date, hour) -> [events, sum, sumsq, on_time, late, max]
+        self.positions = {}
+        self.events = 0
+        self.rejected = 0
+        self.last_flush = time.monotonic()
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.executescript(bus_analysis.SCHEMA + bus_analysis.INDEXES)
+        # 既存の DB に初めて集計表を作るときは、すでにある行から組み立てます
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bus_delay_rollups'").fetchone()
+        self.conn.executescript(ROLLUP_SCHEMA)
+        if not exists:
+            self.rebuild_rollups()
+        self.conn.commit()
+
+    def position(self, source):
+        """How many events of `source` are already stored (0 if it was never ingested)."""
+        if source in self.positions:
+            return self.positions[source]
+        row = self.conn.execute("SELECT position FROM stream_positions WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else 0
+
+    def add(self, events, source=None, position=None):
+        """
+        Ingests a batch of (route_id, date, planned_time, actual_time) events. `position` is
+        where `source` will resume after this batch. Returns the number of events accepted.
+        """
+        if source is not None:
+            self.positions[source] = position
+        if not events:
+            self._maybe_flush()
+            return 0
+
+        columns = np.array(events, dtype=object).reshape(-1, 4)
+        planned = bus_analysis.decode_unique(columns[:, 2], to_seconds)
+        actual = bus_analysis.decode_unique(columns[:, 3], to_seconds)
+        delay = actual - planned
+        # 日付をまたいで "00:05:00" と書かれた到着は、翌日の時刻として扱います
+        delay[delay < -12 * 3600] += 24 * 3600
+        ok = ~np.isnan(delay) & pd.notna(columns[:, 0]) & pd.notna(columns[:, 1])
+        self.rejected += int((~ok).sum())
+        if not ok.any():
+            self._maybe_flush()
+            return 0
+
+        route, date = columns[ok, 0], columns[ok, 1]
+        delay = delay[ok].astype(np.int64)
+        hour = (planned[ok] // 3600).astype(np.int64)
+        self.live.add([route, hour], delay)
+
+        # バッチ内で (路線, 日付, 時間帯) ごとにまとめてから、未書き込みの差分に足します
+        codes, keys = bus_analysis.group_codes([route, date, hour])
+        n = len(keys)
+        on_time = (delay >= ON_TIME_EARLY) & (delay <= ON_TIME_LATE)
+        sums = np.stack([
+            np.bincount(codes, minlength=n),
+            np.bincount(codes, weights=delay, minlength=n),
+            np.bincount(codes, weights=delay * delay, minlength=n),
+            np.bincount(codes[on_time], minlength=n),
+            np.bincount(codes[delay > ON_TIME_LATE], minlength=n),
+        ], axis=1).astype(np.int64).tolist()
+        highest = np.full(n, np.iinfo(np.int64).min)
+        np.maximum.at(highest, codes, delay)
+        for key, values, top in zip(keys, sums, highest.tolist()):
+            current = self.deltas.get(key)
+            if current is None:
+                self.deltas[key] = values + [top]
+            else:
+                for i in range(5):
+                    current[i] += values[i]
+                current[5] = max(current[5], top)
+
+        self.rows.extend(zip(route.tolist(), columns[ok, 2].tolist(), columns[ok, 3].tolist(),
+                             delay.tolist(), date.tolist()))
+        self.events += len(delay)
+        self._maybe_flush()
+        return len(delay)
+
+    def _maybe_flush(self):
+        if len(self.rows) >= self.flush_events or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Writes queued rows, rollup deltas and positions in one transaction; returns the row count."""
+        count = len(self.rows)
+        with self.conn:
+            if self.rows:
+                self.conn.executemany(
+                    "INSERT INTO bus_delays (route_id, planned_time, actual_time, delay_seconds, date) "
+                    "VALUES (?, ?, ?, ?, ?)", self.rows)
+            if self.deltas:
+                self.conn.executemany(ROLLUP_UPSERT, [
+                    (route, date, int(hour), *map(int, values)) for (route, date, hour), values in self.deltas.items()])
+            if self.positions:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO stream_positions (source, position) VALUES (?, ?)",
+                    list(self.positions.items()))
+        self.rows = []
+        self.deltas = {}
+        self.positions = {}
+        self.last_flush = time.monotonic()
+        return count
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def rebuild_rollups(self):
+        """Recomputes bus_delay_rollups from every row of bus_delays."""
+        with self.conn:
+            self.conn.execute("DELETE FROM bus_delay_rollups")
+            self.conn.execute(
+                "INSERT INTO bus_delay_rollups (route_id, date, hour, events, sum_delay, sumsq_delay, "
+                "on_time, late, max_delay) " + ROLLUP_RECOMPUTE)
+
+    def check_rollups(self):
+        """Compares bus_delay_rollups (after a flush) with a full recompute; returns the keys that differ."""
+        self.flush()
+        stored = {row[:3]: row[3:] for row in self.conn.execute(
+            "SELECT route_id, date, hour, events, sum_delay, sumsq_delay, on_time, late, max_delay "
+            "FROM bus_delay_rollups")}
+        fresh = {row[:3]: row[3:] for row in self.conn.execute(ROLLUP_RECOMPUTE)}
+        return sorted(key for key in stored.keys() | fresh.keys() if stored.get(key) != fresh.get(key))
+
+    def hourly_summary(self, routes=None, start=None, end=None):
+        """
+        Per route and hour: events, mean/std delay, on-time and late ratios and the max,
+        read from bus_delay_rollups (O(groups), not O(rows)). Returns SUMMARY_COLUMNS tuples.
+        """
+        query = ("SELECT route_id, hour, SUM(events), SUM(sum_delay), SUM(sumsq_delay), SUM(on_time), "
+                 "SUM(late), MAX(max_delay) FROM bus_delay_rollups")
+        conditions, params = [], []
+        if routes:
+            conditions.append(f"route_id IN ({','.join('?' for _ in routes)})")
+            params.extend(routes)
+        if start:
+            conditions.append("date >= ?")
+            params.append(start)
+        if end:
+            conditions.append("date <= ?")
+            params.append(end)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " GROUP BY route_id, hour ORDER BY route_id, hour"
+
+        result = []
+        for route, hour, n, total, sumsq, on_time, late, max_delay in self.conn.execute(query, params):
+            mean = total / n
+            # 標本分散（n-1 で割る）。二乗和から求めるので丸め誤差で負にならないようにします
+            std = math.sqrt(max(sumsq - total * total / n, 0.0) / (n - 1)) if n > 1 else None
+            result.append((route, hour, n, mean, std, on_time / n, late / n, max_delay))
+        return result
+
+
+def write_replay(path, routes=20, days=7, headway=15, seed=0):
+    """Writes synthetic events as a replay CSV, in the order the departures happen. Returns the count."""
+    route_col, date_col, planned, actual = bus_analysis.synthetic_events(routes, days, headway, seed)
+    order = np.lexsort((actual, date_col))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["route_id", "date", "planned_time", "actual_time"])
+        writer.writerows(zip(route_col[order].tolist(), date_col[order].tolist(),
+                             to_clock(planned[order]).tolist(), to_clock(actual[order]).tolist()))
+    return len(order)
+
+
+def replay_file(path, start=0, batch_events=BATCH_EVENTS):
+    """Yields (events, position) batches from a replay CSV, skipping the first `start` events."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)    # ヘッダ
+        position = start
+        rows = itertools.islice(reader, start, None)
+        while True:
+            batch = list(itertools.islice(rows, batch_events))
+            if not batch:
+                break
+            position += len(batch)
+            yield batch, position
+
+
+def _feed_events(entities):
+    """GTFS-realtime trip updates -> (route_id, date, planned_time, actual_time) tuples."""
+    routes, dates, planned, seconds = [], [], [], []
+    midnights = {}
+    for entity in entities:
+        update = entity.get("tripUpdate")
+        if not update or not update.get("stopTimeUpdate"):
+            continue
+        trip = update["trip"]
+        event = update["stopTimeUpdate"][0].get("departure") or update["stopTimeUpdate"][0].get("arrival")
+        if not event or "time" not in event:
+            continue
+        start_date = trip["startDate"]
+        midnight = midnights.get(start_date)
+        if midnight is None:
+            midnight = midnights[start_date] = service_midnight(start_date)
+        routes.append(trip["routeId"])
+        dates.append(f"{start_date[:4]}-{start_date[4:6]}-{start_date[6:]}")
+        planned.append(trip["startTime"])
+        # 実際の時刻は運行日の 0 時からの秒数に直します（24時を過ぎると "25:10:00" になります）
+        seconds.append(int(event["time"]) - midnight)
+    return list(zip(routes, dates, planned, to_clock(seconds).tolist()))
+
+
+def poll_feed(url, cursor=0, batch_events=BATCH_EVENTS, follow=False, interval=POLL_SECONDS, session=None):
+    """
+    Yields (events, cursor) batches from a GTFS-realtime-style JSON feed, starting at `cursor`.
+    Stops when the feed has nothing new unless `follow` is set, then polls every `interval` s.
+    """
+    session = session or requests.Session()
+    while True:
+        try:
+            response = session.get(url, params={"cursor": cursor, "limit": batch_events}, timeout=TIMEOUT)
+            response.raise_for_status()
+            feed = response.json()
+        except (requests.RequestException, ValueError) as e:
+            print(f"フィード取得エラー: {e}")
+            if not follow:
+                return
+            time.sleep(interval)
+            continue
+
+        entities = feed.get("entity", [])
+        cursor = feed["header"].get("cursor", cursor + len(entities))
+        if entities:
+            yield _feed_events(entities), cursor
+        elif follow:
+            time.sleep(interval)
+        else:
+            return
+
+
+def ingest(db, batches, source):
+    """Feeds (events, position) batches into a DelayIngest and flushes at the end; returns the event count."""
+    count = 0
+    for events, position in batches:
+        count += db.add(events, source, position)
+    db.flush()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streams bus delay events into bus_delays with incremental rollups")
+    parser.add_argument("--db", default=DB_NAME)
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay = sub.add_parser("replay", help="replay a CSV of route_id,date,planned_time,actual_time")
+    replay.add_argument("path")
+    feed = sub.add_parser("feed", help="poll a GTFS-realtime-style JSON feed (see fake_gtfs.py)")
+    feed.add_argument("url")
+    feed.add_argument("--follow", action="store_true", help="keep polling for new updates")
+    summary = sub.add_parser("summary", help="per-route/hour summary from the rollups")
+    summary.add_argument("--routes", nargs="*")
+    summary.add_argument("--start")
+    summary.add_argument("--end")
+    sub.add_parser("rebuild", help="recompute bus_delay_rollups from bus_delays")
+    sub.add_parser("check", help="compare bus_delay_rollups with a full recompute")
+    args = parser.parse_args()
+
+    db = DelayIngest(args.db)
+    try:
+        if args.command in ("replay", "feed"):
+            source = args.path if args.command == "replay" else args.url
+            start = db.position(source)
+            batches = (replay_file(args.path, start) if args.command == "replay"
+                       else poll_feed(args.url, start, follow=args.follow))
+            began = time.perf_counter()
+            count = ingest(db, batches, source)
+            elapsed = time.perf_counter() - began
+            print(f"{count:,} events from position {start:,} in {elapsed:.1f} s "
+                  f"({count / max(elapsed, 1e-9):,.0f} events/s, {db.rejected} rejected)")
+        elif args.command == "summary":
+            pd.set_option("display.width", 160)
+            pd.set_option("display.max_columns", None)
+            print(pd.DataFrame(db.hourly_summary(args.routes, args.start, args.end), columns=SUMMARY_COLUMNS).round(3))
+        elif args.command == "rebuild":
+            db.rebuild_rollups()
+        else:
+            mismatches = db.check_rollups()
+            print(f"{len(mismatches)} mismatches" + (f": {mismatches[:10]}" if mismatches else ""))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import datetime
+import os
+import sqlite3
+
+# pyarrow は任意の依存です。書き出し・読み込みを使うときだけ必要になります
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+except ImportError:
+    pa = None
+
+DATASET_DIR = "datasets"
+BATCH_ROWS = 100_000        # SQLite から一度に読み込む行数
+FORMATS = ("parquet", "arrow")
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for the columnar export (pip install pyarrow)")
+
+
+def _schemas():
+    daily = pa.schema([
+        ("city", pa.string()),
+        ("date", pa.date32()),
+        ("max_temp", pa.float64()),
+        ("min_temp", pa.float64()),
+        ("precip", pa.float64()),
+        ("temp_diff", pa.float64()),
+    ])
+    bus = pa.schema([
+        ("route_id", pa.string()),
+        ("date", pa.date32()),
+        ("planned_time", pa.string()),
+        ("actual_time", pa.string()),
+        ("delay_seconds", pa.int32()),
+    ])
+    return {"daily_weather": (daily, "city"), "bus_delays": (bus, "route_id")}
+
+
+# (表名, SELECT 文) -- 列の順番は _schemas() と同じです
+QUERIES = {
+    "daily_weather": "SELECT city, date, max_temp, min_temp, precip, temp_diff FROM daily_weather",
+    "bus_delays": "SELECT route_id, date, planned_time, actual_time, delay_seconds FROM bus_delays",
+}
+
+
+def _batches(conn, table, schema):
+    """Streams a SQLite table as Arrow record batches of BATCH_ROWS rows."""
+    cursor = conn.execute(QUERIES[table])
+    names = [field.name for field in schema]
+    while True:
+        rows = cursor.fetchmany(BATCH_ROWS)
+        if not rows:
+            break
+        columns = [list(col) for col in zip(*rows)]
+        columns[1] = [datetime.date.fromisoformat(d) for d in columns[1]]
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)], names=names)
+
+
+def _partitioning(key, read=False):
+    # 年でも分けると1ファイルが数百行になり、読み込みがファイルを開く時間だけになります。
+    # 日付の絞り込みは Parquet の行グループ統計（min/max）で行グループごと読み飛ばします
+    if read:
+        # 読み込み時は辞書型にして、pandas ではそのまま category 列になるようにします
+        return ds.partitioning(pa.schema([(key, pa.dictionary(pa.int32(), pa.string()))]),
+                               flavor="hive", dictionaries="infer")
+    return ds.partitioning(pa.schema([(key, pa.string())]), flavor="hive")
+
+
+def export_table(db_name, table, out_dir=None, format="parquet"):
+    """
+    Writes `table` (daily_weather or bus_delays) as a hive-partitioned dataset:
+    {out_dir}/{city|route_id}=.../part-0.{parquet|arrow}. Returns the row count.
+    """
+    _require_pyarrow()
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    schema, key = _schemas()[table]
+    out_dir = out_dir or os.path.join(DATASET_DIR, table)
+
+    # write_dataset はバッチを別スレッドから取り出します（同時に使うのは1スレッドだけです）
+    conn = sqlite3.connect(db_name, check_same_thread=False)
+    try:
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        ds.write_dataset(
+            _batches(conn, table, schema), out_dir, schema=schema,
+            format="ipc" if format == "arrow" else "parquet",
+            partitioning=_partitioning(key),
+            existing_data_behavior="delete_matching",
+            max_rows_per_group=BATCH_ROWS,
+        )
+    finally:
+        conn.close()
+    return count
+
+
+def _format(path):
+    """"ipc" if the dataset holds .arrow files, else "parquet"."""
+    for _, _, files in os.walk(path):
+        if any(name.endswith(".arrow") for name in files):
+            return "ipc"
+    return "parquet"
+
+
+def _filter(key, values, start, end):
+    """Filter pushed down to the scan: key IN values prunes partitions, the date range row groups."""
+    conditions = []
+    if values:
+        conditions.append(pc.field(key).isin(list(values)))
+    if start:
+        conditions.append(pc.field("date") >= datetime.date.fromisoformat(start))
+    if end:
+        conditions.append(pc.field("date") <= datetime.date.fromisoformat(end))
+
+    expr = None
+    for condition in conditions:
+        expr = condition if expr is None else expr & condition
+    return expr
+
+
+def read_table(path, table, columns=None, values=None, start=None, end=None):
+    """
+    Reads an exported dataset as an Arrow table, memory-mapped, reading only `columns`
+    and only the partitions/row groups that can match values/start/end.
+    `values` filters the partition key (city or route_id), which comes back dictionary-encoded.
+    """
+    _require_pyarrow()
+    _, key = _schemas()[table]
+    dataset = ds.dataset(
+        path, format=_format(path), partitioning=_partitioning(key, read=True),
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+    return dataset.to_table(columns=columns, filter=_filter(key, values, start, end))
+
+
+def read_daily(path, columns=None, cities=None, start=None, end=None):
+    """
+    daily_weather from a dataset, as the typed frame analysis.load_daily returns.
+    Only `columns` are kept; city and date are always read for the order and the index.
+    """
+    columns = columns or ["city", "date", "max_temp", "min_temp", "precip", "temp_diff"]
+    table = read_table(path, "daily_weather", list(dict.fromkeys(["city", "date", *columns])), cities, start, end)
+    df = table.to_pandas(date_as_object=False)
+    df["date"] = df["date"].astype("datetime64[ns]")
+    df = df.sort_values(["city", "date"]).set_index("date")
+    return df[[name for name in columns if name != "date"]]
+
+
+def read_bus_delays(path, columns=None, routes=None, start=None, end=None):
+    """bus_delays from a dataset as a DataFrame with a categorical route_id."""
+    table = read_table(path, "bus_delays", columns, routes, start, end)
+    df = table.to_pandas(date_as_object=False)
+    if "date" in df:
+        df["date"] = df["date"].astype("datetime64[ns]")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports SQLite tables as partitioned Parquet/Arrow datasets")
+    parser.add_argument("table", choices=sorted(QUERIES))
+    parser.add_argument("--db", help="defaults to weather_hypothesis.db / bus_analysis.db")
+    parser.add_argument("--out", help=f"defaults to {DATASET_DIR}/<table>")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    args = parser.parse_args()
+
+    db_name = args.db or ("weather_hypothesis.db" if args.table == "daily_weather" else "bus_analysis.db")
+    out_dir = args.out or os.path.join(DATASET_DIR, args.table)
+    count = export_table(db_name, args.table, out_dir, args.format)
+    print(f"{args.table}: {count:,} rows -> {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from lxml import etree
+import numpy as np
+import pandas as pd
+
+# 数値として読めないセルはすべて NULL（None）になります。代表的な記号:
+#   --   該当現象なし      ///  欠測
+#   ]    資料不足値        )    準正常値（値のあとに付きます）
+MISSING_MARKERS = ("--", "///", "]", ")")
+
+# lxml.html の要素クラス探索を省くため、素の etree の HTML パーサを使います
+_PARSER = etree.HTMLParser()
+
+
+def header_labels(table):
+    """
+    Resolves the header rows' rowspan/colspan once and returns one label per data
+    column, joined from the top row down (e.g. "気温(℃)/最高").
+    """
+    grid = []
+    for r, tr in enumerate(table.xpath("tr[th]")):
+        while len(grid) <= r:
+            grid.append([])
+        col = 0
+        for th in tr.xpath("th"):
+            # 上の行の rowspan で埋まっている位置は飛ばします
+            while col < len(grid[r]) and grid[r][col] is not None:
+                col += 1
+            text = "".join(th.itertext()).strip()
+            rowspan = int(th.get("rowspan", 1))
+            colspan = int(th.get("colspan", 1))
+            for dr in range(rowspan):
+                while len(grid) <= r + dr:
+                    grid.append([])
+                row = grid[r + dr]
+                while len(row) < col + colspan:
+                    row.append(None)
+                for dc in range(colspan):
+                    row[col + dc] = text
+            col += colspan
+
+    width = max(len(row) for row in grid)
+    labels = []
+    for c in range(width):
+        parts = []
+        for row in grid:
+            if c < len(row) and row[c] and row[c] not in parts:
+                parts.append(row[c])
+        labels.append("/".join(parts))
+    return labels
+
+
+def find_column(labels, *keywords):
+    """Index of the first column whose label contains every keyword."""
+    for i, label in enumerate(labels):
+        if all(k in label for k in keywords):
+            return i
+    raise ValueError(f"column {keywords} not found in daily_s1 header")
+
+
+def to_numbers(values):
+    """Vectorized cleaning: stripped strings -> float array, NaN for anything that is not a plain number."""
+    return pd.to_numeric(np.asarray(values, dtype=object), errors="coerce").astype(float)
+
+
+def _nullable(array):
+    return [None if np.isnan(v) else float(v) for v in array]
+
+
+def parse_daily_page(html, city_name, year, month):
+    """
+    Parses a daily_s1 page into (city, date, max_temp, min_temp, precip, temp_diff) rows.
+
+    Missing or flagged values (see MISSING_MARKERS) are None, and so is temp_diff
+    when either temperature is missing.
+    """
+    # ページの大半はナビゲーションなので、表の部分だけを切り出してからパースします
+    start = html.find('<table id="tablefix1"')
+    end = html.find("</table>", start)
+    if start != -1 and end != -1:
+        html = html[start:end + len("</table>")]
+    root = etree.fromstring(html, _PARSER)
+    tables = root.xpath('//table[@id="tablefix1"]')
+    if not tables:
+        raise ValueError("daily_s1 table not found")
+    table = tables[0]
+
+    # 列の位置はページごとに1回だけ求めます
+    labels = header_labels(table)
+    idx_max = find_column(labels, "気温", "最高")
+    idx_min = find_column(labels, "気温", "最低")
+    idx_pre = find_column(labels, "降水量", "合計")
+
+    # 必要な3列の文字列だけを集め、数値への変換は最後にまとめて1回で行います
+    days, raw = [], []
+    for tr in table.iterfind("tr"):
+        cells = tr.findall("td")
+        if not cells:
+            continue
+        day = "".join(cells[0].itertext()).strip()
+        if not day.isdigit():
+            continue
+        days.append(int(day))
+        raw.append("".join(cells[idx_max].itertext()).strip())
+        raw.append("".join(cells[idx_min].itertext()).strip())
+        raw.append("".join(cells[idx_pre].itertext()).strip())
+
+    values = to_numbers(raw).reshape(-1, 3)
+    max_t, min_t, precip = values[:, 0], values[:, 1], values[:, 2]
+    diff = np.round(max_t - min_t, 1)
+
+    dates = [f"{year}-{month:02d}-{day:02d}" for day in days]
+    return list(zip([city_name] * len(dates), dates,
+                    _nullable(max_t), _nullable(min_t), _nullable(precip), _nullable(diff)))
@@ -0,0 +1,119 @@
+import argparse
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+from bus_analysis import service_midnight, synthetic_events
+
+FEED_PATH = "/trip_updates"
+MAX_LIMIT = 5000            # 1回の応答で返す更新の上限
+
+
+def make_feed(routes=20, days=7, headway=15, seed=0):
+    """
+    Synthetic trip updates shaped like GTFS-realtime's JSON mapping, one per departure,
+    in the order the departures actually happen. Each entity is serialized once here.
+    """
+    route_col, date_col, planned, actual = synthetic_events(routes, days, headway, seed)
+    order = np.lexsort((actual, date_col))
+    midnights = {date: service_midnight(date) for date in np.unique(date_col)}
+
+    entities = []
+    for n, i in enumerate(order):
+        date = date_col[i]
+        seconds = int(planned[i])
+        entities.append(json.dumps({
+            "id": str(n),
+            "tripUpdate": {
+                "trip": {
+                    "routeId": route_col[i],
+                    "startDate": date.replace("-", ""),
+                    "startTime": f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}",
+                },
+                # GTFS-realtime の JSON では uint64 の時刻は文字列になります
+                "stopTimeUpdate": [{"departure": {"time": str(midnights[date] + int(actual[i]))}}],
+            },
+        }, ensure_ascii=False))
+    return entities
+
+
+class FakeFeedHandler(http.server.BaseHTTPRequestHandler):
+    """GET /trip_updates?cursor=N&limit=M returns the next updates and the cursor to ask for next."""
+
+    protocol_version = "HTTP/1.1"   # keep-alive を有効にします
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != FEED_PATH:
+            self.send_error(404)
+            return
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            cursor = int(query.get("cursor", ["0"])[0])
+            limit = min(int(query.get("limit", [str(MAX_LIMIT)])[0]), MAX_LIMIT)
+        except ValueError:
+            self.send_error(400)
+            return
+
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            # released 件目までが「すでに発生した」更新です（follow の確認用）
+            available = server.entities[cursor:min(cursor + limit, server.released)]
+        header = {"gtfsRealtimeVersion": "2.0", "timestamp": str(int(time.time())),
+                  "cursor": cursor + len(available)}
+        body = ('{"header": ' + json.dumps(header) + ', "entity": [' + ",".join(available) + "]}").encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(entities, port=0, released=None):
+    """
+    Starts a fake feed on a background thread and returns it. Only the first `released`
+    entities are served (all by default); raise server.released to publish more.
+    """
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), FakeFeedHandler)
+    server.daemon_threads = True
+    server.entities = entities
+    server.released = len(entities) if released is None else released
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def feed_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}{FEED_PATH}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for a GTFS-realtime trip updates feed")
+    parser.add_argument("--routes", type=int, default=20)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    server = serve(make_feed(args.routes, args.days), args.port)
+    print(f"Serving {len(server.entities):,} trip updates at {feed_url(server)} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
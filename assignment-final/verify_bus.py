@@ -0,0 +1,170 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+
+import bus_analysis
+import bus_stream
+import fake_gtfs
+from bus_analysis import DelaySketch
+
+DB_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bus_analysis.db")
+
+
+def test_load(db_path):
+    print("Testing typed load of bus_analysis.db...")
+    shutil.copy(DB_NAME, db_path)
+    bus_analysis.ensure_indexes(db_path)
+    conn = sqlite3.connect(db_path)
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT delay_seconds FROM bus_delays "
+                        "WHERE route_id = ? AND date = ?", ["Green-Route-01", "2026-01-19"]).fetchall()
+    conn.close()
+    if "idx_bus_delays_route_date" not in str(plan):
+        print(f"FAIL: Route/date lookup does not use the index: {plan}")
+        return False
+
+    df = bus_analysis.load_bus_delays(db_path)
+    stats = bus_analysis.delay_stats(df)
+    rush = stats.loc[("Green-Route-01", 7)]
+    if len(df) != 340 or rush["p50"] != 600 or rush["on_time_ratio"] != 0:
+        print(f"FAIL: Expected 340 events and a 10 min rush at 7:00, got {len(df)} events, {rush.to_dict()}")
+        return False
+
+    # 路線・日付・時刻表の時刻が NULL の行があっても、集計表は作れるはずです
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany("INSERT INTO bus_delays (route_id, planned_time, actual_time, delay_seconds, date) "
+                         "VALUES (?, ?, NULL, 60, ?)", [(None, "07:00:00", "2026-01-19"),
+                                                        ("Green-Route-01", "07:00:00", None),
+                                                        ("Green-Route-01", None, "2026-01-19")])
+    conn.close()
+    ingest = bus_stream.DelayIngest(db_path)
+    if ingest.check_rollups():
+        print("FAIL: Rollups built from a database with NULL keys differ from a recompute")
+        return False
+
+    # 長すぎる値は切り詰めず、全角などの ASCII でない値もエラーにせず NaN にします
+    seconds = bus_analysis.to_seconds(["06:00:00", "6:15:00", "25:10:30", None, "--", "06:00:001", "０６:００:００", 7])
+    if seconds[:3].tolist() != [21600, 22500, 90630] or not np.isnan(seconds[3:]).all():
+        print(f"FAIL: to_seconds gave {seconds}")
+        return False
+    print(f"SUCCESS: {len(df)} events, {len(stats)} route/hour groups")
+    return True
+
+
+def test_sketch(db_path):
+    print("Testing DelaySketch against exact percentiles...")
+    bus_analysis.make_bus_delays(db_path, routes=3, days=60)
+    # 時刻表の時刻や路線が NULL・読めない値の行は除き、遅れが NULL の行は時刻の差で補います。
+    # スケッチも typed と同じ行を数えるはずです
+    route = str(bus_analysis.load_bus_delays(db_path)["route_id"].iloc[0])
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany("INSERT INTO bus_delays (route_id, planned_time, actual_time, delay_seconds, date) "
+                         "VALUES (?, ?, ?, ?, '2026-01-05')",
+                         [(route, None, None, 60), (route, "--", None, 60), (None, "07:00:00", None, 60),
+                          (route, "07:00:00", "07:03:00", None), (route, "07:00:00", None, None)])
+    conn.close()
+    df = bus_analysis.load_bus_delays(db_path)
+    sketch = bus_analysis.sketch_db(db_path, chunk_rows=1000).summary()
+    if sketch["events"].sum() != len(df) or not (df["delay_seconds"] == 180).any():
+        print(f"FAIL: Sketch counted {sketch['events'].sum()} events, the typed load has {len(df)}")
+        return False
+    filtered = bus_analysis.sketch_db(db_path, routes=[route], start="2026-01-05", end="2026-01-05").summary()
+    expected = bus_analysis.load_bus_delays(db_path, [route], "2026-01-05", "2026-01-05")
+    if filtered["events"].sum() != len(expected):
+        print(f"FAIL: Filtered sketch counted {filtered['events'].sum()} events, expected {len(expected)}")
+        return False
+
+    # スケッチは順位で選ぶ分位点なので、補間しない厳密値から階級幅の半分以内のはずです
+    worst = 0
+    for (route, hour), group in df.groupby(["route_id", "hour"], observed=True)["delay_seconds"]:
+        exact = np.percentile(group, [50, 90, 99], method="inverted_cdf")
+        approx = sketch.loc[(route, hour), ["p50", "p90", "p99"]].to_numpy()
+        worst = max(worst, np.abs(exact - approx).max())
+    if worst > bus_analysis.BIN_SECONDS / 2:
+        print(f"FAIL: Sketch percentiles are off by up to {worst} s")
+        return False
+
+    # 半分ずつ作ったスケッチを合わせると、全体から作ったものと同じになります
+    keys = [df["route_id"].to_numpy(), df["hour"].to_numpy()]
+    whole, first, second = DelaySketch(), DelaySketch(), DelaySketch()
+    whole.add(keys, df["delay_seconds"])
+    half = len(df) // 2
+    first.add([k[:half] for k in keys], df["delay_seconds"][:half])
+    second.add([k[half:] for k in keys], df["delay_seconds"][half:])
+    if not whole.summary().equals(first.merge(second).summary()):
+        print("FAIL: Merged sketches differ from one sketch over all events")
+        return False
+    codes, keys = bus_analysis.group_codes([np.array(["a", None, "a", "b"], dtype=object), np.array([1, 2, 1, 2])])
+    if codes.tolist() != [0, 1, 0, 2] or keys[0] != ("a", 1) or keys[2] != ("b", 2):
+        print(f"FAIL: group_codes with a NULL key gave {codes}, {keys}")
+        return False
+    print(f"SUCCESS: Max difference {worst:.1f} s over {len(sketch)} groups, merge matches")
+    return True
+
+
+def test_propagation(db_path):
+    print("Testing delay propagation...")
+    df = bus_analysis.load_bus_delays(db_path)
+    result = bus_analysis.propagation(df)
+    # 合成データは前の便の遅れを7割持ち越すので、強い正の相関が出るはずです
+    if not ((result["carry"] > 0.5).all() and (result["late_after_late"] > result["late_after_on_time"]).all()):
+        print(f"FAIL: Expected carried-over delays, got\n{result}")
+        return False
+
+    shuffled = df.sample(frac=1, random_state=0).sort_values(["route_id", "date"], kind="stable")
+    if (bus_analysis.propagation(shuffled)["carry"].abs() > 0.1).any():
+        print("FAIL: Shuffled timetables should show no carry-over")
+        return False
+    print(f"SUCCESS: carry {result['carry'].min():.2f}-{result['carry'].max():.2f} across {len(result)} routes")
+    return True
+
+
+def test_stream(tmpdir):
+    print("Testing streaming ingest and resume...")
+    path = os.path.join(tmpdir, "events.csv")
+    count = bus_stream.write_replay(path, routes=3, days=2)
+    db_path = os.path.join(tmpdir, "stream.db")
+
+    # 途中で落ちた場合: 書き込み前の分は位置も集計も残らないはずです
+    db = bus_stream.DelayIngest(db_path, flush_events=100, flush_seconds=3600)
+    for events, position in bus_stream.replay_file(path, batch_events=60):
+        db.add(events, path, position)
+        if position >= count // 2:
+            break
+    db.conn.close()
+
+    db = bus_stream.DelayIngest(db_path)
+    start = db.position(path)
+    bus_stream.ingest(db, bus_stream.replay_file(path, start), path)
+    stored = db.conn.execute("SELECT COUNT(*) FROM bus_delays").fetchone()[0]
+    if not 0 < start < count or stored != count or db.check_rollups():
+        print(f"FAIL: Resumed at {start}, stored {stored} of {count} events, rollups {db.check_rollups()[:3]}")
+        return False
+
+    # フィードから取り込んだ集計は、同じ出来事をファイルから取り込んだものと一致するはずです
+    server = fake_gtfs.serve(fake_gtfs.make_feed(routes=3, days=2))
+    feed_db = bus_stream.DelayIngest(os.path.join(tmpdir, "feed.db"))
+    bus_stream.ingest(feed_db, bus_stream.poll_feed(fake_gtfs.feed_url(server), batch_events=50), "feed")
+    server.shutdown()
+    if feed_db.hourly_summary() != db.hourly_summary() or feed_db.position("feed") != count:
+        print("FAIL: Feed rollups differ from the replayed file")
+        return False
+    print(f"SUCCESS: Resumed at {start} of {count} events, feed and file rollups match")
+    return True
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ok = (test_load(os.path.join(tmpdir, "bus.db"))
+              and test_sketch(os.path.join(tmpdir, "synthetic.db"))
+              and test_propagation(os.path.join(tmpdir, "synthetic.db"))
+              and test_stream(tmpdir))
+
+    if ok:
+        print("\nALL TESTS PASSED")
+    else:
+        print("\nTESTS FAILED")
@@ -0,0 +1,152 @@
+import os
+import tempfile
+import threading
+import time
+
+from daily_parser import parse_daily_page
+from weather_scraper import TokenBucket, WeatherAnalysis, WeatherScraper, backfill
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 保存済みページがある (都市, 府県番号, 地点番号) と月です
+FIXTURE_LOCATIONS = [("東京", "44", "47662"), ("那覇", "91", "47936"), ("札幌", "14", "47412")]
+FIXTURE_MONTHS = {"47662": (2025, 12), "47936": (2025, 2), "47412": (2026, 1)}
+
+
+def read_fixture(prec_no, block_no, year, month):
+    with open(os.path.join(FIXTURE_DIR, f"daily_s1_{block_no}_{year}{month:02d}.html"), encoding="utf-8") as f:
+        return f.read()
+
+
+class FixturePages:
+    """fetch_page stand-in that counts calls and can fail chosen pages."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, prec_no, block_no, year, month):
+        with self.lock:
+            self.calls += 1
+        if block_no in self.fail:
+            raise ConnectionError("simulated network failure")
+        return read_fixture(prec_no, block_no, year, month)
+
+
+def test_parse():
+    print("Testing fixture parsing...")
+    rows = parse_daily_page(read_fixture("44", "47662", 2025, 12), "東京", 2025, 12)
+    if len(rows) != 31 or rows[0][1] != "2025-12-01":
+        print(f"FAIL: Expected 31 rows from 2025-12-01, got {len(rows)}")
+        return False
+    # 記号つきの値は 0.0 ではなく NULL になります
+    rows = dict((r[1], r) for r in parse_daily_page(read_fixture("91", "47936", 2025, 2), "那覇", 2025, 2))
+    if rows["2025-02-03"][2] is not None or rows["2025-02-03"][5] is not None:
+        print(f"FAIL: '///' should give NULL max_temp and temp_diff, got {rows['2025-02-03']}")
+        return False
+    if rows["2025-02-15"][3] is not None or rows["2025-02-02"][4] is not None:
+        print(f"FAIL: ']' and '--' should give NULL, got {rows['2025-02-15']}, {rows['2025-02-02']}")
+        return False
+    print(f"SUCCESS: Parsed 31 + {len(rows)} rows, markers stored as NULL")
+    return True
+
+
+def test_token_bucket():
+    print("Testing shared token bucket...")
+    bucket = TokenBucket(rate=20, capacity=1)
+    starts = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(5):
+            bucket.acquire()
+            with lock:
+                starts.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    begin = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - begin
+
+    # 20回 / 20 per sec で、最初の1回を除き約0.95秒かかるはずです
+    if elapsed < 0.9:
+        print(f"FAIL: 20 acquisitions took only {elapsed:.2f}s")
+        return False
+    print(f"SUCCESS: 20 acquisitions across 4 workers took {elapsed:.2f}s")
+    return True
+
+
+def test_resume(db_path):
+    print("Testing resume after a failed run...")
+    db = WeatherAnalysis(db_path)
+    fast = TokenBucket(rate=1000, capacity=10)
+
+    # 1回目: 那覇だけ失敗させます
+    for location in FIXTURE_LOCATIONS:
+        db.enqueue_jobs([location], [FIXTURE_MONTHS[location[2]]])
+    pages = FixturePages(fail={"47936"})
+    result = backfill(db, WeatherScraper(fast, pages), [], [])
+    if pages.calls != 3 or result["failed"] != 1:
+        print(f"FAIL: First run fetched {pages.calls} pages, results {result}")
+        return False
+
+    # 2回目: 失敗した那覇と、まだ途中の札幌（1月は18日分）だけを取りに行くはずです
+    pages = FixturePages()
+    result = backfill(db, WeatherScraper(fast, pages), [], [])
+    if pages.calls != 2 or result["done"] != 2:
+        print(f"FAIL: Second run fetched {pages.calls} pages, results {result}")
+        return False
+
+    # 3回目: 東京・那覇は全日そろったので、札幌だけになります
+    pages = FixturePages()
+    backfill(db, WeatherScraper(fast, pages), [], [])
+    count = db.conn.execute("SELECT COUNT(*) FROM daily_weather").fetchone()[0]
+    if pages.calls != 1 or count != 31 + 28 + 18:
+        print(f"FAIL: Third run fetched {pages.calls} pages, {count} rows stored")
+        return False
+
+    # ジョブが消えても、daily_weather に全日そろっている月はページを取りません
+    db.conn.execute("DELETE FROM scrape_jobs WHERE city = '東京'")
+    db.conn.commit()
+    pages = FixturePages()
+    result = backfill(db, WeatherScraper(fast, pages), [FIXTURE_LOCATIONS[0]], [(2025, 12)])
+    if pages.calls != 1 or result["skipped"] != 1:
+        print(f"FAIL: Expected only the pending 札幌 month, got {pages.calls} pages, {result}")
+        return False
+
+    # 古いパーサが欠測を 0.0 で保存した行は、--refetch で取得し直すと NULL に戻ります
+    db.conn.execute("UPDATE daily_weather SET max_temp = 0.0, temp_diff = 0.0 - min_temp "
+                    "WHERE city = '那覇' AND date = '2025-02-03'")
+    db.conn.commit()
+    pages = FixturePages()
+    result = backfill(db, WeatherScraper(fast, pages), [FIXTURE_LOCATIONS[1]], [(2025, 2)], refetch=True)
+    row = db.conn.execute("SELECT max_temp, temp_diff FROM daily_weather "
+                          "WHERE city = '那覇' AND date = '2025-02-03'").fetchone()
+    # 途中の札幌の月も pending のままなので一緒に取りに行きます
+    if pages.calls != 2 or result["done"] != 2 or row != (None, None):
+        print(f"FAIL: Refetch fetched {pages.calls} pages, {result}, placeholder row is now {row}")
+        return False
+
+    # トリガーで更新した集計表は、全件を集計し直した結果と一致するはずです
+    mismatches = db.check_stats()
+    if mismatches:
+        print(f"FAIL: daily_weather_stats differs from a full recompute for {mismatches}")
+        return False
+
+    print(f"SUCCESS: Resumed failed month, skipped complete ones ({count} rows)")
+    return True
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ok = (test_parse() and test_token_bucket()
+              and test_resume(os.path.join(tmpdir, "weather.db")))
+
+    if ok:
+        print("\nALL TESTS PASSED")
+    else:
+        print("\nTESTS FAILED")
@@ -0,0 +1,403 @@
+import argparse
+import calendar
+import math
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from daily_parser import parse_daily_page
+
+DAILY_URL = ("https://www.data.jma.go.jp/obd/stats/etrn/view/daily_s1.php"
+             "?prec_no={prec_no}&block_no={block_no}&year={year}&month={month}&day=&view=")
+
+# 元の time.sleep(1.5) と同じ平均間隔（1.5秒に1リクエスト）をワーカー全体で守ります
+RATE = 1 / 1.5
+BURST = 1
+MAX_WORKERS = 4
+TIMEOUT = 10
+MAX_ATTEMPTS = 3        # これ以上失敗したジョブは再実行しません
+
+# daily_weather_stats.rain の値と表示名です
+CONDITIONS = {1: "降水あり", 0: "降水なし"}
+
+# 日ごとの行が増減・変更されるたびに、都市・月・降水の有無ごとの件数・合計・二乗和を更新します。
+# INSERT OR IGNORE で無視された重複行や、値の変わらない UPSERT ではトリガーは動きません
+STATS_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS daily_weather_stats_insert
+AFTER INSERT ON daily_weather WHEN NEW.temp_diff IS NOT NULL
+BEGIN
+    INSERT INTO daily_weather_stats (city, month, rain, n, sum_diff, sumsq_diff)
+    VALUES (NEW.city, substr(NEW.date, 1, 7), COALESCE(NEW.precip, 0) > 0,
+            1, NEW.temp_diff, NEW.temp_diff * NEW.temp_diff)
+    ON CONFLICT (city, month, rain) DO UPDATE SET
+        n = n + 1,
+        sum_diff = sum_diff + excluded.sum_diff,
+        sumsq_diff = sumsq_diff + excluded.sumsq_diff;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_weather_stats_delete
+AFTER DELETE ON daily_weather WHEN OLD.temp_diff IS NOT NULL
+BEGIN
+    UPDATE daily_weather_stats SET
+        n = n - 1,
+        sum_diff = sum_diff - OLD.temp_diff,
+        sumsq_diff = sumsq_diff - OLD.temp_diff * OLD.temp_diff
+    WHERE city = OLD.city AND month = substr(OLD.date, 1, 7) AND rain = (COALESCE(OLD.precip, 0) > 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_weather_stats_update
+AFTER UPDATE OF city, date, precip, temp_diff ON daily_weather
+BEGIN
+    UPDATE daily_weather_stats SET
+        n = n - 1,
+        sum_diff = sum_diff - OLD.temp_diff,
+        sumsq_diff = sumsq_diff - OLD.temp_diff * OLD.temp_diff
+    WHERE OLD.temp_diff IS NOT NULL
+      AND city = OLD.city AND month = substr(OLD.date, 1, 7) AND rain = (COALESCE(OLD.precip, 0) > 0);
+    INSERT INTO daily_weather_stats (city, month, rain, n, sum_diff, sumsq_diff)
+    SELECT NEW.city, substr(NEW.date, 1, 7), COALESCE(NEW.precip, 0) > 0,
+           1, NEW.temp_diff, NEW.temp_diff * NEW.temp_diff
+    WHERE NEW.temp_diff IS NOT NULL
+    ON CONFLICT (city, month, rain) DO UPDATE SET
+        n = n + 1,
+        sum_diff = sum_diff + excluded.sum_diff,
+        sumsq_diff = sumsq_diff + excluded.sumsq_diff;
+END;
+"""
+
+# 全行から集計し直すときの SELECT です（再構築と整合性チェックで共用します）
+STATS_RECOMPUTE = """
+SELECT city, substr(date, 1, 7) AS month, COALESCE(precip, 0) > 0 AS rain,
+       COUNT(*), SUM(temp_diff), SUM(temp_diff * temp_diff)
+FROM daily_weather
+WHERE temp_diff IS NOT NULL
+GROUP BY city, month, rain
+"""
+
+# 取得し直したページの値で既存の行を置き換えます（値が同じ行は書き込みません）。
+# 以前の取得で欠測が 0.0 として保存された行も、これで NULL に直ります
+UPSERT_DAILY = """
+INSERT INTO daily_weather (city, date, max_temp, min_temp, precip, temp_diff) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (city, date) DO UPDATE SET
+    max_temp = excluded.max_temp, min_temp = excluded.min_temp,
+    precip = excluded.precip, temp_diff = excluded.temp_diff
+WHERE max_temp IS NOT excluded.max_temp OR min_temp IS NOT excluded.min_temp
+   OR precip IS NOT excluded.precip OR temp_diff IS NOT excluded.temp_diff
+"""
+
+# (都市名, 府県番号, 地点番号)
+LOCATIONS = [
+    ("東京", "44", "47662"),
+    ("大阪", "62", "47772"),
+    ("福岡", "82", "47807"),
+    ("札幌", "14", "47412"),
+    ("那覇", "91", "47936"),
+]
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` saved up."""
+
+    def __init__(self, rate=RATE, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            # 待つ間はロックを放し、他のワーカーも残り時間を計算できるようにします
+            time.sleep(wait)
+
+
+def month_range(start, end):
+    """[(year, month), ...] from start to end inclusive; both are (year, month)."""
+    year, month = start
+    months = []
+    while (year, month) <= tuple(end):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class WeatherAnalysis:
+    def __init__(self, db_name="weather_hypothesis.db"):
+        self.conn = sqlite3.connect(db_name)
+        self._create_table()
+
+    def _create_table(self):
+        query = """
+        CREATE TABLE IF NOT EXISTS daily_weather (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city TEXT,
+            date TEXT,
+            max_temp REAL,
+            min_temp REAL,
+            precip REAL,
+            temp_diff REAL,
+            UNIQUE(city, date)
+        )
+        """
+        self.conn.execute(query)
+
+        # 取得ジョブの待ち行列です。クラッシュしても pending/failed から再開できます
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_jobs (
+            city TEXT,
+            prec_no TEXT,
+            block_no TEXT,
+            year INTEGER,
+            month INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (city, year, month)
+        )
+        """)
+
+        # 仮説検証用の集計表です。既存の DB に初めて作るときは全行から組み立てます
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_weather_stats'").fetchone()
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_weather_stats (
+            city TEXT,
+            month TEXT,
+            rain INTEGER,
+            n INTEGER NOT NULL,
+            sum_diff REAL NOT NULL,
+            sumsq_diff REAL NOT NULL,
+            PRIMARY KEY (city, month, rain)
+        ) WITHOUT ROWID
+        """)
+        self.conn.executescript(STATS_TRIGGERS)
+        if not exists:
+            self.rebuild_stats()
+        self.conn.commit()
+
+    def save_data(self, data_list):
+        query = "INSERT OR IGNORE INTO daily_weather (city, date, max_temp, min_temp, precip, temp_diff) VALUES (?, ?, ?, ?, ?, ?)"
+        self.conn.executemany(query, data_list)
+        self.conn.commit()
+
+    def rebuild_stats(self):
+        """Recomputes daily_weather_stats from every row of daily_weather."""
+        with self.conn:
+            self.conn.execute("DELETE FROM daily_weather_stats")
+            self.conn.execute(
+                "INSERT INTO daily_weather_stats (city, month, rain, n, sum_diff, sumsq_diff) " + STATS_RECOMPUTE)
+
+    def check_stats(self, tolerance=1e-6):
+        """Compares daily_weather_stats with a full recompute; returns the keys that differ."""
+        stored = {row[:3]: row[3:] for row in self.conn.execute(
+            "SELECT city, month, rain, n, sum_diff, sumsq_diff FROM daily_weather_stats WHERE n > 0")}
+        fresh = {row[:3]: row[3:] for row in self.conn.execute(STATS_RECOMPUTE)}
+
+        mismatches = []
+        for key in stored.keys() | fresh.keys():
+            a, b = stored.get(key), fresh.get(key)
+            if a is None or b is None or a[0] != b[0] or any(
+                    abs(x - y) > tolerance * max(1.0, abs(y)) for x, y in zip(a[1:], b[1:])):
+                mismatches.append(key)
+        return sorted(mismatches)
+
+    def condition_summary(self, cities=None):
+        """
+        Days, mean and std of temp_diff per city and precipitation condition,
+        read from daily_weather_stats (O(groups), not O(rows)).
+        Returns (city, condition, days, avg_diff, std_diff) tuples.
+        """
+        query = "SELECT city, rain, SUM(n), SUM(sum_diff), SUM(sumsq_diff) FROM daily_weather_stats"
+        params = []
+        if cities:
+            query += f" WHERE city IN ({','.join('?' for _ in cities)})"
+            params.extend(cities)
+        query += " GROUP BY city, rain HAVING SUM(n) > 0 ORDER BY city, rain DESC"
+
+        result = []
+        for city, rain, n, total, sumsq in self.conn.execute(query, params):
+            mean = total / n
+            # 標本分散（n-1 で割る）。二乗和から求めるので丸め誤差で負にならないようにします
+            std = math.sqrt(max(sumsq - total * total / n, 0.0) / (n - 1)) if n > 1 else None
+            result.append((city, CONDITIONS[rain], n, mean, std))
+        return result
+
+    def is_month_complete(self, city, year, month):
+        """True if daily_weather already has a row for every day of the month."""
+        days = calendar.monthrange(year, month)[1]
+        count = self.conn.execute(
+            "SELECT COUNT(*) FROM daily_weather WHERE city = ? AND date BETWEEN ? AND ?",
+            (city, f"{year}-{month:02d}-01", f"{year}-{month:02d}-{days:02d}"),
+        ).fetchone()[0]
+        return count >= days
+
+    def enqueue_jobs(self, locations, months):
+        """Adds a pending job per (location, month); existing jobs keep their status."""
+        self.conn.executemany("""
+        INSERT OR IGNORE INTO scrape_jobs (city, prec_no, block_no, year, month)
+        VALUES (?, ?, ?, ?, ?)
+        """, [(city, prec_no, block_no, year, month)
+              for city, prec_no, block_no in locations for year, month in months])
+        self.conn.commit()
+
+    def requeue_jobs(self, locations, months):
+        """Marks each (location, month) pending again with its attempts reset, even if done."""
+        self.enqueue_jobs(locations, months)
+        self.conn.executemany("""
+        UPDATE scrape_jobs SET status = 'pending', attempts = 0, updated_at = CURRENT_TIMESTAMP
+        WHERE city = ? AND year = ? AND month = ?
+        """, [(city, year, month) for city, _, _ in locations for year, month in months])
+        self.conn.commit()
+
+    def pending_jobs(self, max_attempts=MAX_ATTEMPTS):
+        """Jobs that still need fetching, oldest month first."""
+        return self.conn.execute("""
+        SELECT city, prec_no, block_no, year, month FROM scrape_jobs
+        WHERE status != 'done' AND attempts < ?
+        ORDER BY year, month, city
+        """, (max_attempts,)).fetchall()
+
+    def mark_job(self, city, year, month, status, commit=True):
+        self.conn.execute("""
+        UPDATE scrape_jobs
+        SET status = ?, attempts = attempts + ?, updated_at = CURRENT_TIMESTAMP
+        WHERE city = ? AND year = ? AND month = ?
+        """, (status, 1 if status == "failed" else 0, city, year, month))
+        if commit:
+            self.conn.commit()
+
+    def save_month(self, city, year, month, data_list):
+        """Stores a fetched month (replacing changed rows) and updates its job in the same transaction."""
+        with self.conn:
+            self.conn.executemany(UPSERT_DAILY, data_list)
+            # 途中の月（今月など）は pending のまま残し、次の実行で残りの日を取りに行きます
+            status = "done" if self.is_month_complete(city, year, month) else "pending"
+            self.mark_job(city, year, month, status, commit=False)
+
+
+class WeatherScraper:
+    """
+    Fetches daily_s1 pages through a shared TokenBucket.
+
+    `fetch_page(prec_no, block_no, year, month)` returns the page's HTML; the default
+    downloads it from DAILY_URL. Pass a different one to read saved fixtures instead.
+    """
+
+    def __init__(self, limiter=None, fetch_page=None):
+        self.limiter = limiter or TokenBucket()
+        self.fetch_page = fetch_page or self._download
+        self.session = requests.Session()
+
+    def _download(self, prec_no, block_no, year, month):
+        url = DAILY_URL.format(prec_no=prec_no, block_no=block_no, year=year, month=month)
+        response = self.session.get(url, timeout=TIMEOUT)
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        return response.text
+
+    def fetch_month(self, city_name, prec_no, block_no, year, month):
+        """Returns the month's rows, or None if the page could not be fetched or parsed."""
+        print(f"データ取得中: {city_name} ({year}/{month})")
+
+        try:
+            self.limiter.acquire() # サーバ負荷配慮（全ワーカー共通の上限）
+            html = self.fetch_page(prec_no, block_no, year, month)
+            return parse_daily_page(html, city_name, year, month)
+        except Exception as e:
+            # ここでのエラーは全体を止めないように表示だけする
+            print(f"警告: {city_name} の取得中に問題が発生しました ({e})")
+            return None
+
+
+def backfill(db, scraper, locations, months, max_workers=MAX_WORKERS, refetch=False):
+    """
+    Fetches every (location, month) that is not already complete in daily_weather.
+    With refetch=True the given months are fetched again even if complete, and their
+    rows are replaced (for databases written before missing values were stored as NULL).
+
+    Jobs are kept in scrape_jobs, so an interrupted run picks up where it stopped.
+    Pages are fetched by a worker pool; rows are written on this thread only.
+    Returns {"done", "skipped", "failed"} counts.
+    """
+    if refetch:
+        db.requeue_jobs(locations, months)
+    else:
+        db.enqueue_jobs(locations, months)
+
+    # すでに全日そろっている月は取得せずに完了扱いにします
+    jobs = []
+    skipped = 0
+    for city, prec_no, block_no, year, month in db.pending_jobs():
+        if not refetch and db.is_month_complete(city, year, month):
+            db.mark_job(city, year, month, "done")
+            skipped += 1
+        else:
+            jobs.append((city, prec_no, block_no, year, month))
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(scraper.fetch_month, *job): job for job in jobs}
+        for future in as_completed(futures):
+            city, _, _, year, month = futures[future]
+            data = future.result()
+            if data is None:
+                db.mark_job(city, year, month, "failed")
+                failed += 1
+            else:
+                db.save_month(city, year, month, data)
+                done += 1
+
+    return {"done": done, "skipped": skipped, "failed": failed}
+
+
+def _year_month(text):
+    year, month = text.split("-")
+    return int(year), int(month)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfills daily_weather from JMA daily_s1 pages")
+    parser.add_argument("--db", default="weather_hypothesis.db")
+    parser.add_argument("--start", type=_year_month, default=(2025, 12), help="YYYY-MM")
+    parser.add_argument("--end", type=_year_month, default=(2025, 12), help="YYYY-MM")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="max requests per second")
+    parser.add_argument("--refetch", action="store_true",
+                        help="fetch the months again even if complete and replace their rows "
+                             "(fixes 0.0 placeholders stored by the old parser)")
+    parser.add_argument("--rebuild-stats", action="store_true", help="recompute daily_weather_stats and exit")
+    parser.add_argument("--check-stats", action="store_true", help="compare daily_weather_stats with a full recompute and exit")
+    args = parser.parse_args()
+
+    db = WeatherAnalysis(args.db)
+    if args.rebuild_stats:
+        db.rebuild_stats()
+        print("daily_weather_stats を再構築しました")
+        return
+    if args.check_stats:
+        mismatches = db.check_stats()
+        if mismatches:
+            print(f"不一致 {len(mismatches)} 件: {mismatches[:10]}")
+            raise SystemExit(1)
+        print("daily_weather_stats は全件集計と一致しています")
+        return
+
+    scraper = WeatherScraper(TokenBucket(args.rate))
+    result = backfill(db, scraper, LOCATIONS, month_range(args.start, args.end), args.workers, args.refetch)
+    print(f"完了 {result['done']} / スキップ {result['skipped']} / 失敗 {result['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import flet as ft
-from weather_service import fetch_area_list, fetch_weather
+from weather_service import fetch_area_list, fetch_weather, load_area_snapshot, save_area_snapshot
 import datetime
 
 def main(page: ft.Page):
@@ -7,7 +7,6 @@ def main(page: ft.Page):
     page.theme_mode = ft.ThemeMode.LIGHT
     
     # Store area data
-    area_data = {}
     centers = {}
     offices = {}
     
@@ -133,30 +132,49 @@ def main(page: ft.Page):
         
         weather_list.update()
 
-    def load_area_data():
-        nonlocal area_data, centers, offices
+    def render_areas():
+        """Fills the rail from `centers` and shows the selected center's offices."""
+        # Populate Rail
+        rail.destinations = [
+            ft.NavigationRailDestination(
+                icon=ft.Icons.LOCATION_CITY, 
+                selected_icon=ft.Icons.LOCATION_CITY_OUTLINED, 
+                label=center["name"]
+            ) for code, center in centers.items()
+        ]
+
+        # Initial update (keep the current selection if it still exists)
+        if centers:
+            index = min(rail.selected_index or 0, len(centers) - 1)
+            rail.selected_index = index
+            update_weather_list(index)
+
+        page.update()
+
+    def refresh_area_data():
+        """Downloads area.json in the background and re-renders only if it changed."""
+        nonlocal centers, offices
         data = fetch_area_list()
-        if data:
-            area_data = data
-            centers = data.get("centers", {})
-            offices = data.get("offices", {})
-            
-            # Populate Rail
-            rail.destinations = [
-                ft.NavigationRailDestination(
-                    icon=ft.Icons.LOCATION_CITY, 
-                    selected_icon=ft.Icons.LOCATION_CITY_OUTLINED, 
-                    label=center["name"]
-                ) for code, center in centers.items()
-            ]
-            
-            # Initial update
-            if centers:
-                update_weather_list(0)
-            
-            page.update()
-        else:
-            page.add(ft.Text("Failed to load area list.", color="red"))
+        if not data:
+            if not centers:
+                page.add(ft.Text("Failed to load area list.", color="red"))
+            return
+
+        snapshot = save_area_snapshot(data)
+        if (snapshot["centers"], snapshot["offices"]) != (centers, offices):
+            centers = snapshot["centers"]
+            offices = snapshot["offices"]
+            render_areas()
+
+    def load_area_data():
+        nonlocal centers, offices
+        # Render straight from the local snapshot; the network refresh runs in the background
+        snapshot = load_area_snapshot()
+        if snapshot:
+            centers = snapshot["centers"]
+            offices = snapshot["offices"]
+            render_areas()
+        page.run_thread(refresh_area_data)
 
     # Layout
     page.add(
@@ -1,14 +1,59 @@
 import requests
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 AREA_URL = "http://www.jma.go.jp/bosai/common/const/area.json"
 FORECAST_BASE_URL = "https://www.jma.go.jp/bosai/forecast/data/forecast/"
 
+TIMEOUT = 10            # 1リクエストあたりのタイムアウト（秒）
+MAX_RETRIES = 3         # 接続エラー・5xx のときの再試行回数
+BACKOFF = 0.5           # 再試行の待ち時間（0.5, 1, 2 ... 秒）
+MAX_WORKERS = 8         # fetch_many の同時接続数
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# 起動時にすぐ描画するための centers/offices だけの縮小版 area.json です
+SNAPSHOT_PATH = "area_snapshot.json"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Returns the shared keep-alive session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # fetch_many の全ワーカーが接続を使い回せるようにプールを広げます
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=MAX_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+def _get(url):
+    """GETs a URL on the shared session, retrying with exponential backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = get_session().get(url, timeout=TIMEOUT)
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                response.raise_for_status()
+                return response
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+        time.sleep(BACKOFF * 2 ** attempt)
+
+
 def fetch_area_list():
     """Fetches the list of areas from the JMA API."""
     try:
-        response = requests.get(AREA_URL)
-        response.raise_for_status()
+        response = _get(AREA_URL)
         return response.json()
     except requests.RequestException as e:
         print(f"Error fetching area list: {e}")
@@ -18,9 +63,49 @@ def fetch_weather(area_code):
     """Fetches the weather forecast for a specific area code."""
     url = f"{FORECAST_BASE_URL}{area_code}.json"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        response = _get(url)
         return response.json()
     except requests.RequestException as e:
         print(f"Error fetching weather for {area_code}: {e}")
         return None
+
+def fetch_many(area_codes, max_workers=MAX_WORKERS):
+    """
+    Fetches forecasts for many area codes concurrently.
+    Returns a dict of area_code -> forecast data (None on failure).
+    """
+    area_codes = list(area_codes)
+    if not area_codes:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(area_codes))) as pool:
+        return dict(zip(area_codes, pool.map(fetch_weather, area_codes)))
+
+def compact_area_list(data):
+    """Keeps only what the UI needs: center names/children and office names/parents."""
+    return {
+        "centers": {
+            code: {"name": center["name"], "children": center.get("children", [])}
+            for code, center in data.get("centers", {}).items()
+        },
+        "offices": {
+            code: {"name": office["name"], "parent": office.get("parent")}
+            for code, office in data.get("offices", {}).items()
+        },
+    }
+
+def load_area_snapshot(path=SNAPSHOT_PATH):
+    """Loads the compact area snapshot, or None if it is missing or broken."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_area_snapshot(data, path=SNAPSHOT_PATH):
+    """Writes the compact form of an area.json dict and returns it."""
+    snapshot = compact_area_list(data)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return snapshot
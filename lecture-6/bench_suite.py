@@ -0,0 +1,225 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import database
+import fake_jma
+import main as app
+import weather_service
+from benchmark import _fill_history, _fresh_db
+
+# 保存済みの基準値です（--save-baseline で更新します）
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# 基準値からこの割合以上悪くなったら失敗にします
+TOLERANCE = 0.5
+
+# ミリ秒の指標はこれ以下の差を誤差として扱います（数μsの問い合わせが揺れても失敗にしません）
+MIN_DELTA_MS = 0.05
+
+# 指標ごとに大きいほど良いかどうか
+HIGHER_IS_BETTER = {
+    "fetch_offices_per_s": True,
+    "ingest_rows_per_s": True,
+    "query_10k_ms": False,
+    "query_1m_ms": False,
+    "tile_expand_ms": False,
+}
+
+
+def _query_metric(history):
+    """10_000 -> "query_10k_ms", 1_000_000 -> "query_1m_ms"."""
+    if history >= 1_000_000:
+        return f"query_{history // 1_000_000}m_ms"
+    return f"query_{history // 1000}k_ms"
+
+
+def _median_ms(func, calls):
+    """Median wall time of `calls` calls to func(i), in milliseconds."""
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+# 各指標は何回か測って最良値を使い、ばらつきを抑えます
+ROUNDS = 3
+
+
+def bench_fetch(server, offices, rounds=ROUNDS):
+    """Offices fetched per second by fetch_many against the fake server, cache off."""
+    codes = list(offices)
+    best = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        results = weather_service.fetch_many(codes)
+        elapsed = time.perf_counter() - start
+        if len(results) != len(codes) or not all(results.values()):
+            raise RuntimeError("fetch_many returned missing forecasts")
+        best = max(best, len(codes) / elapsed)
+    return best
+
+
+def bench_ingest(tmpdir, offices, publications=6, rounds=ROUNDS):
+    """Rows per second written by save_forecast_report for successive publications."""
+    start_at = datetime.datetime(2025, 1, 1, 5, tzinfo=fake_jma.JST)
+    # 発表ごとに内容が変わる文書を先に作り、書き込みだけを計測します
+    docs = [
+        (code, fake_jma.make_forecast(code, report, seed=f"{code}{report}"))
+        for report in (start_at + datetime.timedelta(hours=6 * k) for k in range(publications))
+        for code in offices
+    ]
+    best = 0.0
+    for k in range(rounds):
+        _fresh_db(tmpdir, f"ingest_{k}.db")
+        rows = 0
+        start = time.perf_counter()
+        for code, weather_data in docs:
+            rows += database.save_forecast_report(code, code, weather_data)
+        best = max(best, rows / (time.perf_counter() - start))
+        database.close_connection()
+    return best
+
+
+def bench_query(tmpdir, history, calls):
+    """Median latency of get_specific_dates_forecast over `history` stored rows."""
+    _fresh_db(tmpdir, f"query_{history}.db")
+    _fill_history(history)
+    dates = ["2025-01-01", "2025-01-02", "2025-01-03"]
+    codes = fake_jma.office_codes()
+    result = min(_median_ms(lambda i: database.get_specific_dates_forecast(codes[i % len(codes)], dates), calls)
+                 for _ in range(ROUNDS))
+    database.close_connection()
+    return result
+
+
+def expand_tile(code, name):
+    """What opening a tile does off the UI thread: fetch, store, read back, build controls."""
+    weather_data = weather_service.fetch_weather(code)
+    database.save_forecast_report(code, name, weather_data)
+    dates = app.target_dates()
+    forecast_map = {item["date"]: item["weather"]
+                    for item in database.get_specific_dates_forecast(code, dates)}
+    return app.build_forecast_controls(dates, forecast_map)
+
+
+def bench_tile_expand(tmpdir, offices, rounds=ROUNDS):
+    """Median time for one tile expansion, end to end, against the fake server."""
+    codes = list(offices)
+    best = None
+    for k in range(rounds):
+        _fresh_db(tmpdir, f"tiles_{k}.db")
+        median = _median_ms(lambda i: expand_tile(codes[i], offices[codes[i]]), len(codes))
+        best = median if best is None else min(best, median)
+        database.close_connection()
+    return best
+
+
+def run_suite(offices=58, calls=500, latency=0.0, histories=(10_000, 1_000_000)):
+    """Runs every benchmark on temp databases and a local fake JMA server; returns metrics."""
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fixtures = os.path.join(tmpdir, "jma")
+        area_list = fake_jma.write_fixtures(fixtures)
+        names = {code: office["name"] for code, office in area_list["offices"].items()}
+        names = dict(list(names.items())[:offices])
+
+        server = fake_jma.serve(fixtures, latency=latency)
+        fake_jma.point_service_at(weather_service, server)
+        weather_service.CACHE_DIR = None   # 毎回ネットワーク経路を通します
+        try:
+            metrics["fetch_offices_per_s"] = bench_fetch(server, names)
+            metrics["ingest_rows_per_s"] = bench_ingest(tmpdir, names)
+            for history in histories:
+                metrics[_query_metric(history)] = bench_query(tmpdir, history, calls)
+            metrics["tile_expand_ms"] = bench_tile_expand(tmpdir, names)
+        finally:
+            server.shutdown()
+    return metrics
+
+
+def compare(metrics, baseline, tolerance=TOLERANCE):
+    """Returns [(name, value, base, change, regressed)] for metrics present in the baseline."""
+    rows = []
+    for name, value in metrics.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, value, None, None, False))
+            continue
+        # 悪化した割合を正の値で表します
+        if HIGHER_IS_BETTER.get(name, False):
+            change = (base - value) / base
+            regressed = change > tolerance
+        else:
+            change = (value - base) / base
+            regressed = change > tolerance and value - base > MIN_DELTA_MS
+        rows.append((name, value, base, change, regressed))
+    return rows
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(metrics, path=BASELINE_PATH):
+    data = {
+        "machine": f"{platform.system()} {platform.machine()} / Python {platform.python_version()}",
+        "metrics": {name: round(value, 4) for name, value in metrics.items()},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weather pipeline benchmarks with a regression check")
+    parser.add_argument("--offices", type=int, default=58)
+    parser.add_argument("--calls", type=int, default=500, help="query calls per history size")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake server latency in seconds")
+    parser.add_argument("--quick", action="store_true", help="skip the 1M-row history")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    histories = (10_000,) if args.quick else (10_000, 1_000_000)
+    metrics = run_suite(args.offices, args.calls, args.latency, histories)
+
+    if args.save_baseline:
+        save_baseline(metrics, args.baseline)
+        for name, value in metrics.items():
+            print(f"{name:<22} {value:>12,.3f}")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    rows = compare(metrics, baseline["metrics"] if baseline else {}, args.tolerance)
+    failed = False
+    for name, value, base, change, regressed in rows:
+        if base is None:
+            print(f"{name:<22} {value:>12,.3f}   (no baseline)")
+            continue
+        status = "FAIL" if regressed else "ok"
+        print(f"{name:<22} {value:>12,.3f}   baseline {base:>12,.3f}   {-change:>+7.1%}  {status}")
+        failed = failed or regressed
+
+    if failed:
+        print(f"FAIL: regression beyond {args.tolerance:.0%} of the baseline")
+        return 1
+    print("ALL BENCHMARKS WITHIN BASELINE" if baseline else "No baseline yet; run with --save-baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+import argparse
+import datetime
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import database
+import fake_jma
+import instrumentation
+import weather_service
+
+
+def _legacy_save_area(area_code, area_name):
+    """The old save_area: one connect/commit/close per call."""
+    conn = sqlite3.connect(database.DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+    INSERT OR REPLACE INTO areas (area_code, area_name)
+    VALUES (?, ?)
+    """, (area_code, area_name))
+    conn.commit()
+    conn.close()
+
+
+def _legacy_save_weather_forecast(area_code, forecast_date, weather):
+    """The old save_weather_forecast: one connect/commit/close per call."""
+    conn = sqlite3.connect(database.DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+    INSERT INTO weather_forecasts (area_code, forecast_date, weather, fetched_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    """, (area_code, forecast_date, weather))
+    conn.commit()
+    conn.close()
+
+
+def _legacy_get_specific_dates_forecast(area_code, dates):
+    """The old read path: fresh connection per call."""
+    conn = sqlite3.connect(database.DB_NAME)
+    placeholders = ','.join('?' for _ in dates)
+    rows = conn.execute(f"""
+    SELECT forecast_date, weather
+    FROM weather_forecasts
+    WHERE area_code = ? AND forecast_date IN ({placeholders})
+    ORDER BY fetched_at DESC
+    """, (area_code, *dates)).fetchall()
+    conn.close()
+    return rows
+
+
+def _rate(func, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    elapsed = time.perf_counter() - start
+    return calls / elapsed
+
+
+def _fresh_db(tmpdir, name):
+    """Points database at a new file in tmpdir and creates the schema."""
+    database.close_connection()
+    database.DB_NAME = os.path.join(tmpdir, name)
+    database.init_db()
+
+
+def bench_connection(calls):
+    """Calls per second of the write/read paths, connect-per-call vs pooled."""
+    dates = ["2025-01-01", "2025-01-02", "2025-01-03"]
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _fresh_db(tmpdir, "legacy.db")
+        # 旧方式は既定の journal_mode=DELETE に戻して計測します
+        database.close_connection()
+        conn = sqlite3.connect(database.DB_NAME)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        results.append(("save (before)", _rate(
+            lambda i: _legacy_save_weather_forecast("130000", dates[i % 3], "晴れ"), calls)))
+        results.append(("read (before)", _rate(
+            lambda i: _legacy_get_specific_dates_forecast("130000", dates), calls)))
+
+        _fresh_db(tmpdir, "pooled.db")
+        results.append(("save (after)", _rate(
+            lambda i: database.save_weather_forecast("130000", dates[i % 3], "晴れ"), calls)))
+        results.append(("read (after)", _rate(
+            lambda i: database.get_specific_dates_forecast("130000", dates), calls)))
+        database.close_connection()
+
+    for label, rate in results:
+        print(f"{label:<16} {rate:>12,.0f} calls/s")
+    return results
+
+
+def bench_ingest(offices):
+    """Time to ingest one forecast document per office, per-row vs batched."""
+    reports = [(code, fake_jma.make_forecast(code)) for code in fake_jma.office_codes(offices)]
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _fresh_db(tmpdir, "per_row.db")
+        # 旧方式（1行ごとに接続とコミット、journal_mode=DELETE）をそのまま再現します
+        database.close_connection()
+        conn = sqlite3.connect(database.DB_NAME)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        start = time.perf_counter()
+        for code, weather_data in reports:
+            _legacy_save_area(code, code)
+            for _, date_str, weather in database.forecast_rows(weather_data):
+                _legacy_save_weather_forecast(code, date_str, weather)
+        results.append(("per-row", time.perf_counter() - start))
+
+        _fresh_db(tmpdir, "batched.db")
+        start = time.perf_counter()
+        for code, weather_data in reports:
+            database.save_forecast_report(code, code, weather_data)
+        results.append(("batched", time.perf_counter() - start))
+        database.close_connection()
+
+    for label, elapsed in results:
+        print(f"{label:<16} {elapsed * 1000:>10.1f} ms for {offices} offices")
+    return results
+
+
+def _fill_history(rows):
+    """Appends `rows` synthetic history rows spread over 58 offices and 30 dates."""
+    # 100万行でも数秒で済むように、行は SQLite の中で生成します
+    with database.transaction() as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS fill_codes (i INTEGER PRIMARY KEY, code TEXT)")
+        conn.execute("DELETE FROM fill_codes")
+        conn.executemany("INSERT INTO fill_codes VALUES (?, ?)", enumerate(fake_jma.office_codes()))
+        conn.execute("""
+        INSERT INTO weather_forecasts (area_code, forecast_date, weather, fetched_at, valid_to)
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?)
+        SELECT code, forecast_date, '晴れ', fetched_at, fetched_at
+        FROM (
+            SELECT c.code,
+                   printf('2025-01-%02d', n.i % 30 + 1) AS forecast_date,
+                   printf('2025-01-01 %02d:%02d:%02d', n.i / 3600 % 24, n.i / 60 % 60, n.i % 60) AS fetched_at
+            FROM n JOIN fill_codes c ON c.i = n.i % 58
+        )
+        """, (rows,))
+        conn.execute("""
+        INSERT OR REPLACE INTO latest_forecasts (area_code, forecast_date, weather, fetched_at)
+        SELECT area_code, forecast_date, weather, MAX(fetched_at)
+        FROM weather_forecasts
+        GROUP BY area_code, forecast_date
+        """)
+
+
+def bench_read(history, calls):
+    """Latency of the date lookup against a history of `history` rows."""
+    dates = ["2025-01-01", "2025-01-02", "2025-01-03"]
+    code = fake_jma.office_codes()[0]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _fresh_db(tmpdir, "history.db")
+        _fill_history(history)
+        scan = _rate(lambda i: _legacy_get_specific_dates_forecast(code, dates), max(calls // 100, 5))
+        latest = _rate(lambda i: database.get_specific_dates_forecast(code, dates), calls)
+        database.close_connection()
+
+    print(f"{'history query':<16} {1000 / scan:>10.3f} ms/call ({history:,} rows)")
+    print(f"{'latest table':<16} {1000 / latest:>10.3f} ms/call ({history:,} rows)")
+    return scan, latest
+
+
+def _weekly_extremes_from_json(documents):
+    """What the app would have to do without typed tables: re-parse every document."""
+    result = []
+    for code, text in documents:
+        weekly = json.loads(text)[1]
+        temps = weekly["timeSeries"][1]["areas"]
+        mins = [float(t) for area in temps for t in area["tempsMin"] if t != ""]
+        maxs = [float(t) for area in temps for t in area["tempsMax"] if t != ""]
+        result.append({"office_code": code, "temp_min": min(mins), "temp_max": max(maxs)})
+    return result
+
+
+def bench_weekly(offices, calls):
+    """Weekly min/max for every office: JSON re-parsing vs one SQL statement."""
+    documents = [(code, json.dumps(fake_jma.make_forecast(code), ensure_ascii=False))
+                 for code in fake_jma.office_codes(offices)]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _fresh_db(tmpdir, "weekly.db")
+        for code, text in documents:
+            database.save_forecast_report(code, code, json.loads(text))
+        parse = _rate(lambda i: _weekly_extremes_from_json(documents), calls)
+        query = _rate(lambda i: database.get_weekly_extremes(), calls)
+        database.close_connection()
+
+    print(f"{'json re-parse':<16} {1000 / parse:>10.3f} ms/call ({offices} offices)")
+    print(f"{'sql':<16} {1000 / query:>10.3f} ms/call ({offices} offices)")
+    return parse, query
+
+
+def bench_instrumentation(calls):
+    """Per-call cost of @timed when disabled and enabled, against a bare function."""
+    def bare():
+        return None
+
+    wrapped = instrumentation.timed(bare, name="bench.noop")
+    was_enabled = instrumentation.ENABLED
+    results = []
+    for label, func, enabled in (("bare", bare, False),
+                                 ("timed (off)", wrapped, False),
+                                 ("timed (on)", wrapped, True)):
+        instrumentation.enable(enabled)
+        results.append((label, 1e9 / _rate(lambda i: func(), calls)))
+    instrumentation.enable(was_enabled)
+
+    for label, ns in results:
+        print(f"{label:<16} {ns:>10.0f} ns/call")
+    return results
+
+
+def _publications(days):
+    """Yields (fetch_time, report_time) for hourly fetches against a 05/11/17 JST schedule."""
+    start = datetime.datetime(2025, 1, 1, tzinfo=fake_jma.JST)
+    report = start - datetime.timedelta(hours=7)   # 前日 17時の発表
+    for hour in range(days * 24):
+        fetch_time = start + datetime.timedelta(hours=hour)
+        if fetch_time.hour in (5, 11, 17):
+            report = fetch_time
+        yield fetch_time, report
+
+
+def _legacy_append(conn, area_code, weather_data, fetched_at):
+    """The old ingest: every fetch appends every row, changed or not."""
+    conn.executemany("""
+    INSERT INTO weather_forecasts (area_code, forecast_date, weather, fetched_at, valid_to)
+    VALUES (?, ?, ?, ?, ?4)
+    """, [(area_code, date_str, weather, fetched_at)
+          for _, date_str, weather in database.forecast_rows(weather_data)])
+    conn.commit()
+
+
+def bench_history(offices, days):
+    """Database size after `days` of hourly fetches: append-all vs change-only."""
+    codes = fake_jma.office_codes(offices)
+    docs = {}
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for label in ("append-all", "change-only", "compacted"):
+            if label == "compacted":
+                # append-all の DB をそのまま compact コマンドで縮めます
+                database.close_connection()
+                database.DB_NAME = os.path.join(tmpdir, "append-all.db")
+                database.compact_history()
+            else:
+                _fresh_db(tmpdir, f"{label}.db")
+                conn = database.get_connection()
+                for fetch_time, report in _publications(days):
+                    fetched_at = fetch_time.astimezone(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+                    for code in codes:
+                        key = (code, report)
+                        if key not in docs:
+                            docs[key] = fake_jma.make_forecast(code, report, seed=f"{code}{report}")
+                        if label == "append-all":
+                            _legacy_append(conn, code, docs[key], fetched_at)
+                        else:
+                            database.save_forecast_report(code, code, docs[key], fetched_at)
+
+            database.vacuum()
+            rows = database.get_connection().execute("SELECT COUNT(*) FROM weather_forecasts").fetchone()[0]
+            results.append((label, rows, os.path.getsize(database.DB_NAME)))
+        database.close_connection()
+
+    for label, rows, size in results:
+        print(f"{label:<16} {rows:>10,} rows {size / 1024:>10,.0f} KiB ({offices} offices, {days} days hourly)")
+    return results
+
+
+def _area_parse_worker(mode, path):
+    """Runs in a child process so ru_maxrss only reflects one parse mode."""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "full":
+        data = json.loads(text)
+    else:
+        data = weather_service.parse_area_levels(text, ("centers", "offices"))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"seconds": elapsed, "peak": peak, "rss_kb": rss_kb, "kept": len(data["offices"])}))
+
+
+def bench_area_memory():
+    """Peak memory and time to parse area.json: whole document vs centers/offices only."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "area.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(fake_jma.make_area_list(), f, ensure_ascii=False)
+
+        for mode in ("full", "levels"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--area-parse", mode, path],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout
+            results.append((mode, json.loads(out)))
+
+    for mode, r in results:
+        print(f"{mode:<16} {r['seconds'] * 1000:>10.1f} ms "
+              f"{r['peak'] / 1024:>8,.0f} KiB parse peak {r['rss_kb'] / 1024:>6.1f} MiB max RSS")
+    return results
+
+
+def _first_frame(centers):
+    """Builds what load_area_data renders first: the rail destinations."""
+    import flet as ft
+    return [
+        ft.NavigationRailDestination(
+            icon=ft.Icons.LOCATION_CITY,
+            selected_icon=ft.Icons.LOCATION_CITY_OUTLINED,
+            label=center["name"]
+        ) for code, center in centers.items()
+    ]
+
+
+def bench_startup(latency, runs=5):
+    """Time until the rail can be rendered: network area.json vs stored hierarchy."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fake_jma.write_fixtures(tmpdir)
+        server = fake_jma.serve(tmpdir, latency=latency)
+        fake_jma.point_service_at(weather_service, server)
+        weather_service.CACHE_DIR = None
+
+        _fresh_db(tmpdir, "startup.db")
+        database.save_area_hierarchy(weather_service.fetch_area_list())
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            _first_frame(weather_service.fetch_area_list()["centers"])
+        results.append(("network", (time.perf_counter() - start) / runs))
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            centers, offices = database.load_area_hierarchy()
+            _first_frame(centers)
+        results.append(("stored", (time.perf_counter() - start) / runs))
+
+        database.close_connection()
+        server.shutdown()
+
+    for label, elapsed in results:
+        print(f"{label:<16} {elapsed * 1000:>10.1f} ms to first frame ({latency * 1000:.0f} ms latency)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weather app micro-benchmarks")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--offices", type=int, default=58)
+    parser.add_argument("--history", type=int, default=100_000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--area-parse", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.area_parse:
+        _area_parse_worker(*args.area_parse)
+        return
+
+    print("--- connection ---")
+    bench_connection(args.calls)
+    print("--- ingest ---")
+    bench_ingest(args.offices)
+    print("--- read ---")
+    bench_read(args.history, args.calls)
+    print("--- instrumentation ---")
+    bench_instrumentation(args.calls * 50)
+    print("--- weekly ---")
+    bench_weekly(args.offices, args.calls // 10)
+    print("--- history ---")
+    bench_history(10, args.days)
+    print("--- area.json ---")
+    bench_area_memory()
+    print("--- startup ---")
+    bench_startup(args.latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,71 +1,586 @@
 import sqlite3
+import argparse
 import datetime
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import forecast_parser
+from instrumentation import timed
 
 DB_NAME = "weather.db"
 
+# 接続ごとに適用する PRAGMA です。WAL にすると読み込みが書き込みを待たなくなり、
+# synchronous=NORMAL でコミットごとの fsync を減らせます
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",      # 約8MBのページキャッシュ
+    "PRAGMA mmap_size=67108864",    # 64MBまでメモリマップで読み込み
+    "PRAGMA temp_store=MEMORY",
+)
+
+# スレッドごとに開いたままの接続を DB ファイル名ごとに保持します
+_local = threading.local()
+
+
+def get_connection():
+    """Returns the long-lived connection for DB_NAME on the current thread."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    conn = conns.get(DB_NAME)
+    if conn is None:
+        conn = sqlite3.connect(DB_NAME)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conns[DB_NAME] = conn
+    return conn
+
+
+def close_connection():
+    """Closes every connection opened by the current thread."""
+    conns = getattr(_local, "conns", None)
+    if not conns:
+        return
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+
+
+@contextmanager
+def transaction():
+    """Yields the thread's connection and commits on success, rolls back on error."""
+    conn = get_connection()
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+# スキーマの変更履歴です。PRAGMA user_version に適用済みの番号を記録し、
+# 既存の weather.db も init_db() の呼び出しでその場でアップグレードします
+MIGRATIONS = [
+    # 1: 検索用の複合インデックスと、(area_code, forecast_date) ごとに
+    #    最新の1行だけを保持する latest_forecasts テーブル
+    [
+        """
+        CREATE INDEX IF NOT EXISTS idx_forecasts_area_date
+        ON weather_forecasts (area_code, forecast_date, fetched_at)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_forecasts_area_fetched
+        ON weather_forecasts (area_code, fetched_at DESC, forecast_date)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS latest_forecasts (
+            area_code TEXT NOT NULL,
+            forecast_date TEXT NOT NULL,
+            weather TEXT,
+            fetched_at TIMESTAMP,
+            PRIMARY KEY (area_code, forecast_date)
+        ) WITHOUT ROWID
+        """,
+        # 同じ取得時刻の行（サブエリア違い）は最初に書かれたものを残します
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_forecasts_latest
+        AFTER INSERT ON weather_forecasts
+        BEGIN
+            INSERT INTO latest_forecasts (area_code, forecast_date, weather, fetched_at)
+            VALUES (NEW.area_code, NEW.forecast_date, NEW.weather, NEW.fetched_at)
+            ON CONFLICT (area_code, forecast_date) DO UPDATE SET
+                weather = excluded.weather,
+                fetched_at = excluded.fetched_at
+            WHERE excluded.fetched_at > latest_forecasts.fetched_at;
+        END
+        """,
+        # 既存の履歴から latest_forecasts を埋めます
+        """
+        INSERT OR REPLACE INTO latest_forecasts (area_code, forecast_date, weather, fetched_at)
+        SELECT area_code, forecast_date, weather, fetched_at
+        FROM weather_forecasts AS w
+        WHERE w.id = (
+            SELECT id FROM weather_forecasts
+            WHERE area_code = w.area_code AND forecast_date = w.forecast_date
+            ORDER BY fetched_at DESC, id ASC
+            LIMIT 1
+        )
+        """,
+    ],
+    # 2: 起動時にネットワークなしで描画できるよう、centers/offices の階層を
+    #    areas テーブルに保存します（level は 'center' か 'office'）
+    [
+        "ALTER TABLE areas ADD COLUMN parent_code TEXT",
+        "ALTER TABLE areas ADD COLUMN level TEXT",
+        "ALTER TABLE areas ADD COLUMN position INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_areas_level ON areas (level, position)",
+    ],
+    # 3: 変化したときだけ行を追加する履歴に切り替えます。1行は fetched_at（valid_from）
+    #    から valid_to まで同じ天気が続いた区間を表し、サブエリアごとに区別します。
+    #    latest_forecasts はトリガーではなく書き込み側で更新します
+    [
+        "ALTER TABLE weather_forecasts ADD COLUMN sub_area_code TEXT",
+        "ALTER TABLE weather_forecasts ADD COLUMN valid_to TIMESTAMP",
+        "UPDATE weather_forecasts SET valid_to = fetched_at",
+        "DROP TRIGGER IF EXISTS trg_forecasts_latest",
+        "DROP INDEX IF EXISTS idx_forecasts_area_fetched",
+        """
+        CREATE INDEX IF NOT EXISTS idx_forecasts_area_valid
+        ON weather_forecasts (area_code, valid_to DESC, forecast_date)
+        """,
+    ],
+    # 4: JMA の文書全体（天気コード・降水確率・気温・週間予報）を型付きで保存します。
+    #    コードは整数、時刻は epoch 秒です。同じ reportDatetime の報は一度だけ保存します
+    [
+        """
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY,
+            office_code INTEGER NOT NULL,
+            kind INTEGER NOT NULL,          -- 0: 3日予報, 1: 週間予報
+            report_at INTEGER NOT NULL,
+            fetched_at INTEGER NOT NULL,
+            UNIQUE (office_code, kind, report_at)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS forecast_weather (
+            report_id INTEGER NOT NULL REFERENCES reports (id),
+            area_code INTEGER NOT NULL,
+            valid_at INTEGER NOT NULL,
+            weather_code INTEGER,
+            pop INTEGER,
+            reliability TEXT,
+            PRIMARY KEY (report_id, area_code, valid_at)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS forecast_pops (
+            report_id INTEGER NOT NULL REFERENCES reports (id),
+            area_code INTEGER NOT NULL,
+            valid_at INTEGER NOT NULL,
+            pop INTEGER NOT NULL,
+            PRIMARY KEY (report_id, area_code, valid_at)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS forecast_temps (
+            report_id INTEGER NOT NULL REFERENCES reports (id),
+            station_code INTEGER NOT NULL,
+            valid_at INTEGER NOT NULL,
+            kind INTEGER NOT NULL,          -- 0: 最低気温, 1: 最高気温
+            temp REAL NOT NULL,
+            PRIMARY KEY (report_id, station_code, valid_at, kind)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_reports_kind ON reports (kind, office_code, report_at)",
+    ],
+    # 5: sync.py の実行ごとの計測値
+    [
+        """
+        CREATE TABLE IF NOT EXISTS sync_runs (
+            id INTEGER PRIMARY KEY,
+            started_at INTEGER NOT NULL,
+            finished_at INTEGER NOT NULL,
+            offices INTEGER NOT NULL,
+            updated INTEGER NOT NULL,
+            skipped INTEGER NOT NULL,
+            failed INTEGER NOT NULL,
+            rows_written INTEGER NOT NULL,
+            bytes_downloaded INTEGER NOT NULL,
+            latency_avg_ms REAL,
+            latency_max_ms REAL
+        )
+        """,
+    ],
+]
+
+
+_ADD_COLUMN = re.compile(r"\s*ALTER TABLE (\w+) ADD COLUMN (\w+)", re.IGNORECASE)
+
+
+def _column_exists(conn, statement):
+    """True if `statement` is an ALTER TABLE ... ADD COLUMN whose column is already there."""
+    match = _ADD_COLUMN.match(statement)
+    if not match:
+        return False
+    table, column = match.groups()
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def migrate(conn):
+    """
+    Applies every migration newer than the database's user_version. Each migration runs
+    in one BEGIN IMMEDIATE transaction together with its user_version bump.
+    """
+    while True:
+        # 別のプロセスが同時に移行していても、書き込みロックを取ってから番号を読み直します
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.commit()
+                return
+            for statement in MIGRATIONS[version]:
+                # 以前の版で途中まで適用された DB でも、追加済みの列は飛ばして再実行できます
+                if not _column_exists(conn, statement):
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+@timed
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # エリア情報を保存するテーブルを作成します
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS areas (
-        area_code TEXT PRIMARY KEY,
-        area_name TEXT NOT NULL
-    )
-    """)
-    
-    
-    # 天気予報情報を保存するテーブルを作成します
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS weather_forecasts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        area_code TEXT,
-        forecast_date TEXT,
-        weather TEXT,
-        fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (area_code) REFERENCES areas (area_code)
-    )
-    """)
-    
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        # エリア情報を保存するテーブルを作成します
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS areas (
+            area_code TEXT PRIMARY KEY,
+            area_name TEXT NOT NULL
+        )
+        """)
+
+        # 天気予報情報を保存するテーブルを作成します
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS weather_forecasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            area_code TEXT,
+            forecast_date TEXT,
+            weather TEXT,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (area_code) REFERENCES areas (area_code)
+        )
+        """)
 
+    migrate(get_connection())
+
+@timed
 def save_area(area_code, area_name):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-    INSERT OR REPLACE INTO areas (area_code, area_name)
-    VALUES (?, ?)
-    """, (area_code, area_name))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("""
+        INSERT INTO areas (area_code, area_name)
+        VALUES (?, ?)
+        ON CONFLICT (area_code) DO UPDATE SET area_name = excluded.area_name
+        """, (area_code, area_name))
+
+@timed
+def save_area_hierarchy(area_list):
+    """Stores the centers/offices hierarchy of area.json in the areas table."""
+    centers = area_list.get("centers", {})
+    offices = area_list.get("offices", {})
+
+    rows = []
+    for i, (center_code, center) in enumerate(centers.items()):
+        rows.append((center_code, center["name"], None, "center", i))
+        for j, code in enumerate(center.get("children", [])):
+            if code in offices:
+                rows.append((code, offices[code]["name"], center_code, "office", j))
+
+    with transaction() as conn:
+        # 新しい area.json から消えたエリアは階層から外します（予報の履歴は残します）
+        conn.execute("""
+        UPDATE areas SET parent_code = NULL, level = NULL, position = NULL
+        WHERE level IS NOT NULL
+        """)
+        conn.executemany("""
+        INSERT INTO areas (area_code, area_name, parent_code, level, position)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (area_code) DO UPDATE SET
+            area_name = excluded.area_name,
+            parent_code = excluded.parent_code,
+            level = excluded.level,
+            position = excluded.position
+        """, rows)
 
+@timed
+def load_area_hierarchy():
+    """
+    Loads the stored hierarchy as (centers, offices) dicts shaped like area.json:
+    centers[code] = {"name", "children"}, offices[code] = {"name", "parent"}.
+    """
+    conn = get_connection()
+    rows = conn.execute("""
+    SELECT area_code, area_name, parent_code, level
+    FROM areas
+    WHERE level IS NOT NULL
+    ORDER BY level, position
+    """).fetchall()
+
+    centers = {}
+    offices = {}
+    for code, name, parent_code, level in rows:
+        if level == "center":
+            centers[code] = {"name": name, "children": []}
+        elif parent_code in centers:
+            offices[code] = {"name": name, "parent": parent_code}
+            centers[parent_code]["children"].append(code)
+    return centers, offices
+
+def _now():
+    """Current UTC time in the same format as SQLite's CURRENT_TIMESTAMP."""
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+@timed
+def _write_forecasts(conn, area_code, rows, fetched_at):
+    """
+    Writes the (sub_area_code, forecast_date, weather) rows of one fetch, change-only.
+    Rows whose weather matches the current run only extend its valid_to.
+    Returns the number of rows inserted.
+    """
+    dates = sorted({date_str for _, date_str, _ in rows})
+    placeholders = ','.join('?' for _ in dates)
+
+    # (サブエリア, 日付) ごとに現在の区間（最後の行）を取り出します
+    current = {}
+    for row_id, sub_area_code, date_str, weather in conn.execute(f"""
+    SELECT id, sub_area_code, forecast_date, weather
+    FROM weather_forecasts
+    WHERE area_code = ? AND forecast_date IN ({placeholders})
+    ORDER BY id
+    """, (area_code, *dates)):
+        current[(sub_area_code, date_str)] = (row_id, weather)
+
+    extend = []
+    insert = []
+    latest = {}
+    for sub_area_code, date_str, weather in rows:
+        run = current.get((sub_area_code, date_str))
+        if run and run[1] == weather:
+            if run[0] is not None:
+                extend.append((fetched_at, run[0]))
+        else:
+            insert.append((area_code, sub_area_code, date_str, weather, fetched_at, fetched_at))
+            current[(sub_area_code, date_str)] = (None, weather)
+        # 画面に出すのは各日付の最初のサブエリアの天気です
+        latest.setdefault(date_str, weather)
+
+    conn.executemany("UPDATE weather_forecasts SET valid_to = ? WHERE id = ?", extend)
+    conn.executemany("""
+    INSERT INTO weather_forecasts
+        (area_code, sub_area_code, forecast_date, weather, fetched_at, valid_to)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, insert)
+    conn.executemany("""
+    INSERT INTO latest_forecasts (area_code, forecast_date, weather, fetched_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (area_code, forecast_date) DO UPDATE SET
+        weather = excluded.weather,
+        fetched_at = excluded.fetched_at
+    WHERE excluded.fetched_at >= latest_forecasts.fetched_at
+    """, [(area_code, date_str, weather, fetched_at) for date_str, weather in latest.items()])
+    return len(insert)
+
+@timed
 def save_weather_forecast(area_code, forecast_date, weather):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-    INSERT INTO weather_forecasts (area_code, forecast_date, weather, fetched_at)
-    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-    """, (area_code, forecast_date, weather))
+    with transaction() as conn:
+        _write_forecasts(conn, area_code, [(None, forecast_date, weather)], _now())
+
+@timed
+def forecast_rows(weather_data):
+    """Flattens a JMA forecast document into (sub_area_code, forecast_date, weather) rows."""
+    report = weather_data[0]
+    time_series = report["timeSeries"][0]
+    time_defines = time_series["timeDefines"]
+
+    # timeDefines は全サブエリア共通なので日付への変換は一度だけ行います
+    dates = [
+        datetime.datetime.fromisoformat(dt_str).strftime("%Y-%m-%d")
+        for dt_str in time_defines
+    ]
+
+    rows = []
+    for area_weather in time_series["areas"]:
+        sub_area_code = area_weather["area"].get("code")
+        for date_str, weather in zip(dates, area_weather["weathers"]):
+            rows.append((sub_area_code, date_str, weather))
+    return rows
+
+@timed
+def _write_reports(conn, area_code, weather_data, fetched_at):
+    """Writes the typed tables for each report not already stored. Returns rows written."""
+    fetched_epoch = int(datetime.datetime.fromisoformat(fetched_at)
+                        .replace(tzinfo=datetime.timezone.utc).timestamp())
+    written = 0
+    for report in forecast_parser.parse_forecast(weather_data):
+        cursor = conn.execute("""
+        INSERT INTO reports (office_code, kind, report_at, fetched_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (office_code, kind, report_at) DO NOTHING
+        """, (int(area_code), report["kind"], report["report_at"], fetched_epoch))
+        if cursor.rowcount == 0:
+            continue  # 同じ発表はすでに保存済みです
+
+        report_id = cursor.lastrowid
+        conn.executemany("""
+        INSERT OR REPLACE INTO forecast_weather
+            (report_id, area_code, valid_at, weather_code, pop, reliability)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, [(report_id, *row) for row in report["weather"]])
+        conn.executemany("""
+        INSERT OR REPLACE INTO forecast_pops (report_id, area_code, valid_at, pop)
+        VALUES (?, ?, ?, ?)
+        """, [(report_id, *row) for row in report["pops"]])
+        conn.executemany("""
+        INSERT OR REPLACE INTO forecast_temps (report_id, station_code, valid_at, kind, temp)
+        VALUES (?, ?, ?, ?, ?)
+        """, [(report_id, *row) for row in report["temps"]])
+        written += len(report["weather"]) + len(report["pops"]) + len(report["temps"])
+    return written
+
+@timed
+def save_forecast_report(area_code, area_name, weather_data, fetched_at=None):
+    """
+    Saves the area and a whole JMA document in one transaction: the weather text
+    history (only rows whose weather changed are inserted) and the typed report
+    tables (only for reports not stored yet). Returns the number of rows written.
+    fetched_at defaults to now (UTC, 'YYYY-MM-DD HH:MM:SS').
+    """
+    rows = forecast_rows(weather_data)
+    fetched_at = fetched_at or _now()
+    with transaction() as conn:
+        conn.execute("""
+        INSERT INTO areas (area_code, area_name)
+        VALUES (?, ?)
+        ON CONFLICT (area_code) DO UPDATE SET area_name = excluded.area_name
+        """, (area_code, area_name))
+        written = _write_reports(conn, area_code, weather_data, fetched_at)
+        return written + _write_forecasts(conn, area_code, rows, fetched_at)
+
+@timed
+def compact_history(keep_days=None):
+    """
+    Merges consecutive identical history rows into single runs and, if keep_days
+    is given, drops forecasts for dates older than that (from the typed report
+    tables too). Returns (rows_before, rows_after) of weather_forecasts.
+    """
+    with transaction() as conn:
+        before = conn.execute("SELECT COUNT(*) FROM weather_forecasts").fetchone()[0]
+
+        if keep_days is not None:
+            cutoff = (datetime.date.today() - datetime.timedelta(days=keep_days)).isoformat()
+            conn.execute("DELETE FROM weather_forecasts WHERE forecast_date < ?", (cutoff,))
+            conn.execute("DELETE FROM latest_forecasts WHERE forecast_date < ?", (cutoff,))
+
+            # 型付きの表も同じ日より前の予報を消します（valid_at は epoch 秒なので日本時間の0時で比べます）
+            cutoff_at = forecast_parser.to_epoch(f"{cutoff}T00:00:00+09:00")
+            for table in ("forecast_weather", "forecast_pops", "forecast_temps"):
+                conn.execute(f"DELETE FROM {table} WHERE valid_at < ?", (cutoff_at,))
+            # 行が1つも残らなくなった古い報も消します
+            conn.execute("""
+            DELETE FROM reports
+            WHERE report_at < ?
+              AND NOT EXISTS (SELECT 1 FROM forecast_weather WHERE report_id = reports.id)
+              AND NOT EXISTS (SELECT 1 FROM forecast_pops WHERE report_id = reports.id)
+              AND NOT EXISTS (SELECT 1 FROM forecast_temps WHERE report_id = reports.id)
+            """, (cutoff_at,))
+
+        # 移行前の行には sub_area_code がないので、同じ取得時刻内の順番で区別します
+        rows = conn.execute("""
+        SELECT id, area_code, forecast_date, weather, valid_to,
+               COALESCE(sub_area_code, ROW_NUMBER() OVER (
+                   PARTITION BY area_code, forecast_date, fetched_at ORDER BY id))
+        FROM weather_forecasts
+        ORDER BY area_code, forecast_date, fetched_at, id
+        """)
+
+        delete = []
+        extend = {}
+        group = None
+        runs = {}
+        for row_id, area_code, forecast_date, weather, valid_to, slot in rows:
+            if (area_code, forecast_date) != group:
+                group = (area_code, forecast_date)
+                runs = {}
+            run = runs.get(slot)
+            if run and run[1] == weather:
+                delete.append((row_id,))
+                extend[run[0]] = valid_to
+            else:
+                runs[slot] = (row_id, weather)
+
+        conn.executemany("UPDATE weather_forecasts SET valid_to = ? WHERE id = ?",
+                         [(valid_to, row_id) for row_id, valid_to in extend.items()])
+        conn.executemany("DELETE FROM weather_forecasts WHERE id = ?", delete)
+
+        after = conn.execute("SELECT COUNT(*) FROM weather_forecasts").fetchone()[0]
+    return before, after
+
+@timed
+def vacuum():
+    """Rebuilds the database file so deleted pages are returned to the OS."""
+    conn = get_connection()
     conn.commit()
-    conn.close()
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+@timed
+def get_latest_report_at(office_code):
+    """Returns the newest stored 3-day reportDatetime (epoch seconds) of an office, or None."""
+    conn = get_connection()
+    row = conn.execute("""
+    SELECT MAX(report_at) FROM reports WHERE office_code = ? AND kind = 0
+    """, (int(office_code),)).fetchone()
+    return row[0]
 
+@timed
+def save_sync_run(metrics):
+    """Appends one row of sync.py metrics (a dict keyed by the sync_runs columns)."""
+    columns = ("started_at", "finished_at", "offices", "updated", "skipped", "failed",
+               "rows_written", "bytes_downloaded", "latency_avg_ms", "latency_max_ms")
+    with transaction() as conn:
+        conn.execute(f"""
+        INSERT INTO sync_runs ({", ".join(columns)})
+        VALUES ({", ".join("?" for _ in columns)})
+        """, [metrics[c] for c in columns])
+
+@timed
+def get_weekly_extremes():
+    """
+    Returns the lowest minimum and highest maximum temperature of each office's
+    latest weekly report: [{"office_code", "temp_min", "temp_max"}, ...].
+    """
+    conn = get_connection()
+    rows = conn.execute("""
+    SELECT r.office_code,
+           MIN(CASE WHEN t.kind = 0 THEN t.temp END),
+           MAX(CASE WHEN t.kind = 1 THEN t.temp END)
+    FROM reports AS r
+    JOIN forecast_temps AS t ON t.report_id = r.id
+    WHERE r.kind = 1
+      AND r.report_at = (
+          SELECT MAX(report_at) FROM reports
+          WHERE office_code = r.office_code AND kind = 1
+      )
+    GROUP BY r.office_code
+    ORDER BY r.office_code
+    """).fetchall()
+    return [
+        {"office_code": f"{office_code:06d}", "temp_min": temp_min, "temp_max": temp_max}
+        for office_code, temp_min, temp_max in rows
+    ]
+
+@timed
 def get_latest_forecasts(area_code, limit=3):
     """Gets the latest fetch of forecasts for an area."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
+    conn = get_connection()
+    cursor = conn.execute("""
     SELECT forecast_date, weather 
     FROM weather_forecasts 
     WHERE area_code = ? 
-    ORDER BY fetched_at DESC, forecast_date ASC
+    ORDER BY valid_to DESC, forecast_date ASC
     LIMIT ?
     """, (area_code, limit))
     
     rows = cursor.fetchall()
-    conn.close()
     
     result = []
     for row in rows:
@@ -75,39 +590,56 @@ def get_latest_forecasts(area_code, limit=3):
         })
     return result
 
+@timed
 def get_specific_dates_forecast(area_code, dates):
     """
     Gets the latest forecast for specific dates for an area.
     dates: list of date strings 'YYYY-MM-DD'
+    Each result also carries "fetched_at" (UTC 'YYYY-MM-DD HH:MM:SS') for age checks.
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
+    conn = get_connection()
+
+    # latest_forecasts は主キー検索なので履歴の量に関係なく O(log n) です
     placeholders = ','.join('?' for _ in dates)
     query = f"""
-    SELECT forecast_date, weather
-    FROM weather_forecasts
+    SELECT forecast_date, weather, fetched_at
+    FROM latest_forecasts
     WHERE area_code = ? AND forecast_date IN ({placeholders})
-    ORDER BY fetched_at DESC
     """
-    
-   
-    cursor.execute(query, (area_code, *dates))
-    rows = cursor.fetchall()
-    conn.close()
-    
-    
-    result_map = {}
-    for row in rows:
-        d = row[0]
-        w = row[1]
-        if d not in result_map:
-            result_map[d] = w
-            
+
+    rows = conn.execute(query, (area_code, *dates)).fetchall()
+    result_map = {row[0]: row for row in rows}
+
     # リクエストされた日付の順序で結果を返します。存在しない場合は空にします
     result = []
     for d in dates:
         if d in result_map:
-            result.append({"date": d, "weather": result_map[d]})
+            _, weather, fetched_at = result_map[d]
+            result.append({"date": d, "weather": weather, "fetched_at": fetched_at})
             
     return result
+
+
+def main():
+    global DB_NAME
+    parser = argparse.ArgumentParser(description="Maintenance commands for weather.db")
+    parser.add_argument("--db", default=DB_NAME)
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact = commands.add_parser("compact", help="merge duplicate history rows and VACUUM")
+    compact.add_argument("--keep-days", type=int, default=None,
+                         help="also delete forecasts for dates older than this")
+    args = parser.parse_args()
+
+    DB_NAME = args.db
+    size_before = os.path.getsize(DB_NAME) if os.path.exists(DB_NAME) else 0
+    init_db()
+    if args.command == "compact":
+        before, after = compact_history(args.keep_days)
+        vacuum()
+        size_after = os.path.getsize(DB_NAME)
+        print(f"Rows: {before:,} -> {after:,}")
+        print(f"Size: {size_before:,} -> {size_after:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import datetime
+import functools
+import http.server
+import json
+import os
+import random
+import threading
+import time
+
+# JMA の天気コードと文言の一部です（合成データ用）
+WEATHERS = [
+    ("100", "晴れ"),
+    ("101", "晴れ　時々　くもり"),
+    ("200", "くもり"),
+    ("202", "くもり　一時　雨"),
+    ("300", "雨"),
+    ("400", "雪"),
+]
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+
+def office_codes(count=58):
+    """Returns `count` office codes shaped like JMA's ("010000" ... )."""
+    return [f"{(i + 1) * 10000:06d}" for i in range(count)]
+
+
+def make_area_list(centers=11, offices_per_center=5, class10_per_office=3,
+                   class15_per_class10=3, class20_per_class15=5):
+    """
+    Builds an area.json-shaped dict. The defaults give roughly the real file's
+    proportions: a few dozen offices, thousands of class20s.
+    """
+    data = {"centers": {}, "offices": {}, "class10s": {}, "class15s": {}, "class20s": {}}
+    codes = iter(office_codes(centers * offices_per_center))
+
+    def add(level, code, name, parent, children):
+        data[level][code] = {
+            "name": name,
+            "enName": f"{level} {code}",
+            "kana": "ちいき",
+            "parent": parent,
+            "children": children,
+        }
+
+    for c in range(centers):
+        center_code = f"{(c + 1) * 10000 + 100:06d}"
+        children = []
+        for _ in range(offices_per_center):
+            office_code = next(codes)
+            class10s = [f"{office_code[:4]}{k + 1:02d}" for k in range(class10_per_office)]
+            data["offices"][office_code] = {
+                "name": f"地方{office_code}",
+                "enName": f"Office {office_code}",
+                "officeName": f"{office_code}気象台",
+                "parent": center_code,
+                "children": class10s,
+            }
+            for code in class10s:
+                class15s = [f"{code}{k + 1}" for k in range(class15_per_class10)]
+                add("class10s", code, f"区域{code}", office_code, class15s)
+                for code15 in class15s:
+                    class20s = [f"{code15}{k + 1:02d}00" for k in range(class20_per_class15)]
+                    add("class15s", code15, f"地域{code15}", code, class20s)
+                    for code20 in class20s:
+                        add("class20s", code20, f"市町村{code20}", code15, [])
+            children.append(office_code)
+        data["centers"][center_code] = {
+            "name": f"地方予報区{c + 1}",
+            "enName": f"Center {c + 1}",
+            "officeName": f"管区気象台{c + 1}",
+            "children": children,
+        }
+    return data
+
+
+def make_forecast(area_code, report_datetime=None, sub_areas=3, seed=None):
+    """Builds a forecast/{area_code}.json-shaped list (3-day report + weekly report)."""
+    rnd = random.Random(seed if seed is not None else area_code)
+    if report_datetime is None:
+        report_datetime = datetime.datetime.now(JST).replace(minute=0, second=0, microsecond=0)
+    base = report_datetime.replace(hour=0)
+    report_str = report_datetime.isoformat()
+
+    days = [report_datetime] + [base + datetime.timedelta(days=d) for d in (1, 2)]
+    six_hours = [base + datetime.timedelta(hours=6 * h) for h in range(2, 8)]
+    week = [base + datetime.timedelta(days=d) for d in range(1, 8)]
+    # 朝の最低気温（00時）と日中の最高気温（09時）が2日分並びます
+    temp_times = [base + datetime.timedelta(days=d, hours=h) for d in (0, 1) for h in (0, 9)]
+
+    short_weather = []
+    short_pops = []
+    short_temps = []
+    weekly_weather = []
+    weekly_temps = []
+    temp_avg = []
+    for k in range(sub_areas):
+        sub_code = f"{area_code[:4]}{k + 1:02d}"
+        picks = [rnd.choice(WEATHERS) for _ in days]
+        short_weather.append({
+            "area": {"name": f"区域{sub_code}", "code": sub_code},
+            "weatherCodes": [code for code, _ in picks],
+            "weathers": [text for _, text in picks],
+        })
+        short_pops.append({
+            "area": {"name": f"区域{sub_code}", "code": sub_code},
+            "pops": [str(rnd.randrange(0, 101, 10)) for _ in six_hours],
+        })
+        amedas = f"{44000 + int(area_code[:2]) * 10 + k}"
+        low = rnd.randint(-5, 20)
+        short_temps.append({
+            "area": {"name": f"観測点{amedas}", "code": amedas},
+            "temps": [str(low), str(low + rnd.randint(3, 12))] * 2,
+        })
+        weekly_weather.append({
+            "area": {"name": f"区域{sub_code}", "code": sub_code},
+            "weatherCodes": [rnd.choice(WEATHERS)[0] for _ in week],
+            "pops": [""] + [str(rnd.randrange(0, 101, 10)) for _ in week[1:]],
+            "reliabilities": ["", ""] + [rnd.choice("ABC") for _ in week[2:]],
+        })
+        mins = [rnd.randint(-5, 20) for _ in week]
+        weekly_temps.append({
+            "area": {"name": f"観測点{amedas}", "code": amedas},
+            "tempsMin": [""] + [str(t) for t in mins[1:]],
+            "tempsMax": [""] + [str(t + rnd.randint(3, 12)) for t in mins[1:]],
+        })
+        temp_avg.append({
+            "area": {"name": f"観測点{amedas}", "code": amedas},
+            "min": f"{low:.1f}",
+            "max": f"{low + 8:.1f}",
+        })
+
+    return [
+        {
+            "publishingOffice": f"{area_code}気象台",
+            "reportDatetime": report_str,
+            "timeSeries": [
+                {"timeDefines": [d.isoformat() for d in days], "areas": short_weather},
+                {"timeDefines": [d.isoformat() for d in six_hours], "areas": short_pops},
+                {"timeDefines": [d.isoformat() for d in temp_times], "areas": short_temps},
+            ],
+        },
+        {
+            "publishingOffice": f"{area_code}気象台",
+            "reportDatetime": report_str,
+            "timeSeries": [
+                {"timeDefines": [d.isoformat() for d in week], "areas": weekly_weather},
+                {"timeDefines": [d.isoformat() for d in week], "areas": weekly_temps},
+            ],
+            "tempAverage": {"areas": temp_avg},
+        },
+    ]
+
+
+AREA_PATH = "bosai/common/const/area.json"
+FORECAST_DIR = "bosai/forecast/data/forecast"
+
+
+def write_fixtures(directory, area_list=None, report_datetime=None):
+    """Writes area.json and one forecast/{code}.json per office under `directory`."""
+    if area_list is None:
+        area_list = make_area_list()
+
+    area_path = os.path.join(directory, AREA_PATH)
+    os.makedirs(os.path.dirname(area_path), exist_ok=True)
+    with open(area_path, "w", encoding="utf-8") as f:
+        json.dump(area_list, f, ensure_ascii=False)
+
+    forecast_dir = os.path.join(directory, FORECAST_DIR)
+    os.makedirs(forecast_dir, exist_ok=True)
+    for code in area_list["offices"]:
+        with open(os.path.join(forecast_dir, f"{code}.json"), "w", encoding="utf-8") as f:
+            json.dump(make_forecast(code, report_datetime), f, ensure_ascii=False)
+    return area_list
+
+
+class FakeJMAHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves the fixture directory like www.jma.go.jp, with optional latency and faults."""
+
+    protocol_version = "HTTP/1.1"   # keep-alive を有効にします
+    # ヘッダと本文が別々に送られるので、Nagle の遅延（約40ms）が計測に混ざらないようにします
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        # failures[path] 回だけ 503 を返して再試行の動作を確認できるようにします
+        with server.lock:
+            server.request_count += 1
+            remaining = server.failures.get(self.path, 0)
+            if remaining:
+                server.failures[self.path] = remaining - 1
+        if remaining:
+            self.send_error(503)
+            return
+        super().do_GET()
+
+    def send_head(self):
+        # ファイルの更新時刻とサイズから ETag を作り、If-None-Match に 304 で応えます
+        self.etag = None
+        path = self.translate_path(self.path)
+        if os.path.isfile(path):
+            st = os.stat(path)
+            self.etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            if self.headers.get("If-None-Match") == self.etag:
+                self.send_response(304)
+                self.send_header("ETag", self.etag)
+                self.end_headers()
+                return None
+        return super().send_head()
+
+    def send_header(self, keyword, value):
+        super().send_header(keyword, value)
+        # ファイル本体を返すときは Last-Modified と一緒に ETag も付けます
+        if keyword == "Last-Modified" and getattr(self, "etag", None):
+            super().send_header("ETag", self.etag)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory, port=0, latency=0.0):
+    """Starts a fake JMA server on a background thread and returns it."""
+    handler = functools.partial(FakeJMAHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failures = {}
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def point_service_at(service, server):
+    """Redirects a weather_service module's URLs to the fake server."""
+    root = base_url(server)
+    service.AREA_URL = f"{root}/{AREA_PATH}"
+    service.FORECAST_BASE_URL = f"{root}/{FORECAST_DIR}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the JMA forecast API")
+    parser.add_argument("directory", help="fixture directory (created if missing)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to each response")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.directory, AREA_PATH)):
+        write_fixtures(args.directory)
+    server = serve(args.directory, args.port, args.latency)
+    print(f"Serving fake JMA API at {base_url(server)}/ (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import datetime
+
+from instrumentation import timed
+
+# reports.kind の値です
+SHORT_TERM = 0   # 3日間の予報 (weather_data[0])
+WEEKLY = 1       # 週間予報 (weather_data[1])
+
+# 3日予報の temps は 00:00 が朝の最低気温、09:00 が日中の最高気温です
+TEMP_MIN = 0
+TEMP_MAX = 1
+
+
+def to_epoch(dt_str):
+    """'2025-01-10T11:00:00+09:00' -> Unix seconds."""
+    return int(datetime.datetime.fromisoformat(dt_str).timestamp())
+
+
+def _int_or_none(value):
+    return int(value) if value not in ("", None) else None
+
+
+def _float_or_none(value):
+    return float(value) if value not in ("", None) else None
+
+
+@timed
+def parse_forecast(weather_data):
+    """
+    Parses a whole JMA forecast document (3-day and weekly reports) into typed rows.
+
+    Returns one dict per report:
+        kind        SHORT_TERM or WEEKLY
+        report_at   reportDatetime as epoch seconds
+        weather     (area_code, valid_at, weather_code, pop, reliability)
+        pops        (area_code, valid_at, pop)
+        temps       (station_code, valid_at, TEMP_MIN/TEMP_MAX, temp)
+    Area, station and weather codes are ints; empty values become None or are skipped.
+    """
+    reports = []
+    for kind, report in enumerate(weather_data[:2]):
+        parsed = {
+            "kind": kind,
+            "report_at": to_epoch(report["reportDatetime"]),
+            "weather": [],
+            "pops": [],
+            "temps": [],
+        }
+
+        # timeSeries の並びは報によって違うので、areas に含まれるキーで種類を判定します
+        for time_series in report["timeSeries"]:
+            times = [to_epoch(dt_str) for dt_str in time_series["timeDefines"]]
+            for area in time_series["areas"]:
+                code = int(area["area"]["code"])
+
+                if "weatherCodes" in area:
+                    pops = area.get("pops") or [None] * len(times)
+                    reliabilities = area.get("reliabilities") or [None] * len(times)
+                    for valid_at, weather_code, pop, reliability in zip(
+                            times, area["weatherCodes"], pops, reliabilities):
+                        parsed["weather"].append(
+                            (code, valid_at, _int_or_none(weather_code), _int_or_none(pop), reliability or None))
+
+                elif "pops" in area:
+                    for valid_at, pop in zip(times, area["pops"]):
+                        if pop != "":
+                            parsed["pops"].append((code, valid_at, int(pop)))
+
+                elif "temps" in area:
+                    for dt_str, valid_at, temp in zip(time_series["timeDefines"], times, area["temps"]):
+                        if temp != "":
+                            temp_kind = TEMP_MIN if dt_str[11:13] == "00" else TEMP_MAX
+                            parsed["temps"].append((code, valid_at, temp_kind, float(temp)))
+
+                elif "tempsMin" in area or "tempsMax" in area:
+                    for temp_kind, key in ((TEMP_MIN, "tempsMin"), (TEMP_MAX, "tempsMax")):
+                        for valid_at, temp in zip(times, area.get(key, [])):
+                            value = _float_or_none(temp)
+                            if value is not None:
+                                parsed["temps"].append((code, valid_at, temp_kind, value))
+
+        reports.append(parsed)
+    return reports
@@ -0,0 +1,133 @@
+import functools
+import json
+import os
+import threading
+import time
+
+# WEATHER_TIMING=1 で起動時から計測します。無効のときは各呼び出しでフラグを1回見るだけです
+ENABLED = os.environ.get("WEATHER_TIMING") == "1"
+
+# ヒストグラムの上限値（ミリ秒）。最後のバケットはそれ以上すべてです
+BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+_lock = threading.Lock()
+_stats = {}
+
+
+class _Stat:
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, p):
+        """Upper bound (ms) of the bucket that contains the p-th percentile."""
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+        return 0.0
+
+
+def enable(flag=True):
+    global ENABLED
+    ENABLED = flag
+
+
+def record(name, seconds):
+    ms = seconds * 1000
+    with _lock:
+        stat = _stats.get(name)
+        if stat is None:
+            stat = _stats[name] = _Stat()
+        stat.add(ms)
+
+
+class span:
+    """Context manager that records how long its block took under `name`."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timed(func=None, *, name=None):
+    """Decorator that records each call of `func` (as module.function by default)."""
+    if func is None:
+        return lambda f: timed(f, name=name)
+
+    label = name or f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(label, time.perf_counter() - start)
+    return wrapper
+
+
+def snapshot():
+    """Returns {name: {count, total_ms, avg_ms, max_ms, p50_ms, p90_ms, p99_ms, histogram}}."""
+    with _lock:
+        result = {}
+        for name, stat in sorted(_stats.items()):
+            result[name] = {
+                "count": stat.count,
+                "total_ms": round(stat.total, 3),
+                "avg_ms": round(stat.total / stat.count, 3) if stat.count else 0.0,
+                "max_ms": round(stat.max, 3),
+                "p50_ms": stat.percentile(50),
+                "p90_ms": stat.percentile(90),
+                "p99_ms": stat.percentile(99),
+                "histogram": {
+                    (f"<={bound}ms" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}ms"): n
+                    for i, (bound, n) in enumerate(zip(BUCKETS_MS + (None,), stat.buckets))
+                },
+            }
+        return result
+
+
+def export_json(path=None):
+    """Returns the snapshot as JSON, also writing it to `path` if given."""
+    text = json.dumps(snapshot(), ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
+
+
+def reset():
+    with _lock:
+        _stats.clear()
@@ -1,13 +1,76 @@
 import flet as ft
-from weather_service import fetch_area_list, fetch_weather
+from weather_service import fetch_area_list, fetch_weather, fetch_many
 import datetime
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import instrumentation
+from instrumentation import span, timed
+
+# 組み立て済みのタイル（取得済みの予報を含む）を何地方分まで保持するか
+TILE_CACHE_SIZE = 5
+
+# 保存済みの予報がこれより新しければ先に表示し、裏で取得し直します
+MAX_FORECAST_AGE = datetime.timedelta(hours=3)
+
+def target_dates():
+    today = datetime.date.today()
+    yesterday = today - datetime.timedelta(days=1)
+    tomorrow = today + datetime.timedelta(days=1)
+    
+    return [
+        yesterday.strftime("%Y-%m-%d"),
+        today.strftime("%Y-%m-%d"),
+        tomorrow.strftime("%Y-%m-%d")
+    ]
+
+
+@timed(name="ui.build_forecast_controls")
+def build_forecast_controls(target_dates, forecast_map, note=None):
+    forecast_controls = []
+    day_forecasts = []
+    
+    for date_str in target_dates:
+        try:
+            forecast_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+            date_label = forecast_date.strftime("%m-%d")
+        except ValueError:
+            date_label = date_str
+
+        weather_text = forecast_map.get(date_str, "---") # Default to "---" if missing
+
+        day_forecasts.append(
+            ft.Container(
+                content=ft.Column([
+                    ft.Text(f"{date_label}", size=12, color="grey"),
+                    ft.Text(f"{weather_text}")
+                ], spacing=5),
+                padding=10,
+                border=ft.border.all(1, ft.Colors.OUTLINE),
+                border_radius=5,
+                width=150
+            )
+        )
+    
+    forecast_controls.append(
+        ft.Container(
+            content=ft.Column([
+                ft.Text(f"Forecast", weight="bold"),
+                *([ft.Text(note, size=12, color=ft.Colors.ORANGE)] if note else []),
+                ft.Row(day_forecasts, wrap=True)
+            ]),
+            margin=ft.margin.only(bottom=10)
+        )
+    )
+    return forecast_controls
+
 
 def main(page: ft.Page):
     page.title = "Weather App"
     page.theme_mode = ft.ThemeMode.LIGHT
     
     # Store area data
-    area_data = {}
     centers = {}
     offices = {}
     
@@ -23,162 +86,312 @@ def main(page: ft.Page):
     )
     
     weather_list = ft.ListView(expand=True, spacing=10, padding=20)
+
+    # center_code -> その地方の ExpansionTile のリスト（LRU）
+    tile_cache = OrderedDict()
+    tile_cache_lock = threading.Lock()
     
-    
-    from database import init_db, save_area, save_weather_forecast, get_specific_dates_forecast
+    from database import (init_db, save_forecast_report, get_specific_dates_forecast,
+                          save_area_hierarchy, load_area_hierarchy)
     init_db()
 
-    def get_weather_detail(e, area_code, area_name):
-        """Fetches and displays weather detail using DB strategy."""
+    def get_weather_detail(e):
+        """Starts loading the forecast when a tile opens; cancels it when it closes."""
         tile = e.control
         if tile.data.get("fetched"):
             return
 
-        if e.data == "true":
-            # ローディングを表示
-            tile.controls = [ft.ProgressBar()]
+        if e.data != "true":
+            # 読み込み中に折りたたまれたら取得を取り消します
+            cancel_detail(tile)
+            tile.controls = [ft.Container(height=50)]
+            with span("ui.tile_update"):
+                tile.update()
+            return
+
+        # ローディングを表示し、取得・保存・読み込みはバックグラウンドで行います
+        tile.controls = [ft.ProgressBar()]
+        with span("ui.tile_update"):
             tile.update()
-            
-            # １　APIから取得
-            weather_data = fetch_weather(area_code)
-            
-            error_msg = None
-            if not weather_data:
-                error_msg = "Failed to load weather data from API."
+        if tile.data.get("cancel"):
+            return  # 先読みなどですでに読み込み中
+
+        cancel = threading.Event()
+        tile.data["cancel"] = cancel
+        page.run_thread(load_weather_detail, tile, cancel)
+
+    def cancel_detail(tile):
+        cancel = tile.data.get("cancel")
+        if cancel:
+            cancel.set()
+            tile.data["cancel"] = None
+
+    @timed(name="ui.load_weather_detail")
+    def load_weather_detail(tile, cancel):
+        """Fetches a forecast off the UI thread and shows it in the tile."""
+        # 保存済みの予報が新しければすぐに表示し、取得は再検証として続けます
+        show_stored_if_fresh(tile, cancel)
+
+        # １　APIから取得
+        weather_data = fetch_weather(tile.data["code"])
+        if cancel.is_set():
+            return
+        show_forecast(tile, weather_data, cancel)
+
+    def read_stored(area_code, dates):
+        """Returns (forecast_map, age) for stored forecasts; age is None if nothing is stored."""
+        db_forecasts = get_specific_dates_forecast(area_code, dates)
+        forecast_map = {item["date"]: item["weather"] for item in db_forecasts}
+        if not db_forecasts:
+            return forecast_map, None
+
+        # fetched_at は SQLite の CURRENT_TIMESTAMP（UTC）です
+        newest = max(item["fetched_at"] for item in db_forecasts)
+        fetched_at = datetime.datetime.fromisoformat(newest).replace(tzinfo=datetime.timezone.utc)
+        return forecast_map, datetime.datetime.now(datetime.timezone.utc) - fetched_at
+
+    def show_stored_if_fresh(tile, cancel):
+        """Renders the stored forecast if it is younger than MAX_FORECAST_AGE."""
+        dates = target_dates()
+        forecast_map, age = read_stored(tile.data["code"], dates)
+        if age is None or age > MAX_FORECAST_AGE:
+            return False
+        render_tile(tile, dates, forecast_map, cancel)
+        return True
+
+    def show_forecast(tile, weather_data, cancel):
+        """Stores a fetched forecast, reads the target dates back and fills the tile."""
+        try:
+            fill_forecast(tile, weather_data, cancel)
+        finally:
+            # 失敗しても読み込み中の印を外し、次に開いたときに取得し直せるようにします
+            if tile.data.get("cancel") is cancel:
+                tile.data["cancel"] = None
+
+    def fill_forecast(tile, weather_data, cancel):
+        area_code = tile.data["code"]
+        area_name = tile.data["name"]
+
+        error_msg = None
+        if not weather_data:
+            error_msg = "Failed to load weather data from API."
+        else:
+            # 2. DBに保存（エリアと全行を1トランザクションでまとめて書き込みます）
+            try:
+                save_forecast_report(area_code, area_name, weather_data)
+
+            except (IndexError, KeyError, ValueError, TypeError, sqlite3.Error) as err:
+                # 予報の形が想定と違う（天気コードや日時が読めない）場合や書き込みの失敗
+                error_msg = f"Error parsing/saving data: {err}"
+
+        # 3. 特定の日付の予報を取得
+        dates = target_dates()
+        forecast_map, age = read_stored(area_code, dates)
+
+        # 取得に失敗したときは保存済みの予報を、古さの表示つきで出します
+        note = None
+        if error_msg:
+            if age is not None:
+                hours = int(age.total_seconds() // 3600)
+                note = f"Offline: showing forecast saved {hours}h ago"
             else:
+                note = error_msg
 
+        # 4. UI更新（失敗した場合は、次に開いたときにもう一度取得します）
+        render_tile(tile, dates, forecast_map, cancel, note, fetched=error_msg is None)
 
-                # 2. DBに保存
-                try:
-                    report = weather_data[0]
-                    time_series = report["timeSeries"][0]
-                    time_defines = time_series["timeDefines"]
-                    
-                    
-                    save_area(area_code, area_name)
-                    
-                    for i, area_weather in enumerate(time_series["areas"]):
-                         sub_area_name = area_weather["area"]["name"]
-                         weathers = area_weather["weathers"]
-                         
-                         for j, weather in enumerate(weathers):
-                            if j < len(time_defines):
-                                dt_str = time_defines[j]
-                                dt = datetime.datetime.fromisoformat(dt_str)
-                                date_str = dt.strftime("%Y-%m-%d")
-                                
-                                # Save without temps
-                                save_weather_forecast(area_code, date_str, weather)
-                                
-                except (IndexError, KeyError) as err:
-                    error_msg = f"Error parsing/saving data: {err}"
-
-            # 3. 特定の日付の予報を取得
-            today = datetime.date.today()
-            yesterday = today - datetime.timedelta(days=1)
-            tomorrow = today + datetime.timedelta(days=1)
-            
-            target_dates = [
-                yesterday.strftime("%Y-%m-%d"),
-                today.strftime("%Y-%m-%d"),
-                tomorrow.strftime("%Y-%m-%d")
-            ]
-            
-            db_forecasts = get_specific_dates_forecast(area_code, target_dates)
-            
-            forecast_map = {item["date"]: item["weather"] for item in db_forecasts}
-            
-            # 4. UI更新
-            forecast_controls = []
-            day_forecasts = []
-            
-            for date_str in target_dates:
-                try:
-                    forecast_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-                    date_label = forecast_date.strftime("%m-%d")
-                except ValueError:
-                    date_label = date_str
-
-                weather_text = forecast_map.get(date_str, "---") # Default to "---" if missing
-
-                day_forecasts.append(
-                    ft.Container(
-                        content=ft.Column([
-                            ft.Text(f"{date_label}", size=12, color="grey"),
-                            ft.Text(f"{weather_text}")
-                        ], spacing=5),
-                        padding=10,
-                        border=ft.border.all(1, ft.Colors.OUTLINE),
-                        border_radius=5,
-                        width=150
-                    )
-                )
-            
-            forecast_controls.append(
-                ft.Container(
-                    content=ft.Column([
-                        ft.Text(f"Forecast", weight="bold"),
-                        ft.Row(day_forecasts, wrap=True)
-                    ]),
-                    margin=ft.margin.only(bottom=10)
-                )
-            )
-            tile.controls = forecast_controls
-            tile.data["fetched"] = True
-                    
-            tile.update()
+    def render_tile(tile, dates, forecast_map, cancel, note=None, fetched=True):
+        # 取り消されたタイルには描画しません
+        if cancel.is_set():
+            return
+        tile.controls = build_forecast_controls(dates, forecast_map, note)
+        tile.data["fetched"] = fetched
+        tile.data["cancel"] = None
+        # 別の地方に切り替えて画面から外れたタイルは、次に表示したときに反映されます
+        if tile.page:
+            with span("ui.tile_update"):
+                tile.update()
 
-    def update_weather_list(index):
-        weather_list.controls.clear()
-        
-        # 中心コードを取得
-        center_code = list(centers.keys())[index]
-        children_codes = centers[center_code]["children"]
-        
-        for code in children_codes:
+    def build_center_tiles(center_code):
+        tiles = []
+        for code in centers[center_code]["children"]:
             if code in offices:
                 office_data = offices[code]
                 name = office_data["name"]
                 
-                # DBに保存
-                save_area(code, name)
-                
                 # オンデマンドで詳細を取得
                 tile = ft.ExpansionTile(
                     title=ft.Text(name),
                     subtitle=ft.Text("Click to view forecast"),
-                    on_change=lambda e, c=code, n=name: get_weather_detail(e, c, n),
-                    data={"fetched": False}, # Track if we fetched already
+                    on_change=get_weather_detail,
+                    data={"fetched": False, "code": code, "name": name}, # Track if we fetched already
                     controls=[ft.Container(height=50)] # Placeholder
                 )
-                weather_list.controls.append(tile)
-        
-        weather_list.update()
+                tiles.append(tile)
+        return tiles
 
-    def load_area_data():
-        nonlocal area_data, centers, offices
-        data = fetch_area_list()
-        if data:
-            area_data = data
-            centers = data.get("centers", {})
-            offices = data.get("offices", {})
-            
-            # ナビゲーションレールの宛先を設定
-            rail.destinations = [
-                ft.NavigationRailDestination(
-                    icon=ft.Icons.LOCATION_CITY, 
-                    selected_icon=ft.Icons.LOCATION_CITY_OUTLINED, 
-                    label=center["name"]
-                ) for code, center in centers.items()
-            ]
-            
-            #  最初の天気リストを表示
-            if centers:
-                update_weather_list(0)
-            
+    def center_tiles(center_code):
+        """Returns the cached tiles for a center, building them on a cache miss."""
+        with tile_cache_lock:
+            tiles = tile_cache.get(center_code)
+            if tiles is not None:
+                tile_cache.move_to_end(center_code)
+                return tiles
+
+        tiles = build_center_tiles(center_code)
+        with tile_cache_lock:
+            # 先読みのスレッドが先に組み立てていればそちらを使います
+            tiles = tile_cache.setdefault(center_code, tiles)
+            tile_cache.move_to_end(center_code)
+            while len(tile_cache) > TILE_CACHE_SIZE:
+                _, evicted = tile_cache.popitem(last=False)
+                for tile in evicted:
+                    cancel_detail(tile)
+        return tiles
+
+    def clear_tile_cache():
+        with tile_cache_lock:
+            for tiles in tile_cache.values():
+                for tile in tiles:
+                    cancel_detail(tile)
+            tile_cache.clear()
+
+    def prefetch_center(center_code):
+        """Builds a center's tiles and fills them with forecasts ahead of a rail click."""
+        pending = []
+        for tile in center_tiles(center_code):
+            if not tile.data["fetched"] and not tile.data.get("cancel"):
+                cancel = threading.Event()
+                tile.data["cancel"] = cancel
+                pending.append((tile, cancel))
+        if not pending:
+            return
+
+        # 保存済みの予報が新しいタイルはネットワークを使わずに埋めます
+        pending = [(tile, cancel) for tile, cancel in pending
+                   if not show_stored_if_fresh(tile, cancel)]
+        if not pending:
+            return
+
+        results = fetch_many(tile.data["code"] for tile, _ in pending)
+        for tile, cancel in pending:
+            if not cancel.is_set():
+                show_forecast(tile, results.get(tile.data["code"]), cancel)
+
+    def prefetch_neighbours(index):
+        codes = list(centers.keys())
+        for i in (index + 1, index - 1):
+            if 0 <= i < len(codes):
+                prefetch_center(codes[i])
+
+    def update_weather_list(index):
+        # 中心コードを取得
+        center_code = list(centers.keys())[index]
+
+        # 一度表示した地方はキャッシュ済みのタイルをそのまま表示します
+        with span("ui.build_center_tiles"):
+            weather_list.controls = list(center_tiles(center_code))
+        with span("ui.list_update"):
+            weather_list.update()
+
+        # 隣の地方をバックグラウンドで先読みします
+        page.run_thread(prefetch_neighbours, index)
+
+    def render_areas():
+        """Fills the rail from `centers` and shows the selected center's offices."""
+        # ナビゲーションレールの宛先を設定
+        rail.destinations = [
+            ft.NavigationRailDestination(
+                icon=ft.Icons.LOCATION_CITY, 
+                selected_icon=ft.Icons.LOCATION_CITY_OUTLINED, 
+                label=center["name"]
+            ) for code, center in centers.items()
+        ]
+
+        #  選択中（最初は先頭）の天気リストを表示
+        if centers:
+            index = min(rail.selected_index or 0, len(centers) - 1)
+            rail.selected_index = index
+            update_weather_list(index)
+
+        with span("ui.page_update"):
             page.update()
-        else:
-            page.add(ft.Text("Failed to load area list.", color="red"))
+
+    def refresh_area_data():
+        """Downloads area.json in the background and re-renders only if it changed."""
+        nonlocal centers, offices
+        # 画面に使うのは centers と offices だけなので、その2つだけを読み込みます
+        data = fetch_area_list(levels=("centers", "offices"))
+        if not data:
+            if not centers:
+                page.add(ft.Text("Failed to load area list.", color="red"))
+            return
+
+        save_area_hierarchy(data)
+        new_centers, new_offices = load_area_hierarchy()
+        if (new_centers, new_offices) != (centers, offices):
+            centers, offices = new_centers, new_offices
+            clear_tile_cache()
+            render_areas()
+
+    def load_area_data():
+        nonlocal centers, offices
+        # DB に保存した階層からすぐに描画し、ネットワークの更新は裏で行います
+        centers, offices = load_area_hierarchy()
+        if centers:
+            render_areas()
+        page.run_thread(refresh_area_data)
+
+    def show_debug_panel():
+        """Hidden timing panel (Ctrl+Shift+D): per-operation counts and latency percentiles."""
+        stats = instrumentation.snapshot()
+        rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(name, size=12)),
+                ft.DataCell(ft.Text(f"{s['count']}")),
+                ft.DataCell(ft.Text(f"{s['avg_ms']:.1f}")),
+                ft.DataCell(ft.Text(f"{s['p90_ms']:.0f}")),
+                ft.DataCell(ft.Text(f"{s['max_ms']:.1f}")),
+            ]) for name, s in stats.items()
+        ]
+
+        def toggle(e):
+            instrumentation.enable(e.control.value)
+
+        def export(e):
+            path = "timings.json"
+            instrumentation.export_json(path)
+            status.value = f"Exported to {path}"
+            status.update()
+
+        def reset(e):
+            instrumentation.reset()
+            page.close(dialog)
+
+        status = ft.Text("" if stats else "No timings recorded yet.", size=12, color="grey")
+        dialog = ft.AlertDialog(
+            title=ft.Text("Timings (ms)"),
+            content=ft.Column([
+                ft.Switch(label="Record timings", value=instrumentation.ENABLED, on_change=toggle),
+                ft.DataTable(
+                    columns=[ft.DataColumn(ft.Text(label)) for label in ("name", "count", "avg", "p90", "max")],
+                    rows=rows,
+                ),
+                status,
+            ], scroll=ft.ScrollMode.AUTO, tight=True),
+            actions=[
+                ft.TextButton("Export JSON", on_click=export),
+                ft.TextButton("Reset", on_click=reset),
+                ft.TextButton("Close", on_click=lambda e: page.close(dialog)),
+            ],
+        )
+        page.open(dialog)
+
+    def on_keyboard(e: ft.KeyboardEvent):
+        if e.ctrl and e.shift and e.key == "D":
+            show_debug_panel()
+
+    page.on_keyboard_event = on_keyboard
 
     # レイアウトの設定
     page.add(
@@ -195,4 +408,5 @@ def main(page: ft.Page):
 
     load_area_data()
 
-ft.app(target=main)
+if __name__ == "__main__":
+    ft.app(target=main)
@@ -0,0 +1,159 @@
+import argparse
+import datetime
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import database
+import weather_service
+from forecast_parser import to_epoch
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+# 気象庁の定時発表（05時・11時・17時 JST）から少し遅らせて取得します
+PUBLISH_HOURS = (5, 11, 17)
+PUBLISH_DELAY = datetime.timedelta(minutes=10)
+
+MAX_WORKERS = 4         # 同時に取得するオフィス数
+RATE = 4.0              # 1秒あたりのリクエスト開始数の上限
+JITTER = 0.5            # リクエスト開始前のランダムな待ち時間の上限（秒）
+
+
+class RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart across threads, plus jitter."""
+
+    def __init__(self, rate=RATE, jitter=JITTER):
+        self.interval = 1.0 / rate
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.next_start = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        time.sleep(start - now + random.uniform(0, self.jitter))
+
+
+def next_run(now=None):
+    """Returns the next publication time (plus PUBLISH_DELAY) after `now`."""
+    now = now or datetime.datetime.now(JST)
+    now = now.astimezone(JST)
+    for day in (0, 1):
+        date = now.date() + datetime.timedelta(days=day)
+        for hour in PUBLISH_HOURS:
+            candidate = datetime.datetime.combine(date, datetime.time(hour), JST) + PUBLISH_DELAY
+            if candidate > now:
+                return candidate
+
+
+def load_offices():
+    """Returns {office_code: name}, refreshing the stored hierarchy if it is empty."""
+    centers, offices = database.load_area_hierarchy()
+    if not offices:
+        data = weather_service.fetch_area_list(levels=("centers", "offices"))
+        if data:
+            database.save_area_hierarchy(data)
+            centers, offices = database.load_area_hierarchy()
+    return {code: office["name"] for code, office in offices.items()}
+
+
+def _fetch(limiter, code):
+    limiter.wait()
+    start = time.perf_counter()
+    data = weather_service.fetch_weather(code)
+    return data, time.perf_counter() - start
+
+
+def sync_once(max_workers=MAX_WORKERS, limiter=None):
+    """Fetches every office once, stores changed reports and logs the run's metrics."""
+    limiter = limiter or RateLimiter()
+    offices = load_offices()
+    started_at = int(time.time())
+    bytes_before = weather_service.get_transfer_stats()["bytes"]
+
+    latencies = []
+    updated = skipped = failed = rows_written = 0
+
+    # 取得はワーカーで並列に行い、書き込みはこのスレッドだけで行います
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_fetch, limiter, code): code for code in offices}
+        for future in as_completed(futures):
+            code = futures[future]
+            data, latency = future.result()
+            latencies.append(latency)
+            if not data:
+                failed += 1
+                continue
+
+            # reportDatetime が前回と同じなら書き込みを省略します
+            try:
+                report_at = to_epoch(data[0]["reportDatetime"])
+            except (IndexError, KeyError, TypeError, ValueError):
+                failed += 1
+                continue
+
+            # 形の崩れた予報やロックされた DB は、このオフィスだけの失敗として数えます
+            try:
+                if database.get_latest_report_at(code) == report_at:
+                    skipped += 1
+                    continue
+                rows_written += database.save_forecast_report(code, offices[code], data)
+                updated += 1
+            except (IndexError, KeyError, ValueError, TypeError, sqlite3.Error) as err:
+                print(f"Error saving forecast for {code}: {err}")
+                failed += 1
+
+    metrics = {
+        "started_at": started_at,
+        "finished_at": int(time.time()),
+        "offices": len(offices),
+        "updated": updated,
+        "skipped": skipped,
+        "failed": failed,
+        "rows_written": rows_written,
+        "bytes_downloaded": weather_service.get_transfer_stats()["bytes"] - bytes_before,
+        "latency_avg_ms": sum(latencies) / len(latencies) * 1000 if latencies else None,
+        "latency_max_ms": max(latencies) * 1000 if latencies else None,
+    }
+    database.save_sync_run(metrics)
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keeps weather.db up to date for every office")
+    parser.add_argument("--db", default=database.DB_NAME)
+    parser.add_argument("--once", action="store_true", help="run one sync and exit")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--rate", type=float, default=RATE, help="max request starts per second")
+    args = parser.parse_args()
+
+    database.DB_NAME = args.db
+    database.init_db()
+    limiter = RateLimiter(args.rate)
+
+    while True:
+        try:
+            metrics = sync_once(args.workers, limiter)
+        except Exception as err:
+            # 1回の失敗で常駐プロセスを止めず、次の発表時刻にもう一度試します
+            print(f"[{datetime.datetime.now(JST):%Y-%m-%d %H:%M}] Sync failed: {err!r}")
+            if args.once:
+                raise
+        else:
+            print(f"[{datetime.datetime.now(JST):%Y-%m-%d %H:%M}] "
+                  f"updated {metrics['updated']}, skipped {metrics['skipped']}, failed {metrics['failed']}, "
+                  f"{metrics['rows_written']} rows, {metrics['bytes_downloaded']:,} bytes")
+        if args.once:
+            break
+
+        run_at = next_run()
+        print(f"Next sync at {run_at:%Y-%m-%d %H:%M} JST")
+        time.sleep(max(0, (run_at - datetime.datetime.now(JST)).total_seconds()))
+
+
+if __name__ == "__main__":
+    main()
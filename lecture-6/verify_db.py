@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import tempfile
 
 DB_NAME = "weather.db"
 
@@ -68,8 +69,49 @@ def check_db():
         print(f"FAIL: Missing expected dates. Found: {dates_found}")
         return False
 
+def check_migrations():
+    import database
+
+    print("Checking interrupted migrations...")
+    saved = database.DB_NAME
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # 以前の移行処理が2番の途中（列を1つ追加したところ）で止まった DB
+            database.DB_NAME = os.path.join(tmpdir, "partial.db")
+            conn = sqlite3.connect(database.DB_NAME)
+            conn.execute("CREATE TABLE areas (area_code TEXT PRIMARY KEY, area_name TEXT NOT NULL)")
+            conn.execute("""CREATE TABLE weather_forecasts (id INTEGER PRIMARY KEY AUTOINCREMENT, area_code TEXT,
+                            forecast_date TEXT, weather TEXT, fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+            conn.execute("PRAGMA user_version = 1")
+            conn.execute("ALTER TABLE areas ADD COLUMN parent_code TEXT")
+            conn.close()
+            database.init_db()
+            version = database.get_connection().execute("PRAGMA user_version").fetchone()[0]
+            if version != len(database.MIGRATIONS):
+                print(f"FAIL: Partial database stopped at version {version}")
+                return False
+
+            # 途中で失敗した移行は、列の追加も含めてすべて取り消されるはずです
+            database.MIGRATIONS.append(["ALTER TABLE areas ADD COLUMN extra TEXT", "SELECT * FROM missing_table"])
+            try:
+                database.migrate(database.get_connection())
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                database.MIGRATIONS.pop()
+            conn = database.get_connection()
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(areas)")]
+            if "extra" in columns or conn.execute("PRAGMA user_version").fetchone()[0] != version:
+                print(f"FAIL: Failed migration left columns {columns}")
+                return False
+            database.close_connection()
+    finally:
+        database.DB_NAME = saved
+    print("SUCCESS: Partial upgrade resumed and a failed step was rolled back.")
+    return True
+
 if __name__ == "__main__":
-    if check_db():
+    if check_db() and check_migrations():
         print("DB VERIFICATION PASSED")
     else:
         print("DB VERIFICATION FAILED")
@@ -0,0 +1,120 @@
+import json
+import shutil
+import tempfile
+import time
+
+import fake_jma
+import weather_service
+
+
+def test_fetch_many(server):
+    print("Testing fetch_many against the fake JMA server...")
+    area_list = weather_service.fetch_area_list()
+    if not area_list or "offices" not in area_list:
+        print("FAIL: No area list returned")
+        return False
+
+    codes = list(area_list["offices"])
+    start = time.perf_counter()
+    results = weather_service.fetch_many(codes)
+    elapsed = time.perf_counter() - start
+
+    missing = [code for code, data in results.items() if not data]
+    if len(results) != len(codes) or missing:
+        print(f"FAIL: Missing forecasts for {missing}")
+        return False
+
+    print(f"SUCCESS: Fetched {len(codes)} offices in {elapsed:.2f}s "
+          f"({server.latency * len(codes):.2f}s if fetched serially).")
+    return True
+
+
+def test_retry(server):
+    print("Testing retry with backoff...")
+    code = next(iter(weather_service.fetch_area_list()["offices"]))
+    server.failures[f"/{fake_jma.FORECAST_DIR}/{code}.json"] = 2
+
+    data = weather_service.fetch_weather(code)
+    if not data:
+        print("FAIL: fetch_weather gave up before the server recovered")
+        return False
+
+    print("SUCCESS: Recovered after 2 failed attempts.")
+    return True
+
+
+def test_cache(server, cache_dir):
+    print("Testing conditional-request cache...")
+    weather_service.CACHE_DIR = cache_dir
+    code = next(iter(weather_service.fetch_area_list()["offices"]))
+    weather_service.fetch_weather(code)
+
+    before = server.request_count
+    weather_service.fetch_weather(code)
+    if server.request_count != before:
+        print("FAIL: Fresh cache entry still hit the network")
+        return False
+
+    # TTL を 0 にすると ETag で再検証され、304 が返るはずです
+    weather_service.FORECAST_CACHE_TTL = 0
+    stats = weather_service.get_cache_stats()
+    data = weather_service.fetch_weather(code)
+    after = weather_service.get_cache_stats()
+    weather_service.FORECAST_CACHE_TTL = 600
+    if not data or after["revalidated"] != stats["revalidated"] + 1:
+        print(f"FAIL: Expected a 304 revalidation, stats: {after}")
+        return False
+
+    # キャッシュのディレクトリが消えても（書き込めなくても）、取得した予報は返るはずです
+    shutil.rmtree(cache_dir)
+    weather_service.FORECAST_CACHE_TTL = 0
+    data = weather_service.fetch_weather(code)
+    weather_service.FORECAST_CACHE_TTL = 600
+    if not data:
+        print("FAIL: A cache write failure lost the fetched forecast")
+        return False
+
+    print(f"SUCCESS: Cache stats {after}")
+    return True
+
+
+def test_area_levels():
+    print("Testing top-level area.json parsing...")
+    data = fake_jma.make_area_list()
+    # 同じ名前のキーが入れ子の中に先に現れても、最上位の値だけを読むはずです
+    data = {"meta": {"offices": {"000000": {"name": "偽"}}, "note": "}\"{"}, **data}
+    parsed = weather_service.parse_area_levels(json.dumps(data, ensure_ascii=False, indent=1))
+    for level in ("centers", "offices"):
+        expected = {code: (entry["name"], entry.get("parent"), tuple(entry.get("children", ())))
+                    for code, entry in data[level].items()}
+        got = {code: (r.name, r.parent, r.children) for code, r in parsed[level].items()}
+        if got != expected:
+            print(f"FAIL: {level} parsed differently from json.loads")
+            return False
+    try:
+        weather_service.parse_area_levels('{"class10s": {"a": 1}, "offices": ')
+    except ValueError:
+        pass
+    else:
+        print("FAIL: Truncated area.json was accepted")
+        return False
+    print(f"SUCCESS: {len(parsed['centers'])} centers, {len(parsed['offices'])} offices")
+    return True
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fake_jma.write_fixtures(tmpdir)
+        server = fake_jma.serve(tmpdir, latency=0.05)
+        fake_jma.point_service_at(weather_service, server)
+        weather_service.BACKOFF = 0.01
+        weather_service.CACHE_DIR = None
+
+        ok = (test_area_levels() and test_fetch_many(server) and test_retry(server)
+              and test_cache(server, f"{tmpdir}/cache"))
+        server.shutdown()
+
+    if ok:
+        print("\nALL TESTS PASSED")
+    else:
+        print("\nTESTS FAILED")
@@ -1,26 +1,353 @@
 import requests
 import json
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from instrumentation import span, timed
 
 AREA_URL = "http://www.jma.go.jp/bosai/common/const/area.json"
 FORECAST_BASE_URL = "https://www.jma.go.jp/bosai/forecast/data/forecast/"
 
-def fetch_area_list():
-    """Fetches the list of areas from the JMA API."""
+TIMEOUT = 10            # 1リクエストあたりのタイムアウト（秒）
+MAX_RETRIES = 3         # 接続エラー・5xx のときの再試行回数
+BACKOFF = 0.5           # 再試行の待ち時間（0.5, 1, 2 ... 秒）
+MAX_WORKERS = 8         # fetch_many の同時接続数
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+CACHE_DIR = ".http_cache"   # None でキャッシュを無効にします
+CACHE_MAX_BYTES = 16 * 1024 * 1024
+AREA_CACHE_TTL = 24 * 60 * 60   # area.json はほとんど変わりません
+FORECAST_CACHE_TTL = 10 * 60    # 予報は 1日数回しか更新されません
+
+_session = None
+_session_lock = threading.Lock()
+
+# ネットワーク転送量の累計です（get_transfer_stats で参照します）
+_transfer = {"requests": 0, "bytes": 0}
+
+
+def get_session():
+    """Returns the shared keep-alive session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # fetch_many の全ワーカーが接続を使い回せるようにプールを広げます
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=MAX_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+class ResponseCache:
+    """
+    On-disk cache of JSON response bodies with their ETag/Last-Modified.
+    Entries are evicted least-recently-used once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            # 参照時刻を更新して LRU の順序に反映させます（その間に追い出されていればミスです）
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, url, entry):
+        """Stores `entry`; a full or read-only disk only means the response is not cached."""
+        path = self._path(url)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._evict()
+        except OSError as e:
+            print(f"Warning: could not write cache entry: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _evict(self):
+        with self.lock:
+            files = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json"):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue    # 別のスレッドやプロセスがすでに消したファイル
+                    files.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            files.sort()
+            while total > self.max_bytes and len(files) > 1:
+                _, size, path = files.pop(0)
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json"):
+                    os.remove(entry.path)
+
+
+_cache = None
+
+
+def get_cache():
+    """Returns the response cache for CACHE_DIR, or None when caching is off."""
+    global _cache
+    if CACHE_DIR is None:
+        return None
+    with _session_lock:
+        if _cache is None or _cache.directory != CACHE_DIR:
+            _cache = ResponseCache(CACHE_DIR)
+    return _cache
+
+
+def get_cache_stats():
+    """Returns a copy of the cache hit/miss counters."""
+    cache = get_cache()
+    return dict(cache.stats) if cache else {}
+
+
+def get_transfer_stats():
+    """Returns a copy of the request count and bytes downloaded so far."""
+    with _session_lock:
+        return dict(_transfer)
+
+
+def _get(url, headers=None):
+    """GETs a URL on the shared session, retrying with exponential backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            with span("weather_service.http"):
+                response = get_session().get(url, headers=headers, timeout=TIMEOUT)
+            with _session_lock:
+                _transfer["requests"] += 1
+                _transfer["bytes"] += len(response.content)
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                response.raise_for_status()
+                return response
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+        time.sleep(BACKOFF * 2 ** attempt)
+
+
+def _report_datetime(data):
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        return data[0].get("reportDatetime")
+    return None
+
+
+def _get_json(url, ttl, parse=json.loads):
+    """
+    GETs a JSON document through the response cache and returns parse(body).
+    Fresh entries are served without touching the network; stale ones are
+    revalidated with If-None-Match/If-Modified-Since.
+    """
+    cache = get_cache()
+    if cache is None:
+        body = _get(url).content.decode("utf-8")
+        with span("weather_service.parse"):
+            return parse(body)
+
+    entry = cache.get(url)
+    if entry and time.time() - entry["stored_at"] < ttl:
+        cache.count("hits")
+        with span("weather_service.parse"):
+            return parse(entry["body"])
+
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = _get(url, headers)
+    if response.status_code == 304 and entry:
+        cache.count("revalidated")
+        entry["stored_at"] = time.time()
+        cache.put(url, entry)
+        with span("weather_service.parse"):
+            return parse(entry["body"])
+
+    cache.count("misses")
+    # JSON は UTF-8 なので文字コードの推測はせずにそのまま復号します
+    body = response.content.decode("utf-8")
+    with span("weather_service.parse"):
+        data = parse(body)
+    cache.put(url, {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "report_datetime": _report_datetime(data),
+        "stored_at": time.time(),
+        "body": body,
+    })
+    return data
+
+
+class AreaRecord:
+    """
+    Compact entry of area.json. Supports record["name"] / record.get("children")
+    so code written against the raw dicts keeps working.
+    """
+
+    __slots__ = ("code", "name", "parent", "children")
+
+    def __init__(self, code, name, parent=None, children=()):
+        self.code = code
+        self.name = name
+        self.parent = parent
+        self.children = children
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __eq__(self, other):
+        if not isinstance(other, AreaRecord):
+            return NotImplemented
+        return (self.code, self.name, self.parent, self.children) == \
+            (other.code, other.name, other.parent, other.children)
+
+    def __repr__(self):
+        return f"AreaRecord({self.code!r}, {self.name!r})"
+
+
+# 読み飛ばす値の中の文字列と括弧だけを拾います（文字列の中の括弧は数えません）
+_JSON_SKIP = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+
+
+def _skip_json_value(text, pos, decoder):
+    """Position just past the JSON value at `pos`, without building objects for it."""
+    if text[pos:pos + 1] not in ("{", "["):
+        return decoder.raw_decode(text, pos)[1]
+    depth = 0
+    for match in _JSON_SKIP.finditer(text, pos):
+        token = match.group()
+        if token[0] in "{[":
+            depth += 1
+        elif token[0] in "}]":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    raise json.JSONDecodeError("Unterminated value", text, pos)
+
+
+def parse_area_levels(text, levels=("centers", "offices")):
+    """
+    Decodes only the requested top-level sections of an area.json body into
+    {level: {code: AreaRecord}}. The other sections (class10s/15s/20s, which
+    hold most of the entries) are never turned into Python objects.
+    """
+    decoder = json.JSONDecoder()
+    skip_ws = json.decoder.WHITESPACE.match
+    result = {level: {} for level in levels}
+    wanted = set(levels)
+
+    # 最上位のオブジェクトをキーごとにたどり、必要な値だけを raw_decode します
+    pos = skip_ws(text, 0).end()
+    if text[pos:pos + 1] != "{":
+        raise json.JSONDecodeError("Expecting an object", text, pos)
+    pos = skip_ws(text, pos + 1).end()
+    while wanted and text[pos:pos + 1] != "}":
+        if text[pos:pos + 1] != '"':
+            raise json.JSONDecodeError("Expecting property name", text, pos)
+        key, pos = decoder.raw_decode(text, pos)
+        pos = skip_ws(text, pos).end()
+        if text[pos:pos + 1] != ":":
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, pos)
+        pos = skip_ws(text, pos + 1).end()
+        if key in wanted:
+            section, pos = decoder.raw_decode(text, pos)
+            result[key] = {
+                code: AreaRecord(code, entry.get("name"), entry.get("parent"),
+                                 tuple(entry.get("children", ())))
+                for code, entry in section.items()
+            }
+            wanted.discard(key)
+        else:
+            pos = _skip_json_value(text, pos, decoder)
+        pos = skip_ws(text, pos).end()
+        if text[pos:pos + 1] == ",":
+            pos = skip_ws(text, pos + 1).end()
+        elif text[pos:pos + 1] != "}":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+    return result
+
+
+@timed
+def fetch_area_list(levels=None):
+    """
+    Fetches the list of areas from the JMA API.
+    With levels (e.g. ("centers", "offices")) only those sections are decoded,
+    into AreaRecord objects, instead of the whole document.
+    """
+    parse = json.loads if levels is None else (lambda text: parse_area_levels(text, levels))
     try:
-        response = requests.get(AREA_URL)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+        return _get_json(AREA_URL, AREA_CACHE_TTL, parse)
+    except (requests.RequestException, ValueError) as e:
         print(f"Error fetching area list: {e}")
         return None
 
+@timed
 def fetch_weather(area_code):
     """Fetches the weather forecast for a specific area code."""
     url = f"{FORECAST_BASE_URL}{area_code}.json"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+        return _get_json(url, FORECAST_CACHE_TTL)
+    except (requests.RequestException, ValueError) as e:
         print(f"Error fetching weather for {area_code}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+@timed
+def fetch_many(area_codes, max_workers=MAX_WORKERS):
+    """
+    Fetches forecasts for many area codes concurrently.
+    Returns a dict of area_code -> forecast data (None on failure).
+    """
+    area_codes = list(area_codes)
+    if not area_codes:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(area_codes))) as pool:
+        return dict(zip(area_codes, pool.map(fetch_weather, area_codes)))
@@ -0,0 +1,171 @@
+import argparse
+import math
+import random
+import time
+
+import expression
+from expression import Calculator
+
+
+class _Display:
+    value = "0"
+
+
+class _LegacyCalculator:
+    """The old CalculatorApp.button_clicked without flet: evaluates left to right as keys arrive."""
+
+    def __init__(self):
+        self.result = _Display()
+        self.reset()
+
+    def button_clicked(self, data):
+        if self.result.value == "Error" or data == "AC":
+            self.result.value = "0"
+            self.reset()
+
+        elif data in ("1", "2", "3", "4", "5", "6", "7", "8", "9", "0", "."):
+            if self.result.value == "0" or self.new_operand == True:
+                self.result.value = data
+                self.new_operand = False
+            else:
+                self.result.value = self.result.value + data
+
+        elif data in ("+", "-", "*", "/"):
+            self.result.value = self.calculate(self.operand1, float(self.result.value), self.operator)
+            self.operator = data
+            if self.result.value == "Error":
+                self.operand1 = "0"
+            else:
+                self.operand1 = float(self.result.value)
+            self.new_operand = True
+
+        elif data in ("="):
+            self.result.value = self.calculate(self.operand1, float(self.result.value), self.operator)
+            self.reset()
+
+        elif data == "sin":
+            self.result.value = self.format_number(math.sin(float(self.result.value)))
+            self.reset()
+
+        elif data == "^2":
+            self.result.value = self.format_number(float(self.result.value) ** 2)
+            self.reset()
+
+    def format_number(self, num):
+        if num % 1 == 0:
+            return int(num)
+        else:
+            return num
+
+    def calculate(self, operand1, operand2, operator):
+        if operator == "+":
+            return self.format_number(operand1 + operand2)
+        elif operator == "-":
+            return self.format_number(operand1 - operand2)
+        elif operator == "*":
+            return self.format_number(operand1 * operand2)
+        elif operator == "/":
+            if operand2 == 0:
+                return "Error"
+            else:
+                return self.format_number(operand1 / operand2)
+
+    def reset(self):
+        self.operator = "+"
+        self.operand1 = 0
+        self.new_operand = True
+
+
+def make_expressions(count, seed=0):
+    """Random 'a op b op c ...' strings the old key handler can also type (digits, + - * /)."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        terms = [str(rng.randint(1, 999)) for _ in range(rng.randint(2, 6))]
+        text = terms[0]
+        for term in terms[1:]:
+            text += rng.choice("+-*/") + term
+        texts.append(text)
+    return texts
+
+
+def make_scientific(count, seed=1):
+    """Expressions with parentheses, powers, π and the trig functions (new engine only)."""
+    rng = random.Random(seed)
+    pieces = ["sin({}π/{})", "cos({}/{})", "tan({}/{}0)", "({}+{})^2", "{}%*{}", "({}-{})/7"]
+    return ["+".join(rng.choice(pieces).format(rng.randint(1, 99), rng.randint(1, 99))
+                     for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+
+def _keys(text):
+    """The button presses that type `text` and then '='."""
+    return list(text) + ["="]
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def bench_keystrokes(texts):
+    """Typing each expression key by key: the old left-to-right handler vs Calculator.press."""
+    presses = [_keys(text) for text in texts]
+    key_count = sum(len(keys) for keys in presses)
+
+    def legacy():
+        calc = _LegacyCalculator()
+        results = []
+        for keys in presses:
+            for key in keys:
+                calc.button_clicked(key)
+            results.append(calc.result.value)
+        return results
+
+    def engine():
+        calc = Calculator()
+        results = []
+        for keys in presses:
+            for key in keys:
+                calc.press(key)
+            results.append(calc.display)
+            calc.press("AC")
+        return results
+
+    expression.compile_expression.cache_clear()
+    old, old_time = _timed(legacy)
+    new, new_time = _timed(engine)
+    # 優先順位のない左から順の計算とは、* や / を含む式の結果が変わります
+    differ = sum(str(a) != b for a, b in zip(old, new))
+    print(f"{'legacy keys':<16} {key_count / old_time:>12,.0f} keys/s {len(texts) / old_time:>10,.0f} expressions/s")
+    print(f"{'engine keys':<16} {(key_count + len(texts)) / new_time:>12,.0f} keys/s "
+          f"{len(texts) / new_time:>10,.0f} expressions/s ({differ:,} results differ by precedence)")
+    return old_time, new_time
+
+
+def bench_batch(texts, label):
+    """evaluate_many on unseen expressions (parse + compile) and again from the cache."""
+    expression.compile_expression.cache_clear()
+    results, cold = _timed(lambda: expression.evaluate_many(texts))
+    warm = min(_timed(lambda: expression.evaluate_many(texts))[1] for _ in range(3))
+    errors = sum(result is None for result in results)
+    print(f"{label:<16} {len(texts) / cold:>12,.0f} expressions/s uncached {len(texts) / warm:>10,.0f} cached "
+          f"({errors:,} errors)")
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculator engine vs the old keystroke handler")
+    parser.add_argument("--count", type=int, default=expression.CACHE_SIZE, help="expressions per run")
+    args = parser.parse_args()
+
+    texts = make_expressions(args.count)
+    print(f"--- {args.count:,} expressions typed key by key ---")
+    bench_keystrokes(texts)
+    print("--- batch ---")
+    bench_batch(texts, "arithmetic")
+    bench_batch(make_scientific(args.count), "scientific")
+
+
+if __name__ == "__main__":
+    main()
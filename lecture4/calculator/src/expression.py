@@ -0,0 +1,294 @@
+import collections
+import functools
+import math
+import re
+
+# 数値（結果の "1e-05" なども読めるように指数表記も許します）、関数名、π、演算子（² は2乗キー）
+NUMBER = r"\d+\.?\d*(?:e[-+]?\d+)?|\.\d+(?:e[-+]?\d+)?"
+TOKEN_RE = re.compile(rf"\s*(?:({NUMBER})|(sin|cos|tan)|(π|pi)|([-+*/^%()²]))")
+FUNCTIONS = {"sin": math.sin, "cos": math.cos, "tan": math.tan}
+HISTORY_SIZE = 50
+CACHE_SIZE = 4096
+
+# eval で使える名前はこれだけです（組み込み関数は使えません）
+_NAMESPACE = {"__builtins__": {}, **FUNCTIONS}
+_BINARY = {"+": "+", "-": "-", "*": "*", "/": "/", "^": "**"}
+
+
+def tokenize(text):
+    """Splits an expression into (kind, value) tokens; kind is num, func, pi or op."""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if not match:
+            raise ValueError(f"unexpected character {text[pos:].lstrip()[:1]!r} at {pos}")
+        number, func, pi, op = match.groups()
+        if number is not None:
+            value = float(number)
+            # 桁が多すぎて inf になる数は書けません（そのままだと式の中で "inf" という名前になります）
+            if not math.isfinite(value):
+                raise ValueError(f"number too large at {pos}")
+            tokens.append(("num", value))
+        elif func is not None:
+            tokens.append(("func", func))
+        elif pi is not None:
+            tokens.append(("pi", math.pi))
+        else:
+            tokens.append(("op", op))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent over the tokens, lowest precedence first:
+
+        expr    := term (('+' | '-') term)*
+        term    := unary (('*' | '/') unary | unary)*      隣り合う値は掛け算（2π, 3(1+2)）
+        unary   := ('-' | '+') unary | power
+        power   := postfix ('^' unary)?                    右結合、-2^2 = -4
+        postfix := atom ('%' | '²')*                       2乗キーと % は直前の値にかかります
+        atom    := num | π | func postfix | '(' expr ')'?  最後の閉じかっこは省略できます
+
+    Nodes are tuples: ("num", value), ("neg", x), ("pct", x), ("sq", x), ("call", name, x), (op, a, b).
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("empty expression")
+        node = self.expr()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    def expr(self):
+        node = self.term()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            node = (self.take()[1], node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while True:
+            kind, value = self.peek()
+            if kind == "op" and value in "*/":
+                self.take()
+                node = (value, node, self.unary())
+            elif kind in ("num", "pi", "func") or (kind, value) == ("op", "("):
+                node = ("*", node, self.unary())
+            else:
+                return node
+
+    def unary(self):
+        if self.peek() == ("op", "-"):
+            self.take()
+            return ("neg", self.unary())
+        if self.peek() == ("op", "+"):
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self):
+        node = self.postfix()
+        if self.peek() == ("op", "^"):
+            self.take()
+            node = ("^", node, self.unary())
+        return node
+
+    def postfix(self):
+        node = self.atom()
+        while self.peek() in (("op", "%"), ("op", "²")):
+            node = ("pct" if self.take()[1] == "%" else "sq", node)
+        return node
+
+    def atom(self):
+        kind, value = self.take()
+        if kind in ("num", "pi"):
+            return ("num", value)
+        if kind == "func":
+            return ("call", value, self.postfix())
+        if (kind, value) == ("op", "("):
+            node = self.expr()
+            if self.peek() == ("op", ")"):
+                self.take()
+            elif self.pos < len(self.tokens):
+                raise ValueError(f"expected ')' before {self.peek()[1]!r}")
+            return node
+        raise ValueError("unexpected end of expression" if kind is None else f"unexpected {value!r}")
+
+
+def parse(text):
+    """Parses `text` into a tuple AST (see _Parser); raises ValueError on bad input."""
+    return _Parser(tokenize(text)).parse()
+
+
+def _to_python(node):
+    kind = node[0]
+    if kind == "num":
+        return repr(node[1])
+    if kind == "neg":
+        return f"(-{_to_python(node[1])})"
+    if kind == "pct":
+        return f"({_to_python(node[1])} / 100.0)"
+    if kind == "sq":
+        return f"({_to_python(node[1])} ** 2)"
+    if kind == "call":
+        return f"{node[1]}({_to_python(node[2])})"
+    return f"({_to_python(node[1])} {_BINARY[kind]} {_to_python(node[2])})"
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_expression(text):
+    """
+    Parses `text` once and compiles it to a Python code object (cached per text), so
+    repeated evaluations skip tokenizing and parsing. Raises ValueError on bad input.
+    """
+    # Python のコンパイラが定数部分（2*π など）をまとめて計算しておきます
+    return compile(_to_python(parse(text)), "<calculator>", "eval")
+
+
+def evaluate(text):
+    """The value of `text`, or None if it does not parse or has no finite real result."""
+    try:
+        value = eval(compile_expression(text), _NAMESPACE)
+    except (ValueError, ArithmeticError):
+        # 構文エラー、0での割り算、桁あふれ、tan などの定義域エラー
+        return None
+    # 負の数の小数乗は複素数になるので、実数でなければエラーにします
+    if isinstance(value, complex) or not math.isfinite(value):
+        return None
+    return value
+
+
+def evaluate_many(texts):
+    """Evaluates each expression in `texts`; returns a list of floats (None for errors)."""
+    return [evaluate(text) for text in texts]
+
+
+def format_number(num):
+    """Integral values without the trailing '.0', like the original display."""
+    if num % 1 == 0:
+        return str(int(num))
+    return str(num)
+
+
+class Calculator:
+    """
+    Headless keystroke model of the calculator: keys build up an expression string,
+    "=" evaluates it with the engine above and records (expression, result) in history.
+    """
+
+    def __init__(self):
+        self.history = collections.deque(maxlen=HISTORY_SIZE)
+        self.reset()
+
+    def reset(self):
+        self.expression = ""
+        self.display = "0"
+        self.evaluated = False      # 直前が "=" なら、数字は新しい式を、演算子は結果の続きを始めます
+
+    def press(self, key):
+        """Handles one button and returns the text to display."""
+        if self.display == "Error" or key == "AC":
+            self.reset()
+            return self.display
+
+        if key == "=":
+            if self.expression:
+                # 閉じていないかっこは履歴のために閉じておきます（式としては閉じなくても計算できます）
+                self.expression += ")" * max(0, self.expression.count("(") - self.expression.count(")"))
+                value = evaluate(self.expression)
+                result = "Error" if value is None else format_number(value)
+                self.history.append((self.expression, result))
+                self.expression = "" if value is None else result
+                self.display = result
+                self.evaluated = True
+            return self.display
+
+        if key == "⌫":
+            self.expression = re.sub(r"(?:sin\(|cos\(|tan\(|.)$", "", self.expression)
+        elif key == "+/-":
+            self.expression = self._negated(self.expression)
+        elif key in ("+", "-", "*", "/"):
+            if self.expression and self.expression[-1] in "+-*/":
+                self.expression = self.expression[:-1]
+            self.expression = (self.expression or ("" if key == "-" else "0")) + key
+        elif key in ("^2", "%", ")"):
+            # 負の結果はかっこで囲みます（-5 の2乗は -5² = -25 ではなく (-5)² = 25）
+            if self.evaluated and self.expression.startswith("-"):
+                self.expression = f"({self.expression})"
+            self.expression = (self.expression or "0") + {"^2": "²"}.get(key, key)
+        elif key in FUNCTIONS:
+            # もとのアプリと同じく、表示中の値（結果か最後の数）に関数をかけます
+            start = 0 if self.evaluated else self._operand_start(self.expression)
+            if start is None:
+                self.expression += key + "("
+            else:
+                operand = self.expression[start:]
+                # かっこで閉じた式はそのまま引数にします（cos((1+2)) ではなく cos(1+2)）
+                if not (operand.startswith("(") and operand.endswith(")") and self._operand_start(operand) == 0):
+                    operand = f"({operand})"
+                self.expression = f"{self.expression[:start]}{key}{operand}"
+        else:
+            # 数字、"."、π、"("
+            if self.evaluated:
+                self.expression = ""
+            self.expression += key
+
+        self.evaluated = False
+        self.display = self.expression or "0"
+        return self.display
+
+    @staticmethod
+    def _operand_start(expression):
+        """Index where the last complete operand of `expression` starts, or None if there is none."""
+        core = expression.rstrip("²%")
+        if core.endswith(")"):
+            depth = 0
+            for i in range(len(core) - 1, -1, -1):
+                depth += {")": 1, "(": -1}.get(core[i], 0)
+                if depth == 0:
+                    # sin(…) のような関数呼び出しは名前ごと1つの値です
+                    name = re.search(r"(?:sin|cos|tan)$", core[:i])
+                    return name.start() if name else i
+            return None
+        match = re.search(rf"(?:{NUMBER}|π)$", core)
+        return match.start() if match else None
+
+    @staticmethod
+    def _negated(expression):
+        """-(expression), or expression itself if it is already wrapped that way."""
+        if not expression:
+            return expression
+        if expression.startswith("-(") and expression.endswith(")"):
+            inner = expression[2:-1]
+            depth = 0
+            for char in inner:
+                depth += {"(": 1, ")": -1}.get(char, 0)
+                if depth < 0:
+                    break
+            else:
+                if depth == 0:
+                    return inner
+        return f"-({expression})"
+
+    def last_entry(self):
+        """'expression = result' for the latest evaluation, or '' before the first one."""
+        if not self.history:
+            return ""
+        expression, result = self.history[-1]
+        return f"{expression} = {result}"
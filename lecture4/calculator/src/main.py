@@ -1,6 +1,7 @@
-import math
 import flet as ft
 
+from expression import Calculator
+
 
 class CalcButton(ft.ElevatedButton):
     def __init__(self, text, button_clicked, expand=1):
@@ -35,8 +36,9 @@ class ExtraActionButton(CalcButton):
 class CalculatorApp(ft.Container):
     def __init__(self):
         super().__init__()
-        self.reset()
+        self.calculator = Calculator()
 
+        self.history = ft.Text(value="", color=ft.Colors.WHITE54, size=14)
         self.result = ft.Text(value="0", color=ft.Colors.WHITE, size=20)
         self.width = 430
         self.bgcolor = ft.Colors.BLACK
@@ -44,7 +46,15 @@ class CalculatorApp(ft.Container):
         self.padding = 20
         self.content = ft.Column(
             controls=[
+                ft.Row(controls=[self.history], alignment="end"),
                 ft.Row(controls=[self.result], alignment="end"),
+                ft.Row(
+                    controls=[
+                        ExtraActionButton(text="(", button_clicked=self.button_clicked),
+                        ExtraActionButton(text=")", button_clicked=self.button_clicked),
+                        ExtraActionButton(text="⌫", button_clicked=self.button_clicked),
+                    ]
+                ),
                 ft.Row(
                     controls=[
                         ExtraActionButton(text="AC", button_clicked=self.button_clicked),
@@ -95,91 +105,11 @@ class CalculatorApp(ft.Container):
     def button_clicked(self, e):
         data = e.control.data
         print(f"Button clicked with data = {data}")
-        if self.result.value == "Error" or data == "AC":
-            self.result.value = "0"
-            self.reset()
-
-        elif data in ("1", "2", "3", "4", "5", "6", "7", "8", "9", "0", "."):
-            if self.result.value == "0" or self.new_operand == True:
-                self.result.value = data
-                self.new_operand = False
-            else:
-                self.result.value = self.result.value + data
-
-        elif data in ("+", "-", "*", "/"):
-            self.result.value = self.calculate(self.operand1, float(self.result.value), self.operator)
-            self.operator = data
-            if self.result.value == "Error":
-                self.operand1 = "0"
-            else:
-                self.operand1 = float(self.result.value)
-            self.new_operand = True
-
-        elif data in ("="):
-            self.result.value = self.calculate(self.operand1, float(self.result.value), self.operator)
-            self.reset()
-
-        elif data in ("%"):
-            self.result.value = float(self.result.value) / 100
-            self.reset()
-
-        elif data in ("+/-"):
-            if float(self.result.value) > 0:
-                self.result.value = "-" + str(self.result.value)
-
-            elif float(self.result.value) < 0:
-                self.result.value = str(self.format_number(abs(float(self.result.value))))
-
-        elif data == "sin":
-            self.result.value = self.format_number(math.sin(float(self.result.value)))
-            self.reset()
-        
-        elif data == "cos":
-            self.result.value = self.format_number(math.cos(float(self.result.value)))
-            self.reset()
-
-        elif data == "tan":
-            self.result.value = self.format_number(math.tan(float(self.result.value)))
-            self.reset()
-
-        elif data == "^2":
-            self.result.value = self.format_number(float(self.result.value) ** 2)
-            self.reset()
-
-        elif data == "π":
-            self.result.value = str(math.pi)
-            self.new_operand = False
-
+        # 押したキーは式に追加され、"=" で優先順位どおりに計算されます（expression.py）
+        self.result.value = self.calculator.press(data)
+        self.history.value = self.calculator.last_entry()
         self.update()
 
-    def format_number(self, num):
-        if num % 1 == 0:
-            return int(num)
-        else:
-            return num
-
-    def calculate(self, operand1, operand2, operator):
-
-        if operator == "+":
-            return self.format_number(operand1 + operand2)
-
-        elif operator == "-":
-            return self.format_number(operand1 - operand2)
-
-        elif operator == "*":
-            return self.format_number(operand1 * operand2)
-
-        elif operator == "/":
-            if operand2 == 0:
-                return "Error"
-            else:
-                return self.format_number(operand1 / operand2)
-
-    def reset(self):
-        self.operator = "+"
-        self.operand1 = 0
-        self.new_operand = True
-
 
 def main(page: ft.Page):
     page.title = "Simple Calculator"
@@ -0,0 +1,101 @@
+import math
+import time
+
+import expression
+from benchmark import make_expressions, make_scientific
+from expression import Calculator, evaluate, evaluate_many
+
+
+def test_engine():
+    print("Testing precedence, parentheses and functions...")
+    cases = {
+        "1+2*3": 7, "(1+2)*3": 9, "10-4-3": 3, "8/4/2": 1, "2^3^2": 512, "-2^2": -4, "(-2)^2": 4,
+        "3^2": 9, "2π": 2 * math.pi, "sin(π/2)+cos(0)": 2, "tan(π/4)": math.tan(math.pi / 4),
+        "50%": 0.5, "2(3+4)": 14, "sin(π/2": 1, "1e-05*2": 2e-05, "-(1+2)": -3, ".5+.5": 1,
+        "3²": 9, "2²%": 0.04, "-3²": -9, "1+2²*2": 9,
+    }
+    for text, expected in cases.items():
+        value = evaluate(text)
+        if value is None or not math.isclose(value, expected):
+            print(f"FAIL: {text} = {value}, expected {expected}")
+            return False
+
+    # 構文エラー、0での割り算、実数にならない結果は None です
+    for text in ["", "1+", "3)", "*2", "1/0", "(-8)^0.5", "10^400", "2x", "1e999", "9" * 400 + "+1"]:
+        if evaluate(text) is not None:
+            print(f"FAIL: {text!r} should be an error, got {evaluate(text)}")
+            return False
+
+    # 四則演算だけの式は Python の計算と一致するはずです
+    texts = make_expressions(2000)
+    mismatches = [t for t, v in zip(texts, evaluate_many(texts)) if not math.isclose(v, eval(t))]
+    if mismatches:
+        print(f"FAIL: {len(mismatches)} expressions differ from Python, e.g. {mismatches[0]}")
+        return False
+    print(f"SUCCESS: {len(cases)} expressions, 10 errors and {len(texts)} random ones")
+    return True
+
+
+def test_cache():
+    print("Testing compiled expression cache...")
+    expression.compile_expression.cache_clear()
+    texts = make_scientific(1000)
+    start = time.perf_counter()
+    evaluate_many(texts)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    evaluate_many(texts)
+    warm = time.perf_counter() - start
+
+    info = expression.compile_expression.cache_info()
+    if info.hits < len(texts) or warm > cold:
+        print(f"FAIL: Second pass did not use the cache ({info}, {cold:.3f}s then {warm:.3f}s)")
+        return False
+    # 初めての式でも1秒に数千件は計算できるはずです
+    if len(texts) / cold < 2000:
+        print(f"FAIL: Only {len(texts) / cold:.0f} expressions/s uncached")
+        return False
+    print(f"SUCCESS: {len(texts) / cold:,.0f} expressions/s uncached, {len(texts) / warm:,.0f} cached")
+    return True
+
+
+def test_keystrokes():
+    print("Testing keystroke model and history...")
+    calc = Calculator()
+    steps = [
+        ("1+2*3=", "7"), ("+1=", "8"),              # 結果の続きから計算
+        ("4=", "4"),                                # 数字は新しい式を始めます
+        ("sin=", "-0.7568024953079282"),            # 関数は結果にかかります
+        ("C(1+2)^2=", "9"), ("C2*-=", "Error"), ("5=", "0"),   # エラーの後のキーはクリアだけ
+        ("C7/0=", "Error"), ("C9+*3=", "27"),       # 演算子の押し直しは置き換え
+        ("C12⌫3=", "13"), ("C3q⌫=", "3"),
+        ("C2q%=", "0.04"),                          # 2乗キーは直前の値にかかり、% はその結果にかかります
+        ("C2sin=", "0.9092974268256817"),           # 関数キーは最後の数にかかります（もとのアプリと同じ）
+        ("C1+2sin=", "1.9092974268256817"),
+        ("C2-7=q=", "25"), ("C2-7=%=", "-0.05"),     # 負の結果に続けた ^2 と % は結果全体にかかります
+        ("C" + "9" * 320 + "=", "Error"), ("C", "0"),   # inf になる長い数字
+        ("Cπ=", "3.141592653589793"), ("C5n=", "-5"),
+    ]
+    for keys, expected in steps:
+        display = None
+        for key in keys.replace("sin", "s").replace("^2", "q"):
+            key = {"s": "sin", "q": "^2", "C": "AC", "n": "+/-"}.get(key, key)
+            display = calc.press(key)
+        if display != expected:
+            print(f"FAIL: {keys} shows {display}, expected {expected}")
+            return False
+
+    if calc.last_entry() != "-(5) = -5" or list(calc.history)[:2] != [("1+2*3", "7"), ("7+1", "8")]:
+        print(f"FAIL: History is {list(calc.history)}")
+        return False
+    print(f"SUCCESS: {len(steps)} key sequences, {len(calc.history)} history entries")
+    return True
+
+
+if __name__ == "__main__":
+    ok = test_engine() and test_cache() and test_keystrokes()
+
+    if ok:
+        print("\nALL TESTS PASSED")
+    else:
+        print("\nTESTS FAILED")